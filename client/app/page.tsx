@@ -19,6 +19,8 @@ type Chat = {
   title: string
   messages: Message[]
   lastUpdated: Date
+  preview?: string | null
+  unreadCount?: number
 }
 
 type ActionItem = {
@@ -36,6 +38,9 @@ type ConversationResponse = {
   title: string
   created_at: string
   updated_at: string
+  last_message_preview?: string | null
+  message_count?: number
+  patient_unread_count?: number
 }
 
 type PrediagnosisResponse = {
@@ -114,7 +119,9 @@ export default function Home() {
         id: conv.id,
         title: conv.title,
         messages: [], // Will be loaded on demand
-        lastUpdated: new Date(conv.updated_at)
+        lastUpdated: new Date(conv.updated_at),
+        preview: conv.last_message_preview,
+        unreadCount: conv.patient_unread_count ?? 0,
       }));
 
       setChats(apiChats);
@@ -139,7 +146,7 @@ export default function Home() {
     setIsLoadingMessages(true);
     try {
       const response = await fetch(
-        `${process.env.NEXT_PUBLIC_SERVER_ENDPOINT}/api/conversations/${conversationId}/messages`,
+        `${process.env.NEXT_PUBLIC_SERVER_ENDPOINT}/api/conversations/${conversationId}/messages?page_size=200`,
         {
           method: 'GET',
           headers: {
@@ -153,7 +160,8 @@ export default function Home() {
         throw new Error('Failed to load messages');
       }
 
-      const messages = await response.json();
+      // Latest page of the conversation, oldest first
+      const { messages } = await response.json();
 
       // Transform messages
       const transformedMessages: Message[] = messages.map((msg: any) => ({
@@ -174,6 +182,15 @@ export default function Home() {
 
       // Mark as loaded
       setLoadedConversations(prev => new Set([...prev, conversationId]));
+
+      // Opening the chat reads it
+      fetch(`${process.env.NEXT_PUBLIC_SERVER_ENDPOINT}/api/conversations/${conversationId}/read`, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${token}` },
+      }).catch(error => console.error('Error marking conversation read:', error));
+      setChats(prevChats =>
+        prevChats.map(chat => (chat.id === conversationId ? { ...chat, unreadCount: 0 } : chat))
+      );
     } catch (error) {
       console.error('Error loading conversation messages:', error);
     } finally {
@@ -272,6 +289,37 @@ export default function Home() {
     }
   }, [activeChat, token, isAuthenticated]);
 
+  // Live updates for the active chat (messages added elsewhere, e.g. by a doctor)
+  useEffect(() => {
+    if (!activeChat || !token || !isAuthenticated) return;
+
+    const socketUrl = `${process.env.NEXT_PUBLIC_SERVER_ENDPOINT}`.replace(/^http/, 'ws') +
+      `/api/conversations/${activeChat}/ws?token=${encodeURIComponent(token)}`;
+    const socket = new WebSocket(socketUrl);
+
+    socket.onmessage = (event) => {
+      const payload = JSON.parse(event.data);
+      // This tab already shows what the user sends and the streamed reply
+      if (payload.type !== 'message' || String(payload.message.sender_id) === String(user?.id)) return;
+
+      const incoming: Message = {
+        id: payload.message.id,
+        content: payload.message.content,
+        role: payload.message.role,
+        timestamp: new Date(payload.message.created_at),
+      };
+      setChats(prevChats =>
+        prevChats.map(chat =>
+          chat.id === payload.conversation_id && !chat.messages.some(msg => msg.id === incoming.id)
+            ? { ...chat, messages: [...chat.messages, incoming], lastUpdated: incoming.timestamp, preview: payload.message.content }
+            : chat
+        )
+      );
+    };
+
+    return () => socket.close();
+  }, [activeChat, token, isAuthenticated]);
+
   // Set right sidebar open on desktop by default
   useEffect(() => {
     const handleResize = () => {
@@ -317,51 +365,31 @@ export default function Home() {
     setChats(prevChats =>
       prevChats.map(chat =>
         chat.id === activeChat
-          ? { ...chat, messages: [...chat.messages, newMessage], lastUpdated: new Date() }
+          ? { ...chat, messages: [...chat.messages, newMessage], lastUpdated: new Date(), preview: userMessageContent }
           : chat
       )
     );
 
-    try {
-      // 1. Save user message to your backend
-      const userMessageResponse = await fetch(
-        `${process.env.NEXT_PUBLIC_SERVER_ENDPOINT}/api/conversations/${activeChat}/messages`,
-        {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-            'Authorization': `Bearer ${token}`,
-          },
-          body: JSON.stringify({
-            role: 'user',
-            content: userMessageContent,
-          }),
-        }
-      );
-
-      if (!userMessageResponse.ok) {
-        throw new Error('Failed to save user message to server');
-      }
-
-      const savedUserMessage = await userMessageResponse.json();
-
-      // Update the user message with the server-generated ID
+    // Replaces a message's temporary id with the stored one
+    const applySavedMessage = (tempId: string, saved: any) => {
       setChats(prevChats =>
         prevChats.map(chat =>
           chat.id === activeChat
             ? {
               ...chat,
               messages: chat.messages.map(msg =>
-                msg.id === newMessage.id
-                  ? { ...msg, id: savedUserMessage.id || msg.id }
+                msg.id === tempId
+                  ? { ...msg, id: saved.id || msg.id, timestamp: new Date(saved.created_at || msg.timestamp) }
                   : msg
               ),
             }
             : chat
         )
       );
+    };
 
-      // 2. Create placeholder for assistant message
+    try {
+      // 1. Create placeholder for assistant message
       const assistantMessageId = (Date.now() + 1).toString();
       const assistantMessage: Message = {
         id: assistantMessageId,
@@ -379,122 +407,72 @@ export default function Home() {
         )
       );
 
-      // 3. Get conversation history for context
-      const currentChatMessages = chats.find(chat => chat.id === activeChat)?.messages || [];
-
-      // Format messages for Anthropic API (include the new user message)
-      const apiMessages = [...currentChatMessages, newMessage].map(msg => ({
-        role: msg.role,
-        content: typeof msg.content === 'string' ? msg.content : '',
-      }));
-
-      // 4. Call Anthropic API for AI response
-      const response = await fetch('/api/chat', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          messages: apiMessages,
-          conversationId: activeChat,
-        }),
-      });
+      // 2. Send the message; the backend stores it, streams the reply and stores that too
+      const response = await fetch(
+        `${process.env.NEXT_PUBLIC_SERVER_ENDPOINT}/api/conversations/${activeChat}/chat`,
+        {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`,
+          },
+          body: JSON.stringify({ content: userMessageContent }),
+        }
+      );
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Failed to get response from AI');
       }
 
-      // 5. Handle streaming response from Anthropic
-      const reader = response.body?.getReader();
+      // 3. Handle the server-sent events: message, delta..., then done or error
+      const reader = response.body.getReader();
       const decoder = new TextDecoder();
+      let buffer = '';
       let fullContent = '';
 
-      if (reader) {
-        while (true) {
-          const { done, value } = await reader.read();
-          if (done) break;
-
-          const chunk = decoder.decode(value);
-          const lines = chunk.split('\n');
-
-          for (const line of lines) {
-            if (line.startsWith('data: ')) {
-              try {
-                const data = JSON.parse(line.slice(6));
-
-                if (data.text) {
-                  fullContent += data.text;
-
-                  // Update the assistant message with accumulated content in real-time
-                  setChats(prevChats =>
-                    prevChats.map(chat =>
-                      chat.id === activeChat
-                        ? {
-                          ...chat,
-                          messages: chat.messages.map(msg =>
-                            msg.id === assistantMessageId
-                              ? { ...msg, content: fullContent }
-                              : msg
-                          ),
-                        }
-                        : chat
-                    )
-                  );
-                }
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
 
-                if (data.error) {
-                  throw new Error(data.error);
-                }
-              } catch (e) {
-                // Ignore parsing errors for incomplete chunks
-              }
-            }
-          }
-        }
-      }
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
 
-      // 6. After streaming completes, save assistant message to your backend
-      if (fullContent) {
-        const assistantMessageResponse = await fetch(
-          `${process.env.NEXT_PUBLIC_SERVER_ENDPOINT}/api/conversations/${activeChat}/messages`,
-          {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-              'Authorization': `Bearer ${token}`,
-            },
-            body: JSON.stringify({
-              role: 'assistant',
-              content: fullContent,
-            }),
+        for (const block of events) {
+          let event = 'message';
+          let data = '';
+          for (const line of block.split('\n')) {
+            if (line.startsWith('event: ')) event = line.slice(7);
+            if (line.startsWith('data: ')) data += line.slice(6);
+          }
+          if (!data) continue;
+          const payload = JSON.parse(data);
+
+          if (event === 'message') {
+            applySavedMessage(newMessage.id, payload);
+          } else if (event === 'delta') {
+            fullContent += payload.text;
+
+            // Update the assistant message with accumulated content in real-time
+            setChats(prevChats =>
+              prevChats.map(chat =>
+                chat.id === activeChat
+                  ? {
+                    ...chat,
+                    messages: chat.messages.map(msg =>
+                      msg.id === assistantMessageId
+                        ? { ...msg, content: fullContent }
+                        : msg
+                    ),
+                  }
+                  : chat
+              )
+            );
+          } else if (event === 'done') {
+            applySavedMessage(assistantMessageId, payload);
+          } else if (event === 'error') {
+            throw new Error(payload.detail);
           }
-        );
-
-        if (!assistantMessageResponse.ok) {
-          console.error('Failed to save assistant message to server');
-          // Don't throw here - the message is already displayed to the user
-        } else {
-          const savedAssistantMessage = await assistantMessageResponse.json();
-
-          // Update the assistant message with the server-generated ID
-          setChats(prevChats =>
-            prevChats.map(chat =>
-              chat.id === activeChat
-                ? {
-                  ...chat,
-                  messages: chat.messages.map(msg =>
-                    msg.id === assistantMessageId
-                      ? {
-                        ...msg,
-                        id: savedAssistantMessage.id || msg.id,
-                        timestamp: new Date(savedAssistantMessage.created_at || msg.timestamp)
-                      }
-                      : msg
-                  ),
-                }
-                : chat
-            )
-          );
         }
       }
 
@@ -718,7 +696,13 @@ export default function Home() {
             >
               <div className="flex items-start justify-between">
                 <div className="flex-1 min-w-0">
-                  <h3 className="font-medium text-sm text-health-dark truncate">{chat.title}</h3>
+                  <div className="flex items-center gap-2">
+                    <h3 className="font-medium text-sm text-health-dark truncate">{chat.title}</h3>
+                    {!!chat.unreadCount && (
+                      <span className="shrink-0 rounded-full bg-health-primary px-2 text-xs text-white">{chat.unreadCount}</span>
+                    )}
+                  </div>
+                  {chat.preview && <p className="text-xs text-health-gray truncate">{chat.preview}</p>}
                 </div>
                 <button
                   onClick={(e) => {
@@ -0,0 +1,135 @@
+"""
+Compare the sync (threadpool) and async (AsyncSession) database routes.
+
+Starts the API under uvicorn once per mode against a fresh SQLite file, then
+drives the same read/write mix at a fixed concurrency and prints throughput and
+latency percentiles.
+
+Run from the server directory:
+    python benchmarks/bench_db_mode.py --requests 2000 --concurrency 200
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+import httpx
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_async: bool, workdir: str, port: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DB_ASYNC="true" if db_async else "false",
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        SECRET_KEY=os.environ.get("SECRET_KEY", "benchmark-secret"),
+        ANTH_API_KEY=os.environ.get("ANTH_API_KEY", "unused"),
+        DB_MAINTENANCE_INTERVAL_SECONDS="0",
+        PYTHONPATH=SERVER_DIR,
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "source.app:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=workdir, env=env,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient):
+    for _ in range(100):
+        try:
+            if (await client.get("/api/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def seed(client: httpx.AsyncClient) -> tuple:
+    user = {"name": "Bench", "email": "bench@example.com", "password": "password123", "role": "patient"}
+    await client.post("/api/auth/register", json=user)
+    token = (await client.post("/api/auth/login", json=user)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    conversation = (await client.post("/api/conversations", json={"title": "bench"}, headers=headers)).json()
+    return headers, conversation["id"]
+
+
+async def drive(base_url: str, total: int, concurrency: int, write_ratio: float) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await wait_ready(client)
+        headers, conversation_id = await seed(client)
+        messages_url = f"/api/conversations/{conversation_id}/messages"
+
+        latencies = []
+        errors = 0
+        counter = iter(range(total))
+        every_nth_write = max(1, round(1 / write_ratio)) if write_ratio > 0 else 0
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                started = time.perf_counter()
+                if every_nth_write and i % every_nth_write == 0:
+                    response = await client.post(messages_url, json={"content": f"message {i}"}, headers=headers)
+                else:
+                    response = await client.get(messages_url, params={"page_size": 20}, headers=headers)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def run_mode(db_async: bool, args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        port = free_port()
+        server = start_server(db_async, workdir, port)
+        try:
+            return asyncio.run(drive(f"http://127.0.0.1:{port}", args.requests, args.concurrency, args.write_ratio))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--write-ratio", type=float, default=0.2, help="share of requests that post a message")
+    args = parser.parse_args()
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {args.write_ratio:.0%} writes")
+    print(f"{'mode':<6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for db_async in (False, True):
+        result = run_mode(db_async, args)
+        print(f"{'async' if db_async else 'sync':<6} {result['rps']:>8.0f} {result['p50_ms']:>8.1f} "
+              f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
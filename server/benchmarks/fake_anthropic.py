@@ -0,0 +1,181 @@
+"""
+Fake Anthropic Messages API for load tests: POST /v1/messages with configurable
+latency and error rate, so benchmarks are reproducible and cost nothing.
+
+Answers like the real API, streamed (SSE) or not. A request that forces a tool
+(the prediagnosis call) gets a tool_use block filled from the tool's input schema;
+anything else gets text. Latency is the time to the first token, then each of
+--chunks pieces of the reply takes --token-ms; a non-streamed reply is sent once
+all of them would have been generated. With --error-rate, that share of requests
+fails with --error-status (529 overloaded by default, which the client retries).
+Tests pass a `script` of (status, latency seconds) steps instead, one per request
+(the last one repeats), and run it with BackgroundServer.
+
+Run on its own (load_test.py starts it for you):
+    python benchmarks/fake_anthropic.py --port 8090 --latency-ms 300 --error-rate 0.02
+"""
+import json
+import random
+import asyncio
+import argparse
+import threading
+from typing import List, Optional, Tuple
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+REPLY = (
+    "Thanks for the details. Rest, stay hydrated and keep track of your symptoms. "
+    "If they get worse or last more than a few days, please see a doctor."
+)
+
+
+def tool_input(tool: dict) -> dict:
+    """A plausible value for every property of the tool's input schema"""
+    return {name: f"fake {name.replace('_', ' ')}" for name in tool["input_schema"].get("properties", {})}
+
+
+def split(text: str, chunks: int) -> list:
+    size = max(1, -(-len(text) // chunks))
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def usage(body: dict, output: str) -> dict:
+    return {"input_tokens": len(json.dumps(body.get("messages", []))) // 4, "output_tokens": max(1, len(output) // 4)}
+
+
+ERROR_TYPES = {400: "invalid_request_error", 429: "rate_limit_error", 529: "overloaded_error"}
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class FakeAnthropic:
+    def __init__(self, latency_ms: float = 0, token_ms: float = 0, chunks: int = 1, jitter: float = 0,
+                 error_rate: float = 0, error_status: int = 529, seed: int = 0,
+                 script: Optional[List[Tuple[int, float]]] = None):
+        self.latency = latency_ms / 1000
+        self.token = token_ms / 1000
+        self.chunks = chunks
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.script = list(script or [])
+        self.requests = 0
+
+    def _delay(self, seconds: float) -> float:
+        return max(0.0, seconds * self.random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def messages(self, request: Request):
+        body = await request.json()
+        if self.script:
+            status, latency = self.script[min(self.requests, len(self.script) - 1)]
+        else:
+            status = self.error_status if self.random.random() < self.error_rate else 200
+            latency = self._delay(self.latency)
+        self.requests += 1
+
+        if status != 200:
+            await asyncio.sleep(latency)
+            error_type = ERROR_TYPES.get(status, "api_error")
+            return JSONResponse({"type": "error", "error": {"type": error_type, "message": f"fake {status}"}},
+                                status_code=status)
+
+        forced = (body.get("tool_choice") or {}).get("name")
+        tool = next((tool for tool in body.get("tools", []) if tool["name"] == forced), None)
+        if tool:
+            output = json.dumps(tool_input(tool))
+            block = {"type": "tool_use", "id": "toolu_fake", "name": tool["name"], "input": {}}
+            delta_type, delta_key = "input_json_delta", "partial_json"
+        else:
+            output = REPLY
+            block = {"type": "text", "text": ""}
+            delta_type, delta_key = "text_delta", "text"
+
+        message = {
+            "id": "msg_fake", "type": "message", "role": "assistant", "model": body.get("model", "fake"),
+            "content": [], "stop_reason": None, "stop_sequence": None, "usage": usage(body, output),
+        }
+        pieces = split(output, self.chunks)
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency + self._delay(self.token * len(pieces)))
+            content = dict(block, input=json.loads(output)) if tool else dict(block, text=output)
+            stop_reason = "tool_use" if tool else "end_turn"
+            return JSONResponse(dict(message, content=[content], stop_reason=stop_reason))
+
+        async def events():
+            await asyncio.sleep(latency)
+            yield sse("message_start", {"type": "message_start", "message": dict(message, usage=dict(message["usage"], output_tokens=0))})
+            yield sse("content_block_start", {"type": "content_block_start", "index": 0, "content_block": block})
+            for piece in pieces:
+                await asyncio.sleep(self._delay(self.token))
+                yield sse("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                  "delta": {"type": delta_type, delta_key: piece}})
+            yield sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+            yield sse("message_delta", {"type": "message_delta",
+                                        "delta": {"stop_reason": "tool_use" if tool else "end_turn", "stop_sequence": None},
+                                        "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+            yield sse("message_stop", {"type": "message_stop"})
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[Route("/v1/messages", self.messages, methods=["POST"])])
+
+
+class BackgroundServer:
+    """Serves a FakeAnthropic on a free local port from a daemon thread (for tests)"""
+
+    def __init__(self, fake: FakeAnthropic):
+        self.fake = fake
+        self._server = uvicorn.Server(uvicorn.Config(
+            fake.app(), host="127.0.0.1", port=0, log_level="warning", access_log=False, timeout_keep_alive=75
+        ))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("fake Anthropic server did not start")
+            self._thread.join(0.01)
+        port = self._server.servers[0].sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    @property
+    def requests(self) -> int:
+        return self.fake.requests
+
+    def close(self):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=300, help="time to the first token")
+    parser.add_argument("--token-ms", type=float, default=20, help="time per streamed chunk")
+    parser.add_argument("--chunks", type=int, default=20, help="chunks per reply")
+    parser.add_argument("--jitter", type=float, default=0.2, help="+/- share applied to every delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail")
+    parser.add_argument("--error-status", type=int, default=529)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    fake = FakeAnthropic(args.latency_ms, args.token_ms, args.chunks, args.jitter, args.error_rate, args.error_status)
+    # Keep idle connections longer than the app's LLM_KEEPALIVE_EXPIRY_SECONDS, like the real API
+    uvicorn.run(fake.app(), host=args.host, port=args.port, log_level="warning", access_log=False,
+                timeout_keep_alive=75)
+
+
+if __name__ == "__main__":
+    main()
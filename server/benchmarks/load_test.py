@@ -0,0 +1,453 @@
+"""
+Load test: the FastAPI app against a temporary database and a fake Anthropic server.
+
+Boots `source.app:app` under uvicorn in this process, on a fresh SQLite file, with
+ANTHROPIC_BASE_URL pointed at benchmarks/fake_anthropic.py (started as a subprocess,
+with the latency and error rate given below). Seeds patients, doctors and their
+conversations, then runs a weighted mix of what clients do (register and login,
+streamed chat turns, prediagnoses, patients reading and posting messages, doctors
+reading their inbox and conversations with If-None-Match) at each concurrency level,
+and reports requests per second and p50/p95/p99 latency per route.
+
+The load generator shares the server's event loop, so the numbers are for comparing
+commits on the same machine, not for capacity planning. benchmarks/baselines.json
+holds the figures of the last accepted run; --check fails when a route got slower
+or its throughput dropped by more than --tolerance, --save-baseline replaces them.
+
+Run from the server directory:
+    python benchmarks/load_test.py --concurrency 10 50 --duration 20
+    python benchmarks/load_test.py --check
+    python benchmarks/load_test.py --llm-latency-ms 1000 --llm-error-rate 0.05 --db-async
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter, defaultdict
+
+import httpx
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCHMARKS_DIR)
+BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baselines.json")
+
+# Action -> relative weight; doctors mostly read, patients chat
+WORKLOAD = {
+    "login": 4,
+    "register": 1,
+    "chat": 10,
+    "prediagnosis": 6,
+    "patient_messages": 15,
+    "post_message": 8,
+    "doctor_inbox": 20,
+    "doctor_conversation": 20,
+    "doctor_messages": 16,
+}
+
+# Settings recorded with the baseline (with the CPU count); a --check against other settings is meaningless
+COMPARABLE_SETTINGS = ("duration", "patients", "doctors", "llm_latency_ms", "llm_token_ms",
+                       "llm_chunks", "llm_error_rate", "db_async")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(ordered: list, q: float) -> float:
+    """Nearest-rank percentile of a sorted list"""
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+# ============= ENVIRONMENT =============
+
+def configure_environment(args, workdir: str, llm_port: int):
+    """Settings for the app under test; must run before source.app is imported"""
+    os.environ.update(
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load_test.db')}",
+        DB_ASYNC="true" if args.db_async else "false",
+        DB_MAINTENANCE_INTERVAL_SECONDS="0",
+        ANTHROPIC_BASE_URL=f"http://127.0.0.1:{llm_port}",
+        ANTH_API_KEY="fake",
+        SECRET_KEY="load-test-secret-key-that-is-long-enough-for-hs256",
+        SYMPTOM_VOCABULARY_PATH=os.path.join(SERVER_DIR, "source", "ml_models", "data", "symptoms.json"),
+    )
+    sys.path.insert(0, SERVER_DIR)
+
+
+def start_fake_anthropic(args, port: int) -> subprocess.Popen:
+    return subprocess.Popen([
+        sys.executable, os.path.join(BENCHMARKS_DIR, "fake_anthropic.py"), "--port", str(port),
+        "--latency-ms", str(args.llm_latency_ms), "--token-ms", str(args.llm_token_ms),
+        "--chunks", str(args.llm_chunks), "--error-rate", str(args.llm_error_rate),
+    ])
+
+
+async def wait_for_port(port: int, process: subprocess.Popen):
+    for _ in range(100):
+        if process.poll() is not None:
+            raise RuntimeError("fake Anthropic server exited")
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("fake Anthropic server did not start")
+
+
+async def start_app(port: int):
+    import uvicorn
+    from source.app import app
+
+    # Idle connections outlive the client's keep-alive expiry, so the client closes them first;
+    # otherwise a request can race the server closing the connection it picked from the pool
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False, timeout_keep_alive=75)
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+# ============= MEASUREMENT =============
+
+class Recorder:
+    """Latencies and errors per route; only samples taken while `active` count"""
+
+    def __init__(self):
+        self.active = False
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.failures = Counter()  # (route, status or exception name) -> count
+
+    def record(self, route: str, seconds: float, ok: bool, failure: str = ""):
+        if not self.active:
+            return
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+            self.failures[(route, failure)] += 1
+
+    async def request(self, route: str, send) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            response = await send()
+        except httpx.HTTPError as e:
+            self.record(route, time.perf_counter() - started, ok=False, failure=type(e).__name__)
+            return None
+        self.record(route, time.perf_counter() - started, ok=response.status_code < 400,
+                    failure=str(response.status_code))
+        return response
+
+    def summary(self, elapsed: float) -> dict:
+        routes = {}
+        for route, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            routes[route] = {
+                "requests": len(ordered),
+                "errors": self.errors[route],
+                "rps": round(len(ordered) / elapsed, 2),
+                "p50_ms": round(percentile(ordered, 50) * 1000, 1),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 1),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 1),
+            }
+        # First-token samples are a second view of the chat requests, not requests of their own
+        counted = [r for route, r in routes.items() if not route.endswith("(first token)")]
+        return {
+            "requests": sum(r["requests"] for r in counted),
+            "errors": sum(r["errors"] for r in counted),
+            "rps": round(sum(r["requests"] for r in counted) / elapsed, 2),
+            "routes": routes,
+            "failures": {f"{route}: {failure}": count for (route, failure), count in sorted(self.failures.items())},
+        }
+
+
+# ============= POPULATION =============
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def register_and_login(client: httpx.AsyncClient, email: str, role: str) -> dict:
+    user = {"name": email.split("@")[0], "email": email, "password": "password123", "role": role}
+    for _ in range(20):
+        registered = await client.post("/api/auth/register", json=user)
+        if registered.status_code != 503:
+            break
+        await asyncio.sleep(1)
+    registered.raise_for_status()
+    login = await client.post("/api/auth/login", json=user)
+    login.raise_for_status()
+    return {"email": email, "id": login.json()["user"]["id"], "headers": auth(login.json()["access_token"])}
+
+
+async def seed(client: httpx.AsyncClient, patients: int, doctors: int) -> dict:
+    """Patients with one conversation each, assigned round-robin to the doctors, with some history"""
+    doctor_users = await asyncio.gather(*(
+        register_and_login(client, f"load-doctor{i}@example.com", "doctor") for i in range(doctors)
+    ))
+    patient_users = await asyncio.gather(*(
+        register_and_login(client, f"load-patient{i}@example.com", "patient") for i in range(patients)
+    ))
+    for doctor in doctor_users:
+        doctor["conversations"] = []
+        doctor["etags"] = {}
+
+    for i, patient in enumerate(patient_users):
+        doctor = doctor_users[i % doctors]
+        conversation = (await client.post("/api/conversations", json={"title": f"Visit {i}"},
+                                          headers=patient["headers"])).json()
+        await client.put(f"/api/conversations/{conversation['id']}/assign-doctor",
+                         json={"doctor_id": doctor["id"]}, headers=patient["headers"])
+        await client.post(f"/api/conversations/{conversation['id']}/messages:batch", headers=patient["headers"],
+                          json={"messages": [{"content": f"Seed message {n}"} for n in range(10)]})
+        patient["conversation_id"] = conversation["id"]
+        doctor["conversations"].append(conversation["id"])
+
+    with open(os.path.join(SERVER_DIR, "source", "ml_models", "data", "symptoms.json")) as f:
+        symptoms = [entry["name"] for entry in json.load(f)["symptoms"]]
+    return {"patients": patient_users, "doctors": doctor_users, "symptoms": symptoms, "registered": 0}
+
+
+# ============= ACTIONS =============
+
+async def login(client, recorder, population, rng):
+    patient = rng.choice(population["patients"])
+    await recorder.request("POST /api/auth/login", lambda: client.post(
+        "/api/auth/login", json={"email": patient["email"], "password": "password123"}))
+
+
+async def register(client, recorder, population, rng):
+    population["registered"] += 1
+    user = {"name": "New", "email": f"load-new{population['registered']}-{rng.random():.8f}@example.com",
+            "password": "password123", "role": "patient"}
+    if await recorder.request("POST /api/auth/register", lambda: client.post("/api/auth/register", json=user)):
+        await recorder.request("POST /api/auth/login", lambda: client.post("/api/auth/login", json=user))
+
+
+async def chat(client, recorder, population, rng):
+    """A streamed chat turn: first-token latency and the whole turn are recorded separately"""
+    patient = rng.choice(population["patients"])
+    route = "POST /api/conversations/{id}/chat"
+    started = time.perf_counter()
+    first_token = None
+    failure = ""
+    try:
+        async with client.stream("POST", f"/api/conversations/{patient['conversation_id']}/chat",
+                                 json={"content": "I still have a headache, what should I do?"},
+                                 headers=patient["headers"]) as response:
+            if response.status_code != 200:
+                failure = str(response.status_code)
+            async for line in response.aiter_lines():
+                if line == "event: delta" and first_token is None:
+                    first_token = time.perf_counter() - started
+                elif line == "event: error":
+                    failure = "error event"
+    except httpx.HTTPError as e:
+        failure = type(e).__name__
+    recorder.record(route, time.perf_counter() - started, not failure, failure)
+    if first_token is not None:
+        recorder.record(f"{route} (first token)", first_token, True)
+
+
+async def prediagnosis(client, recorder, population, rng):
+    patient = rng.choice(population["patients"])
+    symptoms = rng.sample(population["symptoms"], rng.randint(1, 4))
+    await recorder.request("POST /api/prediagnosis", lambda: client.post(
+        "/api/prediagnosis", json={"symptoms": symptoms, "conversation_id": patient["conversation_id"]},
+        headers=patient["headers"]))
+
+
+async def patient_messages(client, recorder, population, rng):
+    patient = rng.choice(population["patients"])
+    await recorder.request("GET /api/conversations/{id}/messages", lambda: client.get(
+        f"/api/conversations/{patient['conversation_id']}/messages", params={"page_size": 20},
+        headers=patient["headers"]))
+
+
+async def post_message(client, recorder, population, rng):
+    patient = rng.choice(population["patients"])
+    await recorder.request("POST /api/conversations/{id}/messages", lambda: client.post(
+        f"/api/conversations/{patient['conversation_id']}/messages", json={"content": "Any update?"},
+        headers=patient["headers"]))
+
+
+async def doctor_inbox(client, recorder, population, rng):
+    doctor = rng.choice(population["doctors"])
+    await recorder.request("GET /api/conversations", lambda: client.get("/api/conversations", headers=doctor["headers"]))
+
+
+async def doctor_conversation(client, recorder, population, rng):
+    """Like a browser revisiting the page: sends the ETag it got last time"""
+    doctor = rng.choice(population["doctors"])
+    conversation_id = rng.choice(doctor["conversations"])
+    headers = dict(doctor["headers"])
+    if conversation_id in doctor["etags"]:
+        headers["If-None-Match"] = doctor["etags"][conversation_id]
+    response = await recorder.request("GET /api/conversations/{id}", lambda: client.get(
+        f"/api/conversations/{conversation_id}", headers=headers))
+    if response is not None and response.status_code == 200:
+        doctor["etags"][conversation_id] = response.headers.get("ETag")
+
+
+async def doctor_messages(client, recorder, population, rng):
+    doctor = rng.choice(population["doctors"])
+    conversation_id = rng.choice(doctor["conversations"])
+    await recorder.request("GET /api/conversations/{id}/messages", lambda: client.get(
+        f"/api/conversations/{conversation_id}/messages", params={"page_size": 20}, headers=doctor["headers"]))
+
+
+ACTIONS = {
+    "login": login,
+    "register": register,
+    "chat": chat,
+    "prediagnosis": prediagnosis,
+    "patient_messages": patient_messages,
+    "post_message": post_message,
+    "doctor_inbox": doctor_inbox,
+    "doctor_conversation": doctor_conversation,
+    "doctor_messages": doctor_messages,
+}
+
+
+async def run_level(client: httpx.AsyncClient, population: dict, concurrency: int, args) -> dict:
+    """`concurrency` virtual users doing weighted actions back to back; the warmup is not recorded"""
+    recorder = Recorder()
+    names = list(WORKLOAD)
+    weights = [WORKLOAD[name] for name in names]
+    deadline = time.perf_counter() + args.warmup + args.duration
+
+    async def user(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            await ACTIONS[rng.choices(names, weights)[0]](client, recorder, population, rng)
+
+    users = [asyncio.create_task(user(concurrency * 1000 + i)) for i in range(concurrency)]
+    await asyncio.sleep(args.warmup)
+    recorder.active = True
+    started = time.perf_counter()
+    await asyncio.gather(*users)
+    return recorder.summary(time.perf_counter() - started)
+
+
+# ============= REPORTING =============
+
+def print_level(concurrency: int, result: dict):
+    print(f"\nconcurrency {concurrency}: {result['requests']} requests, {result['rps']:.1f} req/s, "
+          f"{result['errors']} errors")
+    print(f"{'route':<52} {'count':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for route, r in result["routes"].items():
+        print(f"{route:<52} {r['requests']:>6} {r['rps']:>7.1f} {r['p50_ms']:>8.1f} "
+              f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>6}")
+    for failure, count in result["failures"].items():
+        print(f"  failed: {failure} x{count}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """
+    Routes whose p95 grew, throughput fell or error share rose beyond the tolerance.
+    p95 must also have grown by min_delta_ms, so jitter on fast routes is not a regression.
+    """
+    regressions = []
+    for level, base_level in baseline["levels"].items():
+        current = results.get(level)
+        if current is None:
+            continue
+        for route, base in base_level["routes"].items():
+            r = current["routes"].get(route)
+            if r is None:
+                regressions.append(f"c={level} {route}: no requests")
+                continue
+            if r["p95_ms"] > max(base["p95_ms"] * (1 + tolerance), base["p95_ms"] + min_delta_ms):
+                regressions.append(f"c={level} {route}: p95 {base['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms")
+            if r["rps"] < base["rps"] * (1 - tolerance):
+                regressions.append(f"c={level} {route}: {base['rps']:.1f} -> {r['rps']:.1f} req/s")
+            base_share = base["errors"] / max(1, base["requests"])
+            share = r["errors"] / max(1, r["requests"])
+            if share > base_share + 0.01:
+                regressions.append(f"c={level} {route}: errors {base_share:.1%} -> {share:.1%}")
+    return regressions
+
+
+async def main_async(args, workdir: str) -> dict:
+    llm_port, app_port = free_port(), free_port()
+    configure_environment(args, workdir, llm_port)
+    fake = start_fake_anthropic(args, llm_port)
+    try:
+        await wait_for_port(llm_port, fake)
+        server, task = await start_app(app_port)
+        try:
+            limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{app_port}", limits=limits, timeout=60) as client:
+                population = await seed(client, args.patients, args.doctors)
+                results = {}
+                for concurrency in args.concurrency:
+                    results[str(concurrency)] = await run_level(client, population, concurrency, args)
+                    print_level(concurrency, results[str(concurrency)])
+                return results
+        finally:
+            server.should_exit = True
+            await task
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50], help="virtual users, one run each")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds measured per concurrency level")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds run before measuring")
+    parser.add_argument("--patients", type=int, default=40)
+    parser.add_argument("--doctors", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="fake Anthropic time to first token")
+    parser.add_argument("--llm-token-ms", type=float, default=20.0, help="fake Anthropic time per streamed chunk")
+    parser.add_argument("--llm-chunks", type=int, default=20)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="share of fake Anthropic calls that fail (529)")
+    parser.add_argument("--db-async", action="store_true", help="serve with DB_ASYNC=true")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--check", action="store_true", help="exit 1 if a route regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative change in p95 and req/s")
+    parser.add_argument("--min-delta-ms", type=float, default=50.0, help="smallest p95 increase that counts")
+    parser.add_argument("--save-baseline", action="store_true", help="write this run's results as the baseline")
+    args = parser.parse_args()
+
+    settings = {name: getattr(args, name) for name in COMPARABLE_SETTINGS}
+    settings["cpus"] = os.cpu_count()
+    print(f"{', '.join(f'{k}={v}' for k, v in settings.items())}, weights {WORKLOAD}")
+    with tempfile.TemporaryDirectory() as workdir:
+        results = asyncio.run(main_async(args, workdir))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"settings": settings, "workload": WORKLOAD, "levels": results}, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+
+    if args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["settings"] != settings or baseline["workload"] != WORKLOAD:
+            print(f"\nBaseline was recorded with other settings: {baseline['settings']}")
+            sys.exit(2)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Shared pytest setup: every test module runs the app against a scratch SQLite database
+with fast, in-thread password hashing. The environment is set here, before any test
+module imports source.app (configuration is read at import time).
+"""
+import os
+import tempfile
+from collections import namedtuple
+
+_workdir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_workdir, 'test.db')}")
+os.environ.setdefault("SECRET_KEY", "test-secret-key-that-is-long-enough-for-hs256")
+os.environ.setdefault("ANTH_API_KEY", "test")
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import pytest
+
+from source.database import migrations, models
+
+# The app migrates in its lifespan, which TestClient only runs inside `with`
+migrations.upgrade(models.engine)
+
+TestUser = namedtuple("TestUser", ["id", "token", "headers"])
+
+
+@pytest.fixture(scope="session")
+def register():
+    """register(client, email, role="patient") -> TestUser, registered and logged in"""
+
+    def register(client, email, role="patient"):
+        user = {"name": email, "email": email, "password": "password123", "role": role}
+        assert client.post("/api/auth/register", json=user).status_code == 200
+        response = client.post("/api/auth/login", json=user)
+        token = response.json()["access_token"]
+        return TestUser(response.json()["user"]["id"], token, {"Authorization": f"Bearer {token}"})
+
+    return register
+
+
+@pytest.fixture
+def fake_anthropic():
+    """fake_anthropic(script=[(status, delay_seconds), ...], **options) -> a running benchmarks FakeAnthropic"""
+    from benchmarks.fake_anthropic import BackgroundServer, FakeAnthropic
+
+    servers = []
+
+    def start(script=None, **options):
+        server = BackgroundServer(FakeAnthropic(script=script, **options))
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
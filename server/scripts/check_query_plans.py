@@ -0,0 +1,163 @@
+"""
+Check that every query in operations.py is served by an index.
+
+Builds a scratch SQLite database through the migrations, seeds a little data,
+calls each operation while recording the SQL it runs, and prints
+EXPLAIN QUERY PLAN for every SELECT/UPDATE/DELETE. Exits with status 1 if any
+plan contains a full table scan (`SCAN <table>`) that isn't allow-listed below.
+
+Run from the server directory:
+    python scripts/check_query_plans.py [-v]
+"""
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+WORKDIR = tempfile.mkdtemp()
+atexit.register(shutil.rmtree, WORKDIR, ignore_errors=True)
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'plans.db')}"
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+
+from source.database import migrations, models, operations  # noqa: E402
+
+# Full scans that are intended, with the reason
+ALLOWED_SCANS = {
+    "get_llm_usage_summary (all time)": "GET /admin/llm-usage without `since` aggregates every row by design",
+}
+
+TABLES = {table.name for table in models.Base.metadata.sorted_tables}
+
+
+def seed(db):
+    patient = operations.create_user(db, "Patient", "patient@example.com", "x")
+    other = operations.create_user(db, "Other", "other@example.com", "x")
+    doctor = operations.create_user(db, "Doctor", "doctor@example.com", "x", role=models.UserRole.DOCTOR)
+    conversation = operations.create_conversation(db, patient.id, "Plans", doctor_id=doctor.id)
+    operations.create_conversation(db, other.id, "Other")
+    messages = [
+        operations.create_message(db, conversation.id, patient.id, models.MessageRole.USER, f"message {i}")
+        for i in range(5)
+    ]
+    prediagnosis = operations.create_prediagnosis(db, conversation.id, patient.id, doctor.id, "flu", "rest")
+    job = operations.create_prediagnosis_job(db, patient.id, ["cough"], conversation.id)
+    operations.create_llm_usage(db, "prediagnosis", "model", input_tokens=10, output_tokens=5)
+    return patient, doctor, conversation, messages, prediagnosis, job
+
+
+def operation_calls(patient, doctor, conversation, messages, prediagnosis, job):
+    """(name, fn(db)) for each operation; writes run last so reads see the seeded rows"""
+    middle = messages[len(messages) // 2].id
+    return [
+        ("get_user_by_email", lambda db: operations.get_user_by_email(db, patient.email)),
+        ("get_user_by_id", lambda db: operations.get_user_by_id(db, patient.id)),
+        ("get_conversation_by_id", lambda db: operations.get_conversation_by_id(db, conversation.id)),
+        ("load_conversation_details", lambda db: operations.load_conversation_details(db, conversation)),
+        ("get_user_conversations", lambda db: operations.get_user_conversations(db, patient.id)),
+        ("get_user_conversations (doctor)", lambda db: operations.get_user_conversations(db, doctor.id, role=models.UserRole.DOCTOR)),
+        ("get_conversation_messages", lambda db: operations.get_conversation_messages(db, conversation.id)),
+        ("get_conversation_messages (limit)", lambda db: operations.get_conversation_messages(db, conversation.id, limit=2)),
+        ("get_messages_page (latest)", lambda db: operations.get_messages_page(db, conversation.id, page_size=2)),
+        ("get_messages_page (before)", lambda db: operations.get_messages_page(db, conversation.id, 2, before=middle)),
+        ("get_messages_page (after)", lambda db: operations.get_messages_page(db, conversation.id, 2, after=middle)),
+        ("get_latest_messages", lambda db: operations.get_latest_messages(db, conversation.id)),
+        ("get_prediagnosis_by_conversation", lambda db: operations.get_prediagnosis_by_conversation(db, conversation.id)),
+        ("get_all_prediagnoses_by_conversation", lambda db: operations.get_all_prediagnoses_by_conversation(db, conversation.id)),
+        ("get_patient_prediagnoses", lambda db: operations.get_patient_prediagnoses(db, patient.id)),
+        ("get_prediagnosis_job", lambda db: operations.get_prediagnosis_job(db, job.id)),
+        ("get_pending_prediagnosis_jobs", lambda db: operations.get_pending_prediagnosis_jobs(db)),
+        ("get_pending_prediagnosis_jobs (queued_before)", lambda db: operations.get_pending_prediagnosis_jobs(db, datetime.now())),
+        ("search (patient)", lambda db: operations.search(db, "message", patient.id, models.UserRole.PATIENT)),
+        ("search (doctor)", lambda db: operations.search(db, "flu", doctor.id, models.UserRole.DOCTOR)),
+        ("get_llm_usage_summary (since)", lambda db: operations.get_llm_usage_summary(db, datetime.now() - timedelta(days=1))),
+        ("get_llm_usage_summary (all time)", lambda db: operations.get_llm_usage_summary(db)),
+        ("create_user", lambda db: operations.create_user(db, "New", "new@example.com", "x")),
+        ("update_user_medical_history", lambda db: operations.update_user_medical_history(db, patient.id, {"conditions": []})),
+        ("update_user_role", lambda db: operations.update_user_role(db, doctor.id, models.UserRole.DOCTOR)),
+        ("revoke_user_tokens", lambda db: operations.revoke_user_tokens(db, patient.id)),
+        ("create_conversation", lambda db: operations.create_conversation(db, patient.id)),
+        ("assign_doctor_to_conversation", lambda db: operations.assign_doctor_to_conversation(db, conversation.id, doctor.id)),
+        ("update_conversation_title", lambda db: operations.update_conversation_title(db, conversation.id, "Renamed")),
+        ("mark_conversation_read", lambda db: operations.mark_conversation_read(db, conversation.id, patient.id)),
+        ("remove_doctor_from_conversation", lambda db: operations.remove_doctor_from_conversation(db, conversation.id)),
+        ("create_message", lambda db: operations.create_message(db, conversation.id, patient.id, models.MessageRole.USER, "hi")),
+        ("create_messages", lambda db: operations.create_messages(
+            db, conversation.id, patient.id, [(models.MessageRole.USER, "q"), (models.MessageRole.ASSISTANT, "a")])),
+        ("create_prediagnosis", lambda db: operations.create_prediagnosis(db, conversation.id, patient.id, doctor.id, "a", "b")),
+        ("update_prediagnosis", lambda db: operations.update_prediagnosis(db, prediagnosis.id, course_of_action="c")),
+        ("create_prediagnosis_job", lambda db: operations.create_prediagnosis_job(db, patient.id, ["fever"])),
+        ("claim_prediagnosis_job", lambda db: operations.claim_prediagnosis_job(db, job.id, 60)),
+        ("renew_prediagnosis_job_lease", lambda db: operations.renew_prediagnosis_job_lease(db, job.id, 1, 60)),
+        ("mark_prediagnosis_job_done", lambda db: operations.mark_prediagnosis_job_done(db, job.id, 1, prediagnosis.id, conversation.id)),
+        ("mark_prediagnosis_job_failed", lambda db: operations.mark_prediagnosis_job_failed(db, job.id, 1, "error")),
+        ("create_llm_usage", lambda db: operations.create_llm_usage(db, "chat", "model")),
+    ]
+
+
+def full_scans(plan: list) -> list:
+    """Plan lines that read a whole table (a SCAN of one of our tables, with or without an index)"""
+    scans = []
+    for detail in plan:
+        words = detail.split()
+        if len(words) >= 2 and words[0] == "SCAN" and words[1] in TABLES:
+            scans.append(detail)
+    return scans
+
+
+def main():
+    verbose = "-v" in sys.argv[1:]
+    migrations.upgrade(models.engine)
+    statements = []
+
+    @event.listens_for(models.engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    db = models.SessionLocal()
+    try:
+        fixtures = seed(db)
+        calls = operation_calls(*fixtures)
+        failures = []
+
+        for name, call in calls:
+            statements.clear()
+            call(db)
+            queries = [(sql, params) for sql, params in statements
+                       if sql.lstrip().split(None, 1)[0].upper() in ("SELECT", "UPDATE", "DELETE")]
+
+            with models.engine.connect() as connection:
+                plans = [(sql, [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params)])
+                         for sql, params in queries]
+
+            scans = [detail for _, plan in plans for detail in full_scans(plan)]
+            if scans and name in ALLOWED_SCANS:
+                status = "allowed"
+            else:
+                status = "SCAN" if scans else "ok"
+            if status == "SCAN":
+                failures.append(name)
+
+            print(f"{status:<8} {name}")
+            if verbose or status != "ok":
+                for sql, plan in plans:
+                    print(f"           {' '.join(sql.split())[:110]}")
+                    for detail in plan:
+                        print(f"             {detail}")
+                if status == "allowed":
+                    print(f"           ({ALLOWED_SCANS[name]})")
+    finally:
+        db.close()
+
+    if failures:
+        print(f"\n{len(failures)} operation(s) do a full table scan: {', '.join(failures)}")
+        sys.exit(1)
+    print(f"\nNo unexpected full table scans in {len(calls)} operations")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,75 @@
-from fastapi import FastAPI, Depends, HTTPException, status, APIRouter
+from fastapi import FastAPI, Depends, HTTPException, status, APIRouter, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Optional, List
+from datetime import datetime
+from contextlib import asynccontextmanager
+import hmac
+import json
 
-from .database import models, operations, auth as auth_module
+from .database import models, operations, migrations, auth as auth_module
 from .database.models import get_db
-from .ml_models.suggestions import generate_prediagnosis
+from .database.operations import MESSAGE_PAGE_SIZE, MESSAGE_PAGE_MAX_SIZE, SEARCH_PAGE_SIZE, SEARCH_PAGE_MAX_SIZE
+from .database.principals import Principal, principal_cache, principal_cache_sync
+from .database.hashing import password_hasher, PasswordHasherBusy
+from .database.config import DatabaseMaintenance, DB_ASYNC
+from .database.async_session import async_engine
+from .ml_models.cache import (
+    generate_prediagnosis_cached, stream_prediagnosis_cached, make_cache_key, prediagnosis_cache, prediagnosis_cache_sync
+)
+from .ml_models.suggestions import REQUIRED_FIELDS, parse_stats
+from .ml_models.chat import CHAT_CONTEXT_MESSAGES, stream_chat_reply
+from .ml_models.engines import prediagnosis_engine
+from .ml_models.llm_client import llm
+from .ml_models.vocabulary import symptom_vocabulary
+from .jobs import prediagnosis_jobs
+from .realtime import realtime_hub
+from .conditional import conversation_etag, inbox_etag, not_modified
+from .metrics import CONTENT_TYPE_LATEST, METRICS_TOKEN, MetricsMiddleware, metrics_sampler, render as render_metrics
 from . import schemas
 
 # Initialize FastAPI app
 router = APIRouter()
+database_maintenance = DatabaseMaintenance(models.engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create or upgrade the schema before anything reads it (workers starting together take turns)
+    await run_in_threadpool(migrations.upgrade, models.engine)
+    # Background prediagnosis workers (resumes jobs left over from the last run)
+    await prediagnosis_jobs.start()
+    # bcrypt worker processes, started up front so the first logins don't pay for it
+    password_hasher.start()
+    # Periodic PRAGMA optimize / ANALYZE / WAL checkpoint
+    await database_maintenance.start()
+    # Pub/sub for the conversation WebSockets
+    await realtime_hub.start()
+    # Threadpool gauges for /metrics
+    await metrics_sampler.start()
+    # Picks up user changes (role, revoked tokens) made by other workers
+    await principal_cache_sync.start()
+    # Picks up prediagnosis cache invalidations made by other workers
+    await prediagnosis_cache_sync.start()
+    yield
+    await prediagnosis_cache_sync.stop()
+    await principal_cache_sync.stop()
+    await metrics_sampler.stop()
+    await realtime_hub.stop()
+    await database_maintenance.stop()
+    await prediagnosis_jobs.stop()
+    await async_engine.dispose()
+    password_hasher.shutdown()
+
 
 app = FastAPI(
     title="Fast Aid API",
     description="Medical prediagnosis and consultation API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware configuration
@@ -26,6 +80,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost, so request timings include the other middleware
+app.add_middleware(MetricsMiddleware)
 
 # Security
 security = HTTPBearer()
@@ -33,11 +89,28 @@ security = HTTPBearer()
 # ============= DEPENDENCY FUNCTIONS =============
 
 
+def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> Principal:
+    """Extract and verify the caller from JWT token (id, role, email), served from the user cache"""
+    principal = auth_module.get_principal_from_token(db, credentials.credentials)
+
+    if not principal:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return principal
+
+
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(get_db)
 ) -> models.User:
-    """Extract and verify current user from JWT token"""
+    """Extract and verify current user from JWT token, loading the full record (for endpoints that need it)"""
     token = credentials.credentials
     user = auth_module.get_user_from_token(db, token)
 
@@ -51,7 +124,7 @@ def get_current_user(
     return user
 
 
-def get_current_patient(current_user: models.User = Depends(get_current_user)) -> models.User:
+def get_current_patient(current_user: Principal = Depends(get_current_principal)) -> Principal:
     """Ensure current user is a patient"""
     if current_user.role != models.UserRole.PATIENT:
         raise HTTPException(
@@ -61,7 +134,7 @@ def get_current_patient(current_user: models.User = Depends(get_current_user)) -
     return current_user
 
 
-def get_current_doctor(current_user: models.User = Depends(get_current_user)) -> models.User:
+def get_current_doctor(current_user: Principal = Depends(get_current_principal)) -> Principal:
     """Ensure current user is a doctor"""
     if current_user.role != models.UserRole.DOCTOR:
         raise HTTPException(
@@ -71,6 +144,55 @@ def get_current_doctor(current_user: models.User = Depends(get_current_user)) ->
     return current_user
 
 
+def get_current_admin(current_user: Principal = Depends(get_current_principal)) -> Principal:
+    """Ensure current user is an admin"""
+    if current_user.role != models.UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied. Admin role required."
+        )
+    return current_user
+
+
+def get_current_patient_user(
+    current_user: Principal = Depends(get_current_patient),
+    db: Session = Depends(get_db)
+) -> models.User:
+    """Full record of the calling patient (for endpoints that need the medical history)"""
+    user = operations.get_user_by_id(db, current_user.id)
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return user
+
+
+def _check_conversation_access(conversation: Optional[models.Conversation], current_user: Principal):
+    """404 if missing; patients must own the conversation, doctors must be assigned"""
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+
+    if current_user.role == models.UserRole.PATIENT:
+        if conversation.patient_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+    elif current_user.role == models.UserRole.DOCTOR:
+        if conversation.doctor_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+
+
 # ============= HEALTH CHECK =============
 
 @router.get("/", tags=["Health"])
@@ -79,6 +201,14 @@ def health_check():
     return {"status": "healthy", "service": "Fast Aid API"}
 
 
+# ============= SYMPTOM ENDPOINTS =============
+
+@router.get("/symptoms/suggest", response_model=schemas.SymptomSuggestions, tags=["Symptoms"])
+def suggest_symptoms(q: str, limit: int = Query(default=10, ge=1, le=10)):
+    """Autocomplete symptom names from the vocabulary (prefix match on names and synonyms)"""
+    return {"query": q, "suggestions": symptom_vocabulary.suggest(q, limit)}
+
+
 # ============= AUTHENTICATION ENDPOINTS =============
 
 @router.post("/auth/register", response_model=schemas.UserResponse, tags=["Authentication"])
@@ -102,13 +232,20 @@ def register(user_data: schemas.UserRegister, db: Session = Depends(get_db)):
     role = role_map.get(user_data.role, models.UserRole.PATIENT)
 
     # Register user
-    user = auth_module.register_user(
-        db=db,
-        name=user_data.name,
-        email=user_data.email,
-        password=user_data.password,
-        role=role
-    )
+    try:
+        user = auth_module.register_user(
+            db=db,
+            name=user_data.name,
+            email=user_data.email,
+            password=user_data.password,
+            role=role
+        )
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"},
+        )
 
     return user
 
@@ -116,7 +253,14 @@ def register(user_data: schemas.UserRegister, db: Session = Depends(get_db)):
 @router.post("/auth/login", response_model=schemas.Token, tags=["Authentication"])
 def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
     """Login and receive JWT access token"""
-    result = auth_module.login(db, credentials.email, credentials.password)
+    try:
+        result = auth_module.login(db, credentials.email, credentials.password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"},
+        )
 
     if not result:
         raise HTTPException(
@@ -139,7 +283,7 @@ def get_current_user_info(current_user: models.User = Depends(get_current_user))
 @router.get("/users/{user_id}", response_model=schemas.UserResponse, tags=["Users"])
 def get_user(
     user_id: int,
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get user by ID (patients can only view their own profile)"""
@@ -164,7 +308,7 @@ def get_user(
 def update_medical_history(
     user_id: int,
     medical_history: schemas.MedicalHistoryUpdate,
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Update patient's medical history"""
@@ -188,12 +332,54 @@ def update_medical_history(
     return user
 
 
+@router.put("/users/{user_id}/role", response_model=schemas.UserResponse, tags=["Users"])
+def update_user_role(
+    user_id: int,
+    role_update: schemas.RoleUpdate,
+    current_user: Principal = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Change a user's role (admin only). Tokens issued under the old role stop working"""
+    user = operations.update_user_role(db, user_id, models.UserRole(role_update.role))
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    return user
+
+
+@router.post("/users/{user_id}/revoke-tokens", status_code=status.HTTP_204_NO_CONTENT, tags=["Users"])
+def revoke_user_tokens(
+    user_id: int,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """
+    Sign a user out everywhere by invalidating their issued tokens (the user themselves, or an admin).
+    Takes effect at once on this worker and within USER_CACHE_SYNC_INTERVAL_SECONDS on the others.
+    """
+    if current_user.role != models.UserRole.ADMIN and current_user.id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    if not operations.revoke_user_tokens(db, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+
 # ============= CONVERSATION ENDPOINTS =============
 
 @router.post("/conversations", response_model=schemas.ConversationResponse, tags=["Conversations"])
 def create_conversation(
     conversation_data: schemas.ConversationCreate,
-    current_user: models.User = Depends(get_current_patient),
+    current_user: Principal = Depends(get_current_patient),
     db: Session = Depends(get_db)
 ):
     """Create a new conversation (patients only)"""
@@ -205,54 +391,63 @@ def create_conversation(
     return conversation
 
 
-@router.get("/conversations", response_model=List[schemas.ConversationResponse], tags=["Conversations"])
+@router.get("/conversations", response_model=List[schemas.ConversationSummary], tags=["Conversations"])
 def get_my_conversations(
-    limit: int = 50,
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
 ):
-    """Get all conversations for the current user"""
-    conversations = operations.get_user_conversations(db, current_user.id, limit)
+    """
+    Get the current user's inbox: a patient's conversations or a doctor's assigned ones, most recent first.
+    Conditional: send the ETag back in If-None-Match to get 304 when nothing changed.
+    """
+    conversations = operations.get_user_conversations(db, current_user.id, limit, current_user.role)
+    unchanged = not_modified(request, response, inbox_etag(conversations, current_user, limit))
+    if unchanged:
+        return unchanged
     return conversations
 
 
 @router.get("/conversations/{conversation_id}", response_model=schemas.ConversationWithMessages, tags=["Conversations"])
 def get_conversation(
     conversation_id: str,
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
-    """Get a specific conversation with all messages and prediagnoses"""
+    """
+    Get a specific conversation with all messages and prediagnoses.
+    Conditional: a matching If-None-Match gets 304 before any message is read.
+    """
     conversation = operations.get_conversation_by_id(db, conversation_id)
+    _check_conversation_access(conversation, current_user)
 
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
+    unchanged = not_modified(request, response, conversation_etag(conversation, current_user))
+    if unchanged:
+        return unchanged
+    # Loaded up front, so serializing never lazy-loads
+    return operations.load_conversation_details(db, conversation)
 
-    # Check access: patient must own conversation, doctor must be assigned
-    if current_user.role == models.UserRole.PATIENT:
-        if conversation.patient_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
-    elif current_user.role == models.UserRole.DOCTOR:
-        if conversation.doctor_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
 
-    return conversation
+@router.post("/conversations/{conversation_id}/read", response_model=schemas.ConversationSummary, tags=["Conversations"])
+def mark_conversation_read(
+    conversation_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Mark a conversation as read by the current user (resets their unread count)"""
+    _check_conversation_access(operations.get_conversation_by_id(db, conversation_id), current_user)
+    return operations.mark_conversation_read(db, conversation_id, current_user.id)
 
 
 @router.put("/conversations/{conversation_id}/assign-doctor", response_model=schemas.ConversationResponse, tags=["Conversations"])
 def assign_doctor(
     conversation_id: str,
     assignment: schemas.DoctorAssignment,
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Assign a doctor to a conversation (admin only, or patient can assign)"""
@@ -294,7 +489,7 @@ def assign_doctor(
 @router.delete('/conversations/{conversation_id}/remove-doctor', response_model=schemas.ConversationResponse, tags=["Conversations"])
 def remove_doctor(
     conversation_id: str,
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     conversation = operations.get_conversation_by_id(db, conversation_id)
@@ -321,31 +516,12 @@ def remove_doctor(
 def create_message(
     conversation_id: str,
     message_data: schemas.MessageCreate,
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Add a message to a conversation"""
     conversation = operations.get_conversation_by_id(db, conversation_id)
-
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
-
-    # Verify access
-    if current_user.role == models.UserRole.PATIENT:
-        if conversation.patient_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
-    elif current_user.role == models.UserRole.DOCTOR:
-        if conversation.doctor_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
+    _check_conversation_access(conversation, current_user)
 
     # Convert role string to enum
     role_map = {
@@ -366,59 +542,210 @@ def create_message(
     return message
 
 
-@router.get("/conversations/{conversation_id}/messages", response_model=List[schemas.MessageResponse], tags=["Messages"])
+@router.post("/conversations/{conversation_id}/messages:batch", response_model=List[schemas.MessageResponse], tags=["Messages"])
+def create_messages(
+    conversation_id: str,
+    batch: schemas.MessageBatchCreate,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """
+    Add several messages to a conversation in one transaction, e.g. a user message
+    and the assistant reply of a chat turn. Messages are stored in the given order.
+    """
+    conversation = operations.get_conversation_by_id(db, conversation_id)
+    _check_conversation_access(conversation, current_user)
+
+    return operations.create_messages(
+        db=db,
+        conversation_id=conversation_id,
+        sender_id=current_user.id,
+        messages=[(models.MessageRole(message.role), message.content) for message in batch.messages]
+    )
+
+
+@router.get("/conversations/{conversation_id}/messages", response_model=schemas.MessagePage, tags=["Messages"])
 def get_messages(
     conversation_id: str,
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db),
-    limit: Optional[int] = None
+    before: Optional[int] = Query(default=None, description="Return messages older than this message id"),
+    after: Optional[int] = Query(default=None, description="Return messages newer than this message id"),
+    page_size: int = Query(default=MESSAGE_PAGE_SIZE, ge=1, le=MESSAGE_PAGE_MAX_SIZE)
 ):
-    """Get all messages in a conversation"""
+    """
+    Get a page of messages in a conversation, oldest first.
+    Without a cursor this is the latest page; follow next_cursor with `before` to load
+    older history, or poll with `after` for newer messages.
+    Conditional: a matching If-None-Match gets 304 before any message is read.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either before or after, not both"
+        )
+
     conversation = operations.get_conversation_by_id(db, conversation_id)
+    _check_conversation_access(conversation, current_user)
 
-    if not conversation:
+    etag = conversation_etag(conversation, current_user, "messages", before, after, page_size)
+    unchanged = not_modified(request, response, etag)
+    if unchanged:
+        return unchanged
+
+    page = operations.get_messages_page(db, conversation_id, page_size, before=before, after=after)
+    if page is None:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid message cursor"
         )
+    messages, next_cursor = page
+    return {"messages": messages, "next_cursor": next_cursor, "has_more": next_cursor is not None}
 
-    # Verify access
-    if current_user.role == models.UserRole.PATIENT:
-        if conversation.patient_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
-    elif current_user.role == models.UserRole.DOCTOR:
-        if conversation.doctor_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
+
+@router.post("/conversations/{conversation_id}/chat", tags=["Messages"])
+async def chat(
+    conversation_id: str,
+    message_data: schemas.ChatMessageCreate,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """
+    Send a message and stream the assistant's reply as server-sent events.
+    Events: `message` (the stored user message), `delta` ({"text"} chunks of the reply),
+    then `done` (the stored assistant message) or `error`. The reply is written once,
+    when the stream finishes.
+    """
+    # Errors that can be reported with a status code must happen before the stream starts
+    user_message, history = await run_in_threadpool(
+        _start_chat_turn, db, conversation_id, current_user, message_data.content
+    )
+
+    async def event_stream():
+        yield _sse_event("message", user_message)
+
+        chunks = []
+        try:
+            async for text in stream_chat_reply(history):
+                chunks.append(text)
+                yield _sse_event("delta", {"text": text})
+
+            reply = "".join(chunks)
+            if not reply:
+                raise ValueError("Empty reply")
+
+            assistant_message = await run_in_threadpool(
+                operations.create_message, db, conversation_id, current_user.id, models.MessageRole.ASSISTANT, reply
             )
+            yield _sse_event("done", schemas.MessageResponse.model_validate(assistant_message).model_dump(mode="json"))
+        except Exception as e:
+            print(f"Error streaming chat reply: {e}")
+            yield _sse_event("error", {"detail": "Failed to generate a reply"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    messages = operations.get_conversation_messages(db, conversation_id, limit)
-    return messages
+
+def _start_chat_turn(db: Session, conversation_id: str, current_user: Principal, content: str):
+    """Check access, store the user's message and read the latest messages as context for the reply"""
+    conversation = operations.get_conversation_by_id(db, conversation_id)
+    _check_conversation_access(conversation, current_user)
+
+    message = operations.create_message(db, conversation_id, current_user.id, models.MessageRole.USER, content)
+    history = [
+        {"role": m.role.value, "content": m.content}
+        for m in operations.get_latest_messages(db, conversation_id, CHAT_CONTEXT_MESSAGES)
+    ]
+    return schemas.MessageResponse.model_validate(message).model_dump(mode="json"), history
+
+
+# ============= REAL-TIME ENDPOINTS =============
+
+@router.websocket("/conversations/{conversation_id}/ws")
+async def conversation_socket(websocket: WebSocket, conversation_id: str, token: str = Query(...)):
+    """
+    Real-time channel for a conversation: new messages and prediagnoses as they are
+    committed, presence and typing (events are listed in source/realtime.py).
+    Browsers can't set headers on a WebSocket, so the JWT comes as `?token=`; the same
+    access rules as the REST routes apply. Clients may send {"type": "typing", "typing": bool}.
+    """
+    await websocket.accept()
+    principal, close_code = await run_in_threadpool(_authorize_socket, conversation_id, token)
+    if principal is None:
+        await websocket.close(code=close_code)
+        return
+
+    connection = await realtime_hub.join(conversation_id, websocket, principal.id)
+    try:
+        while True:
+            data = await websocket.receive_json()
+            if isinstance(data, dict) and data.get("type") == "typing":
+                await realtime_hub.typing(conversation_id, principal.id, bool(data.get("typing")))
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        await realtime_hub.leave(conversation_id, connection)
+
+
+def _authorize_socket(conversation_id: str, token: str):
+    """(principal, None) if the caller may open the conversation, else (None, close code 4401/4403/4404)"""
+    with models.SessionLocal() as db:
+        principal = auth_module.get_principal_from_token(db, token)
+        if not principal:
+            return None, 4401
+        try:
+            _check_conversation_access(operations.get_conversation_by_id(db, conversation_id), principal)
+        except HTTPException as e:
+            return None, 4000 + e.status_code
+    return principal, None
+
+
+# ============= SEARCH ENDPOINTS =============
+
+@router.get("/search", response_model=schemas.SearchResponse, tags=["Search"])
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=SEARCH_PAGE_SIZE, ge=1, le=SEARCH_PAGE_MAX_SIZE),
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """
+    Search the messages and prediagnoses of the conversations the user can open, best match first.
+    Every word of `q` must match (with stemming); snippets mark the matches in **bold**.
+    """
+    found = operations.search(db, q, current_user.id, current_user.role, page, page_size)
+    if found is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Search is only available on SQLite"
+        )
+    results, next_page = found
+    return {"results": results, "next_page": next_page}
 
 
 # ============= PREDIAGNOSIS ENDPOINTS =============
 
 @router.post("/prediagnosis", response_model=schemas.PrediagnosisResponse, tags=["Prediagnosis"])
-def create_prediagnosis(
+async def create_prediagnosis(
     request: schemas.PrediagnosisRequest,
-    current_user: models.User = Depends(get_current_patient),
+    current_user: models.User = Depends(get_current_patient_user),
     db: Session = Depends(get_db)
 ):
     """Generate a prediagnosis using AI (patients only)"""
-    # Build patient data
-    patient_data = {
-        "symptoms": request.symptoms,
-    }
-
-    # Get medical history
+    # Read what we need from the user up front; the session is released while the LLM runs
+    patient_id = current_user.id
     medical_history = current_user.medical_history
+    symptoms = _symptom_list(request.symptoms)
 
-    # Generate prediagnosis using AI
-    ai_result = generate_prediagnosis(patient_data, medical_history)
+    # Generate prediagnosis using AI (awaited on the event loop, not a threadpool worker).
+    # Repeat submissions with the same symptoms and history are served from the cache.
+    ai_result = await generate_prediagnosis_cached(db, symptoms, medical_history)
 
     if not ai_result:
         raise HTTPException(
@@ -426,43 +753,159 @@ def create_prediagnosis(
             detail="Failed to generate prediagnosis"
         )
 
-    # Create or get conversation
-    conversation_id = request.conversation_id
-    if not conversation_id:
-        conversation = operations.create_conversation(
-            db=db,
-            patient_id=current_user.id,
-            title=f"Symptoms: {', '.join(request.symptoms[:3])}"
-        )
-        conversation_id = conversation.id
-    else:
-        # Verify conversation exists and belongs to user
-        conversation = operations.get_conversation_by_id(db, conversation_id)
-        if not conversation or conversation.patient_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Conversation not found"
+    # Blocking database work is handed to the threadpool
+    return await run_in_threadpool(
+        _store_prediagnosis, db, patient_id, request.conversation_id, symptoms, ai_result
+    )
+
+
+@router.post("/prediagnosis/stream", tags=["Prediagnosis"])
+async def stream_prediagnosis(
+    request: schemas.PrediagnosisRequest,
+    current_user: models.User = Depends(get_current_patient_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Generate a prediagnosis using AI, streamed as server-sent events (patients only).
+    One event is sent per field as soon as it finishes generating, then a final
+    `prediagnosis` event with the stored record.
+    """
+    patient_id = current_user.id
+    medical_history = current_user.medical_history
+    symptoms = _symptom_list(request.symptoms)
+
+    # Errors that can be reported with a status code must happen before the stream starts
+    if request.conversation_id:
+        await run_in_threadpool(_verify_patient_conversation, db, request.conversation_id, patient_id)
+
+    async def event_stream():
+        ai_result = {}
+        try:
+            async for field, value in stream_prediagnosis_cached(db, symptoms, medical_history):
+                if field in REQUIRED_FIELDS and field not in ai_result:
+                    ai_result[field] = value
+                    yield _sse_event(field, {"field": field, "value": value})
+
+            # Persist once, after every field has arrived
+            prediagnosis = await run_in_threadpool(
+                _store_prediagnosis, db, patient_id, request.conversation_id, symptoms, ai_result
+            )
+            yield _sse_event(
+                "prediagnosis",
+                schemas.PrediagnosisResponse.model_validate(prediagnosis).model_dump(mode="json")
             )
+        except Exception as e:
+            print(f"Error streaming prediagnosis: {e}")
+            yield _sse_event("error", {"detail": "Failed to generate prediagnosis"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _symptom_list(symptoms: List[str]) -> List[str]:
+    """
+    The patient's symptoms as written, minus blanks and repeats. The prompt gets this
+    wording; canonical names are only used for the cache key and the title.
+    """
+    normalized = symptom_vocabulary.dedupe(symptoms)
+    if not normalized:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="At least one symptom is required"
+        )
+    return normalized
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _verify_patient_conversation(db: Session, conversation_id: str, patient_id: int) -> models.Conversation:
+    """Verify conversation exists and belongs to the patient"""
+    conversation = operations.get_conversation_by_id(db, conversation_id)
+    if not conversation or conversation.patient_id != patient_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+    return conversation
 
-    # Store prediagnosis in database
-    # Note: doctor_id is set to patient_id for now since it's AI-generated
-    prediagnosis = operations.create_prediagnosis(
+
+def _store_prediagnosis(
+    db: Session,
+    patient_id: int,
+    conversation_id: Optional[str],
+    symptoms: List[str],
+    ai_result: dict
+) -> models.PreDiagnosis:
+    """Verify the conversation (if given) and store an AI prediagnosis in it"""
+    if conversation_id:
+        _verify_patient_conversation(db, conversation_id, patient_id)
+
+    return operations.create_ai_prediagnosis(
+        db, patient_id, symptom_vocabulary.normalize_all(symptoms), ai_result, conversation_id
+    )
+
+
+@router.post(
+    "/prediagnosis/jobs",
+    response_model=schemas.PrediagnosisJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Prediagnosis"]
+)
+def create_prediagnosis_job(
+    request: schemas.PrediagnosisRequest,
+    current_user: Principal = Depends(get_current_patient),
+    db: Session = Depends(get_db)
+):
+    """Queue a prediagnosis to be generated in the background (patients only). Poll the job for the result"""
+    if request.conversation_id:
+        _verify_patient_conversation(db, request.conversation_id, current_user.id)
+
+    if not prediagnosis_jobs.accepting():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    job = operations.create_prediagnosis_job(
         db=db,
-        conversation_id=conversation_id,
         patient_id=current_user.id,
-        doctor_id=current_user.id,  # Temporary: AI-generated
-        potential_diseases=ai_result["potential_diseases"],
-        course_of_action=ai_result["course_of_action"],
-        therapy_message=ai_result.get("support_messages"),
-        recommended_practitioners=ai_result.get("recommended_practitioners")
+        symptoms=_symptom_list(request.symptoms),
+        conversation_id=request.conversation_id
     )
+    prediagnosis_jobs.enqueue(job.id)
 
-    return prediagnosis
+    return job
+
+
+@router.get("/prediagnosis/jobs/{job_id}", response_model=schemas.PrediagnosisJobResponse, tags=["Prediagnosis"])
+def get_prediagnosis_job(
+    job_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Get the status of a background prediagnosis job, with the prediagnosis once done"""
+    job = operations.get_prediagnosis_job(db, job_id)
+
+    # Patients can only see their own jobs
+    if not job or (current_user.role != models.UserRole.ADMIN and job.patient_id != current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+
+    return job
 
 
 @router.get("/prediagnosis/my", response_model=List[schemas.PrediagnosisResponse], tags=["Prediagnosis"])
 def get_my_prediagnoses(
-    current_user: models.User = Depends(get_current_patient),
+    current_user: Principal = Depends(get_current_patient),
     db: Session = Depends(get_db),
     limit: int = 10
 ):
@@ -474,31 +917,12 @@ def get_my_prediagnoses(
 @router.get("/conversations/{conversation_id}/prediagnosis", response_model=schemas.PrediagnosisResponse, tags=["Prediagnosis"])
 def get_conversation_prediagnosis(
     conversation_id: str,
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get the prediagnosis for a specific conversation"""
     conversation = operations.get_conversation_by_id(db, conversation_id)
-
-    if not conversation:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Conversation not found"
-        )
-
-    # Verify access
-    if current_user.role == models.UserRole.PATIENT:
-        if conversation.patient_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
-    elif current_user.role == models.UserRole.DOCTOR:
-        if conversation.doctor_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Access denied"
-            )
+    _check_conversation_access(conversation, current_user)
 
     prediagnosis = operations.get_prediagnosis_by_conversation(db, conversation_id)
 
@@ -511,5 +935,115 @@ def get_conversation_prediagnosis(
     return prediagnosis
 
 
+@router.get("/prediagnosis/cache/stats", response_model=schemas.PrediagnosisCacheStats, tags=["Prediagnosis"])
+def get_prediagnosis_cache_stats(current_user: Principal = Depends(get_current_admin)):
+    """Get prediagnosis cache hit/miss counters (admin only)"""
+    return prediagnosis_cache.stats()
+
+
+@router.get("/prediagnosis/engines/stats", response_model=dict[str, schemas.PrediagnosisEngineStats], tags=["Prediagnosis"])
+def get_prediagnosis_engine_stats(current_user: Principal = Depends(get_current_admin)):
+    """Get per-engine call counts, fallbacks and latency (admin only)"""
+    return prediagnosis_engine.snapshot()
+
+
+@router.get("/prediagnosis/parse/stats", response_model=schemas.PrediagnosisParseStats, tags=["Prediagnosis"])
+def get_prediagnosis_parse_stats(current_user: Principal = Depends(get_current_admin)):
+    """Get how often LLM responses parsed cleanly, needed a local repair, or failed (admin only)"""
+    return parse_stats.snapshot()
+
+
+@router.get("/admin/llm-client", response_model=schemas.LLMClientStats, tags=["Admin"])
+def get_llm_client_stats(current_user: Principal = Depends(get_current_admin)):
+    """Get LLM client retry, hedging and circuit-breaker counters (admin only)"""
+    return llm.snapshot()
+
+
+@router.get("/admin/user-cache", response_model=schemas.UserCacheStats, tags=["Admin"])
+def get_user_cache_stats(current_user: Principal = Depends(get_current_admin)):
+    """Get authenticated-user cache hit/miss counters (admin only)"""
+    return principal_cache.stats()
+
+
+@router.get("/admin/realtime", response_model=schemas.RealtimeStats, tags=["Admin"])
+def get_realtime_stats(current_user: Principal = Depends(get_current_admin)):
+    """Get open conversation sockets and event fan-out counters (admin only)"""
+    return realtime_hub.snapshot()
+
+
+@router.get("/admin/password-hashing", response_model=schemas.PasswordHashingStats, tags=["Admin"])
+def get_password_hashing_stats(current_user: Principal = Depends(get_current_admin)):
+    """Get password hashing pool queue depth and latency (admin only)"""
+    return password_hasher.snapshot()
+
+
+@router.delete("/prediagnosis/cache", response_model=schemas.PrediagnosisCacheInvalidation, tags=["Prediagnosis"])
+def invalidate_prediagnosis_cache(
+    key: Optional[str] = None,
+    symptoms: Optional[List[str]] = Query(default=None, description="Invalidate the entry for these symptoms"),
+    patient_id: Optional[int] = Query(default=None, description="...submitted with this patient's medical history"),
+    current_user: Principal = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    Invalidate one cached prediagnosis, by key or by the symptoms (and patient) it was
+    generated for, or the whole cache when neither is given (admin only)
+    """
+    if symptoms is not None:
+        if key is not None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Give either key or symptoms")
+        medical_history = None
+        if patient_id is not None:
+            patient = operations.get_user_by_id(db, patient_id)
+            if not patient:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Patient not found")
+            medical_history = patient.medical_history
+        key = make_cache_key(_symptom_list(symptoms), medical_history)
+    elif patient_id is not None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="patient_id needs symptoms")
+
+    removed = prediagnosis_cache.invalidate(db, key)
+    return {"removed": removed}
+
+
+# ============= METRICS ENDPOINT =============
+
+@app.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    """Prometheus metrics (text exposition format). Requires METRICS_TOKEN as a bearer token when set"""
+    if METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+# ============= ADMIN ENDPOINTS =============
+
+@router.get("/admin/llm-usage", response_model=List[schemas.LLMUsageSummary], tags=["Admin"])
+def get_llm_usage(
+    since: Optional[datetime] = None,
+    current_user: Principal = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Aggregate LLM token usage (including prompt-cache reads/writes) per purpose and model (admin only)"""
+    return operations.get_llm_usage_summary(db, since)
+
+
+def use_async_routes(router: APIRouter, async_router: APIRouter):
+    """Replace each sync route with the async route registered for the same path and method"""
+    overridden = {(route.path, method) for route in async_router.routes for method in route.methods}
+    router.routes[:] = [
+        route for route in router.routes
+        if not any((route.path, method) in overridden for method in getattr(route, "methods", ()))
+    ]
+    router.include_router(async_router)
+
+
+if DB_ASYNC:
+    from .async_routes import router as async_router
+    use_async_routes(router, async_router)
+
+
 # Include router with /api prefix after all routes are defined
 app.include_router(router, prefix='/api')
@@ -0,0 +1,558 @@
+"""
+AsyncSession versions of the database-backed routes in app.py.
+Enabled with DB_ASYNC=true: each route here replaces the sync route with the same
+path and method, so handlers await the database on the event loop instead of
+holding a threadpool worker. Prediagnosis generation routes already run on the
+event loop and keep their sync session for the cache.
+"""
+from fastapi import Depends, HTTPException, status, APIRouter, Query, Request, Response
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List
+from datetime import datetime
+
+from .database import models, async_operations, auth as auth_module
+from .database.async_session import get_db
+from .database.operations import MESSAGE_PAGE_SIZE, MESSAGE_PAGE_MAX_SIZE, SEARCH_PAGE_SIZE, SEARCH_PAGE_MAX_SIZE
+from .database.principals import Principal
+from .database.hashing import PasswordHasherBusy
+from .ml_models.vocabulary import symptom_vocabulary
+from .jobs import prediagnosis_jobs
+from .conditional import conversation_etag, inbox_etag, not_modified
+from . import schemas
+
+router = APIRouter()
+
+# Security
+security = HTTPBearer()
+
+# ============= DEPENDENCY FUNCTIONS =============
+
+
+async def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> Principal:
+    """Extract and verify the caller from JWT token (id, role, email), served from the user cache"""
+    principal = await auth_module.get_principal_from_token_async(db, credentials.credentials)
+
+    if not principal:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return principal
+
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_db)
+) -> models.User:
+    """Extract and verify current user from JWT token, loading the full record (for endpoints that need it)"""
+    user = await auth_module.get_user_from_token_async(db, credentials.credentials)
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return user
+
+
+async def get_current_patient(current_user: Principal = Depends(get_current_principal)) -> Principal:
+    """Ensure current user is a patient"""
+    if current_user.role != models.UserRole.PATIENT:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied. Patient role required."
+        )
+    return current_user
+
+
+async def get_current_admin(current_user: Principal = Depends(get_current_principal)) -> Principal:
+    """Ensure current user is an admin"""
+    if current_user.role != models.UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied. Admin role required."
+        )
+    return current_user
+
+
+def _check_conversation_access(conversation: Optional[models.Conversation], current_user: Principal):
+    """404 if missing; patients must own the conversation, doctors must be assigned"""
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+
+    if current_user.role == models.UserRole.PATIENT:
+        if conversation.patient_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+    elif current_user.role == models.UserRole.DOCTOR:
+        if conversation.doctor_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+
+
+# ============= AUTHENTICATION ENDPOINTS =============
+
+@router.post("/auth/register", response_model=schemas.UserResponse, tags=["Authentication"])
+async def register(user_data: schemas.UserRegister, db: AsyncSession = Depends(get_db)):
+    """Register a new user (patient, doctor, or admin)"""
+    existing_user = await async_operations.get_user_by_email(db, user_data.email)
+    if existing_user:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+
+    role_map = {
+        "patient": models.UserRole.PATIENT,
+        "doctor": models.UserRole.DOCTOR,
+        "admin": models.UserRole.ADMIN
+    }
+
+    try:
+        return await auth_module.register_user_async(
+            db=db,
+            name=user_data.name,
+            email=user_data.email,
+            password=user_data.password,
+            role=role_map.get(user_data.role, models.UserRole.PATIENT)
+        )
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+
+@router.post("/auth/login", response_model=schemas.Token, tags=["Authentication"])
+async def login(credentials: schemas.UserLogin, db: AsyncSession = Depends(get_db)):
+    """Login and receive JWT access token"""
+    try:
+        result = await auth_module.login_async(db, credentials.email, credentials.password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect email or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return result
+
+
+@router.get("/auth/me", response_model=schemas.UserResponse, tags=["Authentication"])
+async def get_current_user_info(current_user: models.User = Depends(get_current_user)):
+    """Get current authenticated user information"""
+    return current_user
+
+
+# ============= USER & MEDICAL HISTORY ENDPOINTS =============
+
+@router.get("/users/{user_id}", response_model=schemas.UserResponse, tags=["Users"])
+async def get_user(
+    user_id: int,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get user by ID (patients can only view their own profile)"""
+    if current_user.role == models.UserRole.PATIENT and current_user.id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    user = await async_operations.get_user_by_id(db, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    return user
+
+
+@router.put("/users/{user_id}/medical-history", response_model=schemas.UserResponse, tags=["Users"])
+async def update_medical_history(
+    user_id: int,
+    medical_history: schemas.MedicalHistoryUpdate,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Update patient's medical history"""
+    if current_user.role == models.UserRole.PATIENT and current_user.id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+
+    user = await async_operations.update_user_medical_history(
+        db, user_id, medical_history.model_dump(exclude_unset=True)
+    )
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+
+    return user
+
+
+# ============= CONVERSATION ENDPOINTS =============
+
+@router.post("/conversations", response_model=schemas.ConversationResponse, tags=["Conversations"])
+async def create_conversation(
+    conversation_data: schemas.ConversationCreate,
+    current_user: Principal = Depends(get_current_patient),
+    db: AsyncSession = Depends(get_db)
+):
+    """Create a new conversation (patients only)"""
+    return await async_operations.create_conversation(
+        db=db,
+        patient_id=current_user.id,
+        title=conversation_data.title
+    )
+
+
+@router.get("/conversations", response_model=List[schemas.ConversationSummary], tags=["Conversations"])
+async def get_my_conversations(
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+):
+    """Get the current user's inbox, most recent first (conditional, see the sync route)"""
+    conversations = await async_operations.get_user_conversations(db, current_user.id, limit, current_user.role)
+    unchanged = not_modified(request, response, inbox_etag(conversations, current_user, limit))
+    if unchanged:
+        return unchanged
+    return conversations
+
+
+@router.get("/conversations/{conversation_id}", response_model=schemas.ConversationWithMessages, tags=["Conversations"])
+async def get_conversation(
+    conversation_id: str,
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get a specific conversation with all messages and prediagnoses (conditional, see the sync route)"""
+    conversation = await async_operations.get_conversation_by_id(db, conversation_id)
+    _check_conversation_access(conversation, current_user)
+
+    unchanged = not_modified(request, response, conversation_etag(conversation, current_user))
+    if unchanged:
+        return unchanged
+    return await async_operations.load_conversation_details(db, conversation)
+
+
+@router.post("/conversations/{conversation_id}/read", response_model=schemas.ConversationSummary, tags=["Conversations"])
+async def mark_conversation_read(
+    conversation_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Mark a conversation as read by the current user (resets their unread count)"""
+    _check_conversation_access(await async_operations.get_conversation_by_id(db, conversation_id), current_user)
+    return await async_operations.mark_conversation_read(db, conversation_id, current_user.id)
+
+
+@router.put("/conversations/{conversation_id}/assign-doctor", response_model=schemas.ConversationResponse, tags=["Conversations"])
+async def assign_doctor(
+    conversation_id: str,
+    assignment: schemas.DoctorAssignment,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Assign a doctor to a conversation (admin only, or patient can assign)"""
+    conversation = await async_operations.get_conversation_by_id(db, conversation_id)
+
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+
+    # Only patient or admin can assign doctor
+    if current_user.role == models.UserRole.PATIENT:
+        if conversation.patient_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+    elif current_user.role != models.UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only patient or admin can assign doctors"
+        )
+
+    doctor = await async_operations.get_user_by_id(db, assignment.doctor_id)
+    if not doctor or doctor.role != models.UserRole.DOCTOR:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid doctor ID"
+        )
+
+    return await async_operations.assign_doctor_to_conversation(db, conversation_id, assignment.doctor_id)
+
+
+@router.delete('/conversations/{conversation_id}/remove-doctor', response_model=schemas.ConversationResponse, tags=["Conversations"])
+async def remove_doctor(
+    conversation_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    conversation = await async_operations.get_conversation_by_id(db, conversation_id)
+
+    if not conversation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Conversation not found"
+        )
+
+    if not conversation.doctor_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Doctor not assigned yet"
+        )
+
+    return await async_operations.remove_doctor_from_conversation(db, conversation_id)
+
+
+# ============= MESSAGE ENDPOINTS =============
+
+@router.post("/conversations/{conversation_id}/messages", response_model=schemas.MessageResponse, tags=["Messages"])
+async def create_message(
+    conversation_id: str,
+    message_data: schemas.MessageCreate,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Add a message to a conversation"""
+    conversation = await async_operations.get_conversation_by_id(db, conversation_id)
+    _check_conversation_access(conversation, current_user)
+
+    role_map = {
+        "user": models.MessageRole.USER,
+        "assistant": models.MessageRole.ASSISTANT,
+        "system": models.MessageRole.SYSTEM
+    }
+
+    return await async_operations.create_message(
+        db=db,
+        conversation_id=conversation_id,
+        sender_id=current_user.id,
+        role=role_map.get(message_data.role, models.MessageRole.USER),
+        content=message_data.content
+    )
+
+
+@router.post("/conversations/{conversation_id}/messages:batch", response_model=List[schemas.MessageResponse], tags=["Messages"])
+async def create_messages(
+    conversation_id: str,
+    batch: schemas.MessageBatchCreate,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Add several messages to a conversation in one transaction (see the sync route)"""
+    conversation = await async_operations.get_conversation_by_id(db, conversation_id)
+    _check_conversation_access(conversation, current_user)
+
+    return await async_operations.create_messages(
+        db=db,
+        conversation_id=conversation_id,
+        sender_id=current_user.id,
+        messages=[(models.MessageRole(message.role), message.content) for message in batch.messages]
+    )
+
+
+@router.get("/conversations/{conversation_id}/messages", response_model=schemas.MessagePage, tags=["Messages"])
+async def get_messages(
+    conversation_id: str,
+    request: Request,
+    response: Response,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db),
+    before: Optional[int] = Query(default=None, description="Return messages older than this message id"),
+    after: Optional[int] = Query(default=None, description="Return messages newer than this message id"),
+    page_size: int = Query(default=MESSAGE_PAGE_SIZE, ge=1, le=MESSAGE_PAGE_MAX_SIZE)
+):
+    """Get a page of messages in a conversation, oldest first (see the sync route)"""
+    if before is not None and after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either before or after, not both"
+        )
+
+    conversation = await async_operations.get_conversation_by_id(db, conversation_id)
+    _check_conversation_access(conversation, current_user)
+
+    etag = conversation_etag(conversation, current_user, "messages", before, after, page_size)
+    unchanged = not_modified(request, response, etag)
+    if unchanged:
+        return unchanged
+
+    page = await async_operations.get_messages_page(db, conversation_id, page_size, before=before, after=after)
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid message cursor"
+        )
+    messages, next_cursor = page
+    return {"messages": messages, "next_cursor": next_cursor, "has_more": next_cursor is not None}
+
+
+# ============= SEARCH ENDPOINTS =============
+
+@router.get("/search", response_model=schemas.SearchResponse, tags=["Search"])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    page: int = Query(default=1, ge=1),
+    page_size: int = Query(default=SEARCH_PAGE_SIZE, ge=1, le=SEARCH_PAGE_MAX_SIZE),
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Search the messages and prediagnoses of the conversations the user can open, best match first.
+    Every word of `q` must match (with stemming); snippets mark the matches in **bold**.
+    """
+    found = await async_operations.search(db, q, current_user.id, current_user.role, page, page_size)
+    if found is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Search is only available on SQLite"
+        )
+    results, next_page = found
+    return {"results": results, "next_page": next_page}
+
+
+# ============= PREDIAGNOSIS ENDPOINTS =============
+
+@router.post(
+    "/prediagnosis/jobs",
+    response_model=schemas.PrediagnosisJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Prediagnosis"]
+)
+async def create_prediagnosis_job(
+    request: schemas.PrediagnosisRequest,
+    current_user: Principal = Depends(get_current_patient),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue a prediagnosis to be generated in the background (patients only). Poll the job for the result"""
+    if request.conversation_id:
+        conversation = await async_operations.get_conversation_by_id(db, request.conversation_id)
+        if not conversation or conversation.patient_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Conversation not found"
+            )
+
+    symptoms = symptom_vocabulary.dedupe(request.symptoms)
+    if not symptoms:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="At least one symptom is required"
+        )
+
+    if not prediagnosis_jobs.accepting():
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+    job = await async_operations.create_prediagnosis_job(
+        db=db,
+        patient_id=current_user.id,
+        symptoms=symptoms,
+        conversation_id=request.conversation_id
+    )
+    prediagnosis_jobs.enqueue(job.id)
+
+    return job
+
+
+@router.get("/prediagnosis/jobs/{job_id}", response_model=schemas.PrediagnosisJobResponse, tags=["Prediagnosis"])
+async def get_prediagnosis_job(
+    job_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the status of a background prediagnosis job, with the prediagnosis once done"""
+    job = await async_operations.get_prediagnosis_job(db, job_id)
+
+    # Patients can only see their own jobs
+    if not job or (current_user.role != models.UserRole.ADMIN and job.patient_id != current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+
+    return job
+
+
+@router.get("/prediagnosis/my", response_model=List[schemas.PrediagnosisResponse], tags=["Prediagnosis"])
+async def get_my_prediagnoses(
+    current_user: Principal = Depends(get_current_patient),
+    db: AsyncSession = Depends(get_db),
+    limit: int = 10
+):
+    """Get all prediagnoses for the current patient"""
+    return await async_operations.get_patient_prediagnoses(db, current_user.id, limit)
+
+
+@router.get("/conversations/{conversation_id}/prediagnosis", response_model=schemas.PrediagnosisResponse, tags=["Prediagnosis"])
+async def get_conversation_prediagnosis(
+    conversation_id: str,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the prediagnosis for a specific conversation"""
+    conversation = await async_operations.get_conversation_by_id(db, conversation_id)
+    _check_conversation_access(conversation, current_user)
+
+    prediagnosis = await async_operations.get_prediagnosis_by_conversation(db, conversation_id)
+
+    if not prediagnosis:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No prediagnosis found for this conversation"
+        )
+
+    return prediagnosis
+
+
+# ============= ADMIN ENDPOINTS =============
+
+@router.get("/admin/llm-usage", response_model=List[schemas.LLMUsageSummary], tags=["Admin"])
+async def get_llm_usage(
+    since: Optional[datetime] = None,
+    current_user: Principal = Depends(get_current_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    """Aggregate LLM token usage (including prompt-cache reads/writes) per purpose and model (admin only)"""
+    return await async_operations.get_llm_usage_summary(db, since)
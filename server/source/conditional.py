@@ -0,0 +1,62 @@
+"""
+Weak ETags for conditional GETs: a client that sends back the ETag of its copy in
+If-None-Match gets 304 Not Modified with no body.
+Validators are built from values that change whenever the response would, such as
+a conversation's updated_at (bumped by every writer) and its denormalized counters,
+and include the caller, so one user's copy never validates for another.
+"""
+import hashlib
+from typing import List, Optional
+
+from fastapi import Request, Response, status
+
+from .database import models
+from .database.principals import Principal
+
+
+def weak_etag(*parts) -> str:
+    digest = hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def conversation_etag(conversation: models.Conversation, principal: Principal, *extra) -> str:
+    """Validator for responses built from a conversation and its messages/prediagnoses"""
+    return weak_etag(
+        principal.id, principal.role.value, conversation.id, conversation.updated_at,
+        conversation.message_count, conversation.latest_prediagnosis_id, *extra
+    )
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison (RFC 9110): the W/ prefix is ignored on both sides"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Put the validator on `response`. Returns a 304 response to send instead when the
+    client's copy is current, else None.
+    """
+    response.headers["ETag"] = etag
+    # Browsers keep the response but revalidate it on every use
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["Vary"] = "Authorization"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=dict(response.headers))
+    return None
+
+
+def inbox_etag(conversations: List[models.Conversation], principal: Principal, limit: int) -> str:
+    """
+    Validator for an inbox page, from the rows already read. updated_at covers every
+    change except the unread counts, which marking a conversation read resets alone.
+    """
+    return weak_etag(principal.id, principal.role.value, limit, *(
+        (conversation.id, conversation.updated_at, conversation.patient_unread_count, conversation.doctor_unread_count)
+        for conversation in conversations
+    ))
@@ -0,0 +1,676 @@
+"""
+AsyncSession versions of every function in operations.py (same names, same arguments).
+Relationships that responses serialize are eager-loaded here, since lazy loading
+is not available on an AsyncSession.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, func, tuple_, insert, or_, and_
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import datetime, timedelta
+from . import models
+from .operations import MESSAGE_PAGE_SIZE, SEARCH_PAGE_SIZE, SEARCH_SNIPPET_TOKENS, update_conversation_summary, search_statement, fts_query
+from .principals import principal_cache
+from . import notifications
+from typing import Optional, List, Tuple
+import uuid
+
+
+# ============= USER OPERATIONS =============
+
+async def create_user(
+    db: AsyncSession,
+    name: str,
+    email: str,
+    hashed_password: str,
+    role: models.UserRole = models.UserRole.PATIENT,
+    medical_history: Optional[dict] = None
+) -> models.User:
+    """Create a new user (patient, doctor, or admin)"""
+    db_user = models.User(
+        name=name,
+        email=email,
+        hashed_password=hashed_password,
+        role=role,
+        medical_history=medical_history
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[models.User]:
+    """Get user by email (for login)"""
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[models.User]:
+    """Get user by ID"""
+    return await db.get(models.User, user_id)
+
+
+async def update_user_medical_history(db: AsyncSession, user_id: int, medical_history: dict) -> models.User:
+    """Update patient's medical history"""
+    user = await get_user_by_id(db, user_id)
+    if user:
+        user.medical_history = medical_history
+        await db.commit()
+        principal_cache.invalidate(user_id)
+        await db.refresh(user)
+    return user
+
+
+async def update_user_role(db: AsyncSession, user_id: int, role: models.UserRole) -> models.User:
+    """Change a user's role. Bumps token_version (see principals.py), so tokens carrying the old role stop working"""
+    user = await get_user_by_id(db, user_id)
+    if user:
+        user.role = role
+        await db.commit()
+        principal_cache.invalidate(user_id)
+        await db.refresh(user)
+    return user
+
+
+async def revoke_user_tokens(db: AsyncSession, user_id: int) -> models.User:
+    """Invalidate every access token issued to a user so far"""
+    user = await get_user_by_id(db, user_id)
+    if user:
+        user.token_version = (user.token_version or 0) + 1
+        await db.commit()
+        principal_cache.invalidate(user_id)
+        await db.refresh(user)
+    return user
+
+
+# ============= CONVERSATION OPERATIONS =============
+
+async def create_conversation(
+    db: AsyncSession,
+    patient_id: int,
+    title: str = "New Conversation",
+    doctor_id: Optional[int] = None
+) -> models.Conversation:
+    """Create a new conversation for a patient"""
+    conversation_id = str(uuid.uuid4())
+    db_conversation = models.Conversation(
+        id=conversation_id,
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        title=title
+    )
+    db.add(db_conversation)
+    await db.commit()
+    await db.refresh(db_conversation)
+    return db_conversation
+
+
+async def get_conversation_by_id(db: AsyncSession, conversation_id: str) -> Optional[models.Conversation]:
+    """Get conversation by ID (served from the session's identity map if it was already loaded)"""
+    return await db.get(models.Conversation, conversation_id)
+
+
+async def load_conversation_details(db: AsyncSession, conversation: models.Conversation) -> models.Conversation:
+    """Load a conversation's messages and prediagnoses onto it, oldest first (two queries, whatever their size)"""
+    messages = await db.execute(
+        select(models.Message)
+        .where(models.Message.conversation_id == conversation.id)
+        .order_by(models.Message.created_at.asc(), models.Message.id.asc())
+    )
+    pre_diagnoses = await db.execute(
+        select(models.PreDiagnosis)
+        .where(models.PreDiagnosis.conversation_id == conversation.id)
+        .order_by(models.PreDiagnosis.created_at.asc())
+    )
+    set_committed_value(conversation, "messages", list(messages.scalars().all()))
+    set_committed_value(conversation, "pre_diagnoses", list(pre_diagnoses.scalars().all()))
+    return conversation
+
+
+async def get_user_conversations(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = 50,
+    role: models.UserRole = models.UserRole.PATIENT
+) -> List[models.Conversation]:
+    """A user's inbox, most recently active first: a doctor's assigned conversations, or a patient's own"""
+    owner = models.Conversation.doctor_id if role == models.UserRole.DOCTOR else models.Conversation.patient_id
+    result = await db.execute(
+        select(models.Conversation)
+        .where(owner == user_id)
+        .order_by(models.Conversation.updated_at.desc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+async def mark_conversation_read(db: AsyncSession, conversation_id: str, user_id: int) -> Optional[models.Conversation]:
+    """Reset the user's unread count on a conversation"""
+    conversation = await get_conversation_by_id(db, conversation_id)
+    if conversation:
+        if user_id == conversation.patient_id:
+            conversation.patient_unread_count = 0
+        if user_id == conversation.doctor_id:
+            conversation.doctor_unread_count = 0
+        # Reading isn't activity: keep updated_at (and the inbox order) instead of letting onupdate bump it
+        conversation.updated_at = models.Conversation.updated_at
+        await db.commit()
+        await db.refresh(conversation)
+    return conversation
+
+
+async def assign_doctor_to_conversation(db: AsyncSession, conversation_id: str, doctor_id: int) -> models.Conversation:
+    """Assign a doctor to a conversation"""
+    conversation = await get_conversation_by_id(db, conversation_id)
+    if conversation:
+        conversation.doctor_id = doctor_id
+        conversation.updated_at = datetime.now()
+        await db.commit()
+        await db.refresh(conversation)
+    return conversation
+
+
+async def remove_doctor_from_conversation(db: AsyncSession, conversation_id: str) -> models.Conversation:
+    conversation = await get_conversation_by_id(db=db, conversation_id=conversation_id)
+
+    if conversation and conversation.doctor_id:
+        conversation.doctor_id = None
+        conversation.updated_at = datetime.now()
+        await db.commit()
+        await db.refresh(conversation)
+    return conversation
+
+
+async def update_conversation_title(db: AsyncSession, conversation_id: str, title: str) -> models.Conversation:
+    """Update conversation title"""
+    conversation = await get_conversation_by_id(db, conversation_id)
+    if conversation:
+        conversation.title = title
+        conversation.updated_at = datetime.now()
+        await db.commit()
+        await db.refresh(conversation)
+    return conversation
+
+
+# ============= MESSAGE OPERATIONS =============
+
+async def create_message(
+    db: AsyncSession,
+    conversation_id: str,
+    sender_id: int,
+    role: models.MessageRole,
+    content: str
+) -> models.Message:
+    """Add a message to a conversation"""
+    now = datetime.now()
+    db_message = models.Message(
+        conversation_id=conversation_id,
+        sender_id=sender_id,
+        role=role,
+        content=content,
+        created_at=now
+    )
+    db.add(db_message)
+
+    # Update conversation timestamp and summary
+    conversation = await get_conversation_by_id(db, conversation_id)
+    if conversation:
+        update_conversation_summary(conversation, sender_id, [content], now)
+
+    await db.commit()
+    await db.refresh(db_message)
+    return db_message
+
+
+async def create_messages(
+    db: AsyncSession,
+    conversation_id: str,
+    sender_id: int,
+    messages: List[Tuple[models.MessageRole, str]]
+) -> List[Row]:
+    """
+    Add several messages to a conversation, in order, with one INSERT and one commit.
+    Returns the inserted rows as read back by RETURNING, so nothing is reloaded afterwards.
+    """
+    now = datetime.now()  # one timestamp for the batch; ids keep the order
+    result = await db.execute(
+        insert(models.Message).returning(*models.Message.__table__.columns),
+        [
+            {"conversation_id": conversation_id, "sender_id": sender_id, "role": role, "content": content, "created_at": now}
+            for role, content in messages
+        ]
+    )
+    rows = sorted(result.all(), key=lambda row: row.id)  # one statement assigns ids in VALUES order
+    for row in rows:
+        notifications.queue(db.sync_session, "message", row._asdict())  # bulk INSERT skips the mapper events
+
+    # Update conversation timestamp and summary once for the whole batch
+    conversation = await get_conversation_by_id(db, conversation_id)
+    if conversation:
+        update_conversation_summary(conversation, sender_id, [content for _, content in messages], now)
+
+    await db.commit()
+    return rows
+
+
+async def get_conversation_messages(
+    db: AsyncSession,
+    conversation_id: str,
+    limit: Optional[int] = None
+) -> List[models.Message]:
+    """Get all messages in a conversation"""
+    query = select(models.Message)\
+        .where(models.Message.conversation_id == conversation_id)\
+        .order_by(models.Message.created_at.asc())
+
+    if limit:
+        query = query.limit(limit)
+
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+
+async def get_messages_page(
+    db: AsyncSession,
+    conversation_id: str,
+    page_size: int = MESSAGE_PAGE_SIZE,
+    before: Optional[int] = None,
+    after: Optional[int] = None
+) -> Optional[Tuple[List[models.Message], Optional[int]]]:
+    """
+    One page of a conversation's messages, oldest first.
+    Keyset pagination on (conversation_id, created_at, id): every page is a single index
+    range scan, however long the conversation is. `before`/`after` are message ids; with
+    neither, the latest page is returned. Returns (messages, next_cursor), where next_cursor
+    continues in the same direction (None when there is nothing more), or None if the
+    cursor message is not in the conversation.
+    """
+    query = select(models.Message).where(models.Message.conversation_id == conversation_id)
+    position = tuple_(models.Message.created_at, models.Message.id)
+
+    cursor_id = after if after is not None else before
+    if cursor_id is not None:
+        result = await db.execute(
+            select(models.Message.created_at, models.Message.id)
+            .where(models.Message.id == cursor_id, models.Message.conversation_id == conversation_id)
+        )
+        cursor = result.first()
+        if cursor is None:
+            return None
+        cursor_position = tuple_(cursor.created_at, cursor.id)
+        query = query.where(position > cursor_position if after is not None else position < cursor_position)
+
+    # Fetch one extra row to know whether another page follows
+    if after is not None:
+        result = await db.execute(
+            query.order_by(models.Message.created_at.asc(), models.Message.id.asc()).limit(page_size + 1)
+        )
+        rows = list(result.scalars().all())
+        page = rows[:page_size]
+        return page, (page[-1].id if len(rows) > page_size else None)
+
+    result = await db.execute(
+        query.order_by(models.Message.created_at.desc(), models.Message.id.desc()).limit(page_size + 1)
+    )
+    rows = list(result.scalars().all())
+    page = rows[:page_size][::-1]
+    return page, (page[0].id if len(rows) > page_size else None)
+
+
+async def get_latest_messages(db: AsyncSession, conversation_id: str, count: int = 10) -> List[models.Message]:
+    """Get the latest N messages from a conversation, oldest first (the tail page)"""
+    messages, _ = await get_messages_page(db, conversation_id, page_size=count)
+    return messages
+
+
+# ============= PREDIAGNOSIS OPERATIONS =============
+
+async def create_prediagnosis(
+    db: AsyncSession,
+    conversation_id: str,
+    patient_id: int,
+    doctor_id: int,
+    potential_diseases: str,
+    course_of_action: str,
+    therapy_message: Optional[str] = None,
+    recommended_practitioners: Optional[str] = None
+) -> models.PreDiagnosis:
+    """Create a pre-diagnosis for a conversation"""
+    db_prediagnosis = models.PreDiagnosis(
+        conversation_id=conversation_id,
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        potential_diseases=potential_diseases,
+        course_of_action=course_of_action,
+        support_messages=therapy_message,
+        recommended_practitioners=recommended_practitioners
+    )
+    db.add(db_prediagnosis)
+    await db.flush()  # assigns the id for the conversation summary
+
+    conversation = await get_conversation_by_id(db, conversation_id)
+    if conversation:
+        conversation.latest_prediagnosis_id = db_prediagnosis.id
+        conversation.updated_at = db_prediagnosis.created_at
+
+    await db.commit()
+    await db.refresh(db_prediagnosis)
+    return db_prediagnosis
+
+
+async def create_ai_prediagnosis(
+    db: AsyncSession,
+    patient_id: int,
+    symptoms: List[str],
+    ai_result: dict,
+    conversation_id: Optional[str] = None
+) -> models.PreDiagnosis:
+    """Store an AI-generated prediagnosis, opening a new conversation for it if none is given"""
+    if not conversation_id:
+        conversation = await create_conversation(
+            db=db,
+            patient_id=patient_id,
+            title=f"Symptoms: {', '.join(symptoms[:3])}"
+        )
+        conversation_id = conversation.id
+
+    # Note: doctor_id is set to patient_id for now since it's AI-generated
+    return await create_prediagnosis(
+        db=db,
+        conversation_id=conversation_id,
+        patient_id=patient_id,
+        doctor_id=patient_id,  # Temporary: AI-generated
+        potential_diseases=ai_result["potential_diseases"],
+        course_of_action=ai_result["course_of_action"],
+        therapy_message=ai_result.get("support_messages"),
+        recommended_practitioners=ai_result.get("recommended_practitioners")
+    )
+
+
+async def get_prediagnosis_by_conversation(db: AsyncSession, conversation_id: str) -> Optional[models.PreDiagnosis]:
+    """Get the pre-diagnosis for a conversation"""
+    result = await db.execute(
+        select(models.PreDiagnosis)
+        .where(models.PreDiagnosis.conversation_id == conversation_id)
+        .order_by(models.PreDiagnosis.created_at.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+
+async def get_all_prediagnoses_by_conversation(db: AsyncSession, conversation_id: str) -> List[models.PreDiagnosis]:
+    """Get all pre-diagnoses for a conversation (in case of multiple)"""
+    result = await db.execute(
+        select(models.PreDiagnosis)
+        .where(models.PreDiagnosis.conversation_id == conversation_id)
+        .order_by(models.PreDiagnosis.created_at.desc())
+    )
+    return list(result.scalars().all())
+
+
+async def update_prediagnosis(
+    db: AsyncSession,
+    prediagnosis_id: int,
+    potential_diseases: Optional[str] = None,
+    course_of_action: Optional[str] = None,
+    therapy_message: Optional[str] = None,
+    recommended_practitioners: Optional[str] = None
+) -> models.PreDiagnosis:
+    """Update a pre-diagnosis"""
+    prediagnosis = await db.get(models.PreDiagnosis, prediagnosis_id)
+
+    if prediagnosis:
+        if potential_diseases is not None:
+            prediagnosis.potential_diseases = potential_diseases
+        if course_of_action is not None:
+            prediagnosis.course_of_action = course_of_action
+        if therapy_message is not None:
+            prediagnosis.support_messages = therapy_message
+        if recommended_practitioners is not None:
+            prediagnosis.recommended_practitioners = recommended_practitioners
+
+        # Conversation reads are validated by its updated_at (see conditional.py)
+        conversation = await get_conversation_by_id(db, prediagnosis.conversation_id)
+        if conversation:
+            conversation.updated_at = datetime.now()
+
+        await db.commit()
+        await db.refresh(prediagnosis)
+
+    return prediagnosis
+
+
+async def get_patient_prediagnoses(db: AsyncSession, patient_id: int, limit: int = 10) -> List[models.PreDiagnosis]:
+    """Get all pre-diagnoses for a patient"""
+    result = await db.execute(
+        select(models.PreDiagnosis)
+        .where(models.PreDiagnosis.patient_id == patient_id)
+        .order_by(models.PreDiagnosis.created_at.desc())
+        .limit(limit)
+    )
+    return list(result.scalars().all())
+
+
+# ============= SEARCH OPERATIONS =============
+
+async def search(
+    db: AsyncSession,
+    q: str,
+    user_id: int,
+    role: models.UserRole,
+    page: int = 1,
+    page_size: int = SEARCH_PAGE_SIZE
+) -> Optional[Tuple[List[dict], Optional[int]]]:
+    """
+    Full-text search over the messages and prediagnoses the user can access, best match first.
+    Returns (results, next_page), or None when the database has no search index (not SQLite).
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return None
+    query = fts_query(q, user_id, role)
+    if query is None:
+        return [], None
+
+    result = await db.execute(search_statement(role), {
+        "query": query, "user_id": user_id, "snippet_tokens": SEARCH_SNIPPET_TOKENS,
+        "limit": page_size + 1, "offset": (page - 1) * page_size,
+    })
+    rows = result.mappings().all()
+    results = [dict(row) for row in rows[:page_size]]
+    return results, (page + 1 if len(rows) > page_size else None)
+
+
+# ============= PREDIAGNOSIS JOB OPERATIONS =============
+
+async def create_prediagnosis_job(
+    db: AsyncSession,
+    patient_id: int,
+    symptoms: List[str],
+    conversation_id: Optional[str] = None
+) -> models.PrediagnosisJob:
+    """Queue a background prediagnosis job"""
+    db_job = models.PrediagnosisJob(
+        id=str(uuid.uuid4()),
+        patient_id=patient_id,
+        conversation_id=conversation_id,
+        symptoms=symptoms,
+        status=models.JobStatus.QUEUED
+    )
+    db.add(db_job)
+    await db.commit()
+    await db.refresh(db_job)
+    # A new job has no prediagnosis yet; mark it loaded so serializing never lazy-loads
+    set_committed_value(db_job, "prediagnosis", None)
+    return db_job
+
+
+async def get_prediagnosis_job(db: AsyncSession, job_id: str) -> Optional[models.PrediagnosisJob]:
+    """Get a prediagnosis job by ID, with its prediagnosis loaded"""
+    result = await db.execute(
+        select(models.PrediagnosisJob)
+        .where(models.PrediagnosisJob.id == job_id)
+        .options(selectinload(models.PrediagnosisJob.prediagnosis))
+    )
+    return result.scalars().first()
+
+
+async def get_pending_prediagnosis_jobs(db: AsyncSession, queued_before: Optional[datetime] = None) -> List[models.PrediagnosisJob]:
+    """Jobs to (re)queue, oldest first: queued ones and running ones whose lease has expired"""
+    Job = models.PrediagnosisJob
+    queued = select(Job).where(Job.status == models.JobStatus.QUEUED)
+    if queued_before is not None:
+        queued = queued.where(Job.created_at < queued_before)
+    abandoned = select(Job).where(
+        Job.status == models.JobStatus.RUNNING,
+        or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < datetime.now()),
+    )
+    jobs = []
+    for statement in (queued, abandoned):
+        jobs += (await db.execute(statement.order_by(Job.created_at.asc()))).scalars().all()
+    return sorted(jobs, key=lambda job: job.created_at)
+
+
+async def claim_prediagnosis_job(db: AsyncSession, job_id: str, lease_seconds: float) -> Optional[models.PrediagnosisJob]:
+    """
+    Move a queued job (or a running one whose lease expired) to running in one conditional
+    UPDATE. Returns None when another worker claimed it first or it has finished.
+    """
+    Job = models.PrediagnosisJob
+    now = datetime.now()
+    result = await db.execute(
+        update(Job)
+        .where(
+            Job.id == job_id,
+            or_(
+                Job.status == models.JobStatus.QUEUED,
+                and_(
+                    Job.status == models.JobStatus.RUNNING,
+                    or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < now),
+                ),
+            ),
+        )
+        .values(
+            status=models.JobStatus.RUNNING,
+            attempts=func.coalesce(Job.attempts, 0) + 1,
+            started_at=now,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            error=None,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return await get_prediagnosis_job(db, job_id) if result.rowcount else None
+
+
+async def renew_prediagnosis_job_lease(db: AsyncSession, job_id: str, attempt: int, lease_seconds: float) -> bool:
+    """Extend the lease of the running `attempt` of a job; False if it has been reclaimed since"""
+    Job = models.PrediagnosisJob
+    result = await db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == models.JobStatus.RUNNING, Job.attempts == attempt)
+        .values(lease_expires_at=datetime.now() + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def _finish_prediagnosis_job(
+    db: AsyncSession, job_id: str, attempt: int, values: dict
+) -> Optional[models.PrediagnosisJob]:
+    """Finish the running `attempt` of a job in one conditional UPDATE; None if it has been reclaimed since"""
+    Job = models.PrediagnosisJob
+    result = await db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == models.JobStatus.RUNNING, Job.attempts == attempt)
+        .values(**values, finished_at=datetime.now())
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return await get_prediagnosis_job(db, job_id) if result.rowcount else None
+
+
+async def mark_prediagnosis_job_done(
+    db: AsyncSession,
+    job_id: str,
+    attempt: int,
+    prediagnosis_id: int,
+    conversation_id: str
+) -> Optional[models.PrediagnosisJob]:
+    """Mark a job's running `attempt` as done and link the stored prediagnosis; None if it was reclaimed"""
+    return await _finish_prediagnosis_job(db, job_id, attempt, {
+        "status": models.JobStatus.DONE,
+        "prediagnosis_id": prediagnosis_id,
+        "conversation_id": conversation_id,
+    })
+
+
+async def mark_prediagnosis_job_failed(
+    db: AsyncSession, job_id: str, attempt: int, error: str
+) -> Optional[models.PrediagnosisJob]:
+    """Mark a job's running `attempt` as failed with an error message; None if it was reclaimed"""
+    return await _finish_prediagnosis_job(db, job_id, attempt, {"status": models.JobStatus.FAILED, "error": error})
+
+
+# ============= LLM USAGE OPERATIONS =============
+
+async def create_llm_usage(
+    db: AsyncSession,
+    purpose: str,
+    model: str,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    cache_read_input_tokens: int = 0,
+    cache_creation_input_tokens: int = 0,
+    latency_ms: Optional[float] = None
+) -> models.LLMUsage:
+    """Record the token usage of one LLM call"""
+    db_usage = models.LLMUsage(
+        purpose=purpose,
+        model=model,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cache_read_input_tokens=cache_read_input_tokens,
+        cache_creation_input_tokens=cache_creation_input_tokens,
+        latency_ms=latency_ms
+    )
+    db.add(db_usage)
+    await db.commit()
+    return db_usage
+
+
+async def get_llm_usage_summary(db: AsyncSession, since: Optional[datetime] = None) -> List[dict]:
+    """Aggregate LLM token usage per purpose and model"""
+    query = select(
+        models.LLMUsage.purpose,
+        models.LLMUsage.model,
+        func.count(models.LLMUsage.id),
+        func.sum(models.LLMUsage.input_tokens),
+        func.sum(models.LLMUsage.output_tokens),
+        func.sum(models.LLMUsage.cache_read_input_tokens),
+        func.sum(models.LLMUsage.cache_creation_input_tokens),
+        func.avg(models.LLMUsage.latency_ms)
+    )
+    if since is not None:
+        query = query.where(models.LLMUsage.created_at >= since)
+
+    result = await db.execute(
+        query.group_by(models.LLMUsage.purpose, models.LLMUsage.model)
+        .order_by(models.LLMUsage.purpose, models.LLMUsage.model)
+    )
+
+    return [
+        {
+            "purpose": purpose,
+            "model": model,
+            "calls": calls,
+            "input_tokens": input_tokens or 0,
+            "output_tokens": output_tokens or 0,
+            "cache_read_input_tokens": cache_read or 0,
+            "cache_creation_input_tokens": cache_write or 0,
+            "avg_latency_ms": avg_latency
+        }
+        for purpose, model, calls, input_tokens, output_tokens, cache_read, cache_write, avg_latency in result.all()
+    ]
@@ -0,0 +1,19 @@
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .config import build_async_engine
+from ..metrics import SessionTimer, instrument_engine
+
+# Same database as models.engine, reached through the async driver.
+# The schema comes from the migrations, run at app startup.
+async_engine = build_async_engine()
+instrument_engine(async_engine.sync_engine, "async")
+
+# Session factory. Objects stay loaded after commit so reading them never triggers lazy IO
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+# Dependency for FastAPI
+async def get_db():
+    with SessionTimer("async"):
+        async with AsyncSessionLocal() as db:
+            yield db
@@ -1,11 +1,13 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from passlib.context import CryptContext
 import jwt
 import os
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
-from . import models, operations
+from . import models, operations, async_operations
+from .principals import Principal, principal_cache
+from .hashing import password_hasher
 
 load_dotenv()
 
@@ -14,31 +16,30 @@ SECRET_KEY = os.getenv('SECRET_KEY')  # Change in production!
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 # ============= PASSWORD FUNCTIONS =============
+# bcrypt runs in the hashing process pool (see hashing.py); these raise PasswordHasherBusy when it is saturated
 
 def hash_password(password: str) -> str:
     """Hash a plain password"""
-    return pwd_context.hash(password)
+    return password_hasher.hash_sync(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify_sync(plain_password, hashed_password)
 
 
 # ============= JWT TOKEN FUNCTIONS =============
 
-def create_access_token(user_id: int, email: str, role: str) -> str:
+def create_access_token(user_id: int, email: str, role: str, token_version: int = 0) -> str:
     """Create a JWT access token"""
     expire = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode = {
         "sub": str(user_id),  # subject (user ID)
         "email": email,
         "role": role,
+        "ver": token_version,  # must match users.token_version (see get_principal_from_token)
         "exp": expire
     }
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
@@ -61,7 +62,36 @@ def get_user_from_token(db: Session, token: str) -> Optional[models.User]:
         return None
 
     user_id = int(payload.get("sub"))
-    return operations.get_user_by_id(db, user_id)
+    user = operations.get_user_by_id(db, user_id)
+    # Tokens issued before a role change or revocation are rejected
+    if user and (user.token_version or 0) != int(payload.get("ver", 0)):
+        return None
+    return user
+
+
+def get_principal_from_token(db: Session, token: str) -> Optional[Principal]:
+    """
+    Authorize from the verified token claims alone.
+    The claims are only trusted at the user's current token version (from the user cache,
+    or one SELECT on a miss): a role change or revocation bumps it, invalidating older tokens.
+    """
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    claims = Principal.from_claims(payload)
+    if claims is None:
+        return None
+
+    current = principal_cache.get(claims.id)
+    if current is None:
+        generation = principal_cache.generation
+        user = operations.get_user_by_id(db, claims.id)
+        if not user:
+            return None
+        current = Principal.from_user(user)
+        principal_cache.set(current, generation)
+
+    return claims if current.token_version == claims.token_version else None
 
 
 # ============= AUTHENTICATION FUNCTIONS =============
@@ -102,11 +132,16 @@ def login(db: Session, email: str, password: str) -> Optional[dict]:
     user = authenticate_user(db, email, password)
     if not user:
         return None
+    return token_response(user)
+
 
+def token_response(user: models.User) -> dict:
+    """Access token + user info returned by login"""
     token = create_access_token(
         user_id=user.id,
         email=user.email,
-        role=user.role.value
+        role=user.role.value,
+        token_version=user.token_version or 0
     )
 
     return {
@@ -119,3 +154,76 @@ def login(db: Session, email: str, password: str) -> Optional[dict]:
             "role": user.role.value
         }
     }
+
+
+# ============= ASYNC VARIANTS (AsyncSession) =============
+
+async def get_user_from_token_async(db: AsyncSession, token: str) -> Optional[models.User]:
+    """Extract user from JWT token"""
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+
+    user_id = int(payload.get("sub"))
+    user = await async_operations.get_user_by_id(db, user_id)
+    # Tokens issued before a role change or revocation are rejected
+    if user and (user.token_version or 0) != int(payload.get("ver", 0)):
+        return None
+    return user
+
+
+async def get_principal_from_token_async(db: AsyncSession, token: str) -> Optional[Principal]:
+    """Authorize from the verified token claims alone (see get_principal_from_token)"""
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    claims = Principal.from_claims(payload)
+    if claims is None:
+        return None
+
+    current = principal_cache.get(claims.id)
+    if current is None:
+        generation = principal_cache.generation
+        user = await async_operations.get_user_by_id(db, claims.id)
+        if not user:
+            return None
+        current = Principal.from_user(user)
+        principal_cache.set(current, generation)
+
+    return claims if current.token_version == claims.token_version else None
+
+
+async def authenticate_user_async(db: AsyncSession, email: str, password: str) -> Optional[models.User]:
+    """Authenticate a user with email and password. Returns user if valid, None otherwise"""
+    user = await async_operations.get_user_by_email(db, email)
+    if not user:
+        return None
+    if not await password_hasher.verify(password, user.hashed_password):
+        return None
+    return user
+
+
+async def register_user_async(
+    db: AsyncSession,
+    name: str,
+    email: str,
+    password: str,
+    role: models.UserRole = models.UserRole.PATIENT
+) -> models.User:
+    """Register a new user (hashes password automatically)"""
+    hashed_password = await password_hasher.hash(password)
+    return await async_operations.create_user(
+        db=db,
+        name=name,
+        email=email,
+        hashed_password=hashed_password,
+        role=role
+    )
+
+
+async def login_async(db: AsyncSession, email: str, password: str) -> Optional[dict]:
+    """Login a user and return access token + user info, or None if authentication fails"""
+    user = await authenticate_user_async(db, email, password)
+    if not user:
+        return None
+    return token_response(user)
@@ -0,0 +1,161 @@
+import os
+import asyncio
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import StaticPool
+from starlette.concurrency import run_in_threadpool
+
+load_dotenv()
+
+# Configuration
+DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///database.db')
+DB_ECHO = os.getenv('DB_ECHO', 'false').lower() in ('1', 'true', 'yes')
+DB_ASYNC = os.getenv('DB_ASYNC', 'false').lower() in ('1', 'true', 'yes')  # serve DB routes from source/async_routes.py
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_TIMEOUT_SECONDS', '30'))
+DB_POOL_RECYCLE_SECONDS = int(os.getenv('DB_POOL_RECYCLE_SECONDS', '1800'))
+
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # 256 MB
+
+DB_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv('DB_MAINTENANCE_INTERVAL_SECONDS', '3600'))  # 0 disables
+
+
+def is_sqlite(url: str) -> bool:
+    return url.startswith('sqlite')
+
+
+def is_sqlite_memory(url: str) -> bool:
+    return is_sqlite(url) and (url.endswith(':memory:') or url.rstrip('/') in ('sqlite:', 'sqlite+pysqlite:'))
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Per-connection SQLite tuning: WAL lets readers run alongside the single writer,
+    busy_timeout makes writers wait for the lock instead of failing with 'database is locked'"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    finally:
+        cursor.close()
+
+
+def build_engine(url: Optional[str] = None, echo: bool = DB_ECHO) -> Engine:
+    """Create the application engine from configuration"""
+    url = url or DATABASE_URL
+
+    if is_sqlite_memory(url):
+        # One shared connection, or every session would see its own empty database
+        return create_engine(
+            url,
+            echo=echo,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+
+    options = dict(
+        echo=echo,
+        pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+    )
+    if is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+
+    engine = create_engine(url, **options)
+    if is_sqlite(url):
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+    return engine
+
+
+# Async drivers for the sync URLs we accept
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(url: str) -> str:
+    """Swap a sync driver for its async counterpart (sqlite:///x.db -> sqlite+aiosqlite:///x.db)"""
+    scheme, sep, rest = url.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+def build_async_engine(url: Optional[str] = None, echo: bool = DB_ECHO) -> AsyncEngine:
+    """Create the AsyncSession engine; same pooling and pragmas as build_engine"""
+    url = async_database_url(url or DATABASE_URL)
+
+    if is_sqlite_memory(url):
+        return create_async_engine(url, echo=echo, poolclass=StaticPool)
+
+    engine = create_async_engine(
+        url,
+        echo=echo,
+        pool_pre_ping=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=DB_POOL_RECYCLE_SECONDS,
+    )
+    if is_sqlite(url):
+        event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return engine
+
+
+# ============= MAINTENANCE =============
+
+def run_maintenance(engine: Engine):
+    """Refresh planner statistics and checkpoint the WAL so it doesn't grow without bound"""
+    if not is_sqlite(str(engine.url)):
+        return
+    with engine.connect() as connection:
+        connection.execute(text("PRAGMA optimize"))
+        connection.execute(text("ANALYZE"))
+        connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        connection.commit()
+
+
+class DatabaseMaintenance:
+    """Runs run_maintenance every `interval_seconds` in the background"""
+
+    def __init__(self, engine: Engine, interval_seconds: int = DB_MAINTENANCE_INTERVAL_SECONDS):
+        self.engine = engine
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.interval_seconds > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="database-maintenance")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            # SQLite recommends PRAGMA optimize before closing long-lived connections
+            await run_in_threadpool(self._run)
+
+    def _run(self):
+        try:
+            run_maintenance(self.engine)
+        except Exception as e:
+            print(f"Error running database maintenance: {e}")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            await run_in_threadpool(self._run)
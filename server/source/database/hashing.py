@@ -0,0 +1,154 @@
+"""
+Password hashing service.
+bcrypt is CPU-bound and holds the GIL, so hashes are computed in a pool of worker
+processes: API threads and the event loop only wait on a future. This module is
+imported by the workers, so it must stay free of app/database imports.
+"""
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+# Configuration
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))  # cost factor (2^rounds iterations)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1)))  # 0 hashes in the calling thread
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', '64'))  # waiting hashes beyond the busy workers
+
+# Password hashing
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+
+def hash_password_inline(password: str) -> str:
+    """Hash a plain password in the current process"""
+    return pwd_context.hash(password)
+
+
+def verify_password_inline(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash in the current process"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503"""
+
+
+class PasswordHasher:
+    """
+    Process-pool bcrypt with a bounded queue.
+    At most `workers + queue_size` hashes are pending; beyond that calls fail fast
+    with PasswordHasherBusy instead of piling up behind a login burst.
+    """
+
+    def __init__(self, workers: int, queue_size: int, window: int = 200):
+        self.workers = workers
+        self.max_pending = workers + queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)  # seconds, submit to result
+        self.pending = 0
+        self.max_pending_seen = 0
+        self.completed = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the worker processes (otherwise they start on first use)"""
+        if self.workers > 0:
+            with self._lock:
+                if self._executor is None:
+                    # spawn, not fork: forking a process that runs threads can copy held locks
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn, *args) -> Future:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHasherBusy("Password hashing queue is full")
+            self.pending += 1
+            self.max_pending_seen = max(self.max_pending_seen, self.pending)
+        started = time.perf_counter()
+
+        try:
+            if self.workers > 0:
+                self.start()
+                future = self._executor.submit(fn, *args)
+            else:
+                future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    future.set_exception(e)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+                self.errors += 1
+            raise
+
+        def done(f: Future):
+            with self._lock:
+                self.pending -= 1
+                if f.cancelled() or f.exception() is not None:
+                    self.errors += 1
+                else:
+                    self.completed += 1
+                    self._latencies.append(time.perf_counter() - started)
+
+        future.add_done_callback(done)
+        return future
+
+    # Blocking variants, for sync routes (the calling thread waits without holding the GIL)
+
+    def hash_sync(self, password: str) -> str:
+        return self._submit(hash_password_inline, password).result()
+
+    def verify_sync(self, plain_password: str, hashed_password: str) -> bool:
+        return self._submit(verify_password_inline, plain_password, hashed_password).result()
+
+    # Awaitable variants, for async routes
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(hash_password_inline, password))
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await asyncio.wrap_future(self._submit(verify_password_inline, plain_password, hashed_password))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "workers": self.workers,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "queue_depth": self.pending,
+                "max_queue_depth": self.max_pending_seen,
+                "queue_limit": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "errors": self.errors,
+            }
+
+        def percentile(pct):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(round(pct / 100 * (len(latencies) - 1))))] * 1000
+
+        stats["p50_ms"] = percentile(50)
+        stats["p95_ms"] = percentile(95)
+        return stats
+
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE_SIZE)
@@ -0,0 +1,93 @@
+"""
+Initial schema: the tables as they were created by `Base.metadata.create_all`
+before migrations existed. Tables that already exist are left alone.
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Enum, Float, ForeignKey, Integer, JSON, MetaData, String, Table, Text
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name", String(255), nullable=False),
+    Column("email", String(255), unique=True, nullable=False, index=True),
+    Column("hashed_password", String(255), nullable=False),
+    Column("role", Enum("PATIENT", "DOCTOR", "ADMIN", name="userrole"), nullable=False),
+    Column("medical_history", JSON),
+)
+
+Table(
+    "conversations", metadata,
+    Column("id", String(36), primary_key=True, index=True),
+    Column("patient_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("doctor_id", Integer, ForeignKey("users.id"), nullable=True),
+    Column("title", String(255)),
+    Column("created_at", DateTime, default=datetime.now),
+    Column("updated_at", DateTime, default=datetime.now),
+)
+
+Table(
+    "messages", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("conversation_id", String(36), ForeignKey("conversations.id"), nullable=False),
+    Column("sender_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("role", Enum("USER", "ASSISTANT", "SYSTEM", name="messagerole"), nullable=False),
+    Column("content", Text, nullable=False),
+    Column("created_at", DateTime),
+)
+
+Table(
+    "prediagnoses", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("conversation_id", String(36), ForeignKey("conversations.id"), nullable=False),
+    Column("patient_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("doctor_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("potential_diseases", String),
+    Column("course_of_action", String),
+    Column("support_messages", String),
+    Column("recommended_practitioners", String),
+    Column("created_at", DateTime),
+)
+
+Table(
+    "prediagnosis_jobs", metadata,
+    Column("id", String(36), primary_key=True, index=True),
+    Column("patient_id", Integer, ForeignKey("users.id"), nullable=False, index=True),
+    Column("conversation_id", String(36), ForeignKey("conversations.id"), nullable=True),
+    Column("symptoms", JSON, nullable=False),
+    Column("status", Enum("QUEUED", "RUNNING", "DONE", "FAILED", name="jobstatus"), nullable=False, index=True),
+    Column("attempts", Integer, nullable=False),
+    Column("error", Text, nullable=True),
+    Column("prediagnosis_id", Integer, ForeignKey("prediagnoses.id"), nullable=True),
+    Column("created_at", DateTime),
+    Column("started_at", DateTime, nullable=True),
+    Column("finished_at", DateTime, nullable=True),
+)
+
+Table(
+    "llm_usage", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("purpose", String(50), nullable=False, index=True),
+    Column("model", String(100), nullable=False),
+    Column("input_tokens", Integer, nullable=False),
+    Column("output_tokens", Integer, nullable=False),
+    Column("cache_read_input_tokens", Integer, nullable=False),
+    Column("cache_creation_input_tokens", Integer, nullable=False),
+    Column("latency_ms", Float, nullable=True),
+    Column("created_at", DateTime, index=True),
+)
+
+Table(
+    "prediagnosis_cache", metadata,
+    Column("key", String(64), primary_key=True),
+    Column("result", JSON, nullable=False),
+    Column("created_at", DateTime),
+    Column("last_accessed_at", DateTime, index=True),
+    Column("expires_at", DateTime, nullable=False, index=True),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
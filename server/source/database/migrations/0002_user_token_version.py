@@ -0,0 +1,6 @@
+"""Per-user token version; bumping it revokes every token issued before"""
+from . import add_column_if_missing
+
+
+def upgrade(connection):
+    add_column_if_missing(connection, "users", "token_version", "INTEGER NOT NULL DEFAULT 0")
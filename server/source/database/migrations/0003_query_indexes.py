@@ -0,0 +1,35 @@
+"""
+Composite indexes for the queries in operations.py: each list or lookup filters on
+the leading column(s) and reads rows in index order, so it is a range scan with no
+sort. Single-column indexes that no query needs are dropped.
+"""
+from . import create_index_if_missing, drop_index_if_exists
+
+INDEXES = [
+    # get_messages_page / get_latest_messages / get_conversation_messages (keyset on created_at, id)
+    ("ix_messages_conversation_created_id", "messages", ("conversation_id", "created_at", "id")),
+    # get_user_conversations, and a doctor's assigned conversations, newest first
+    ("ix_conversations_patient_updated", "conversations", ("patient_id", "updated_at")),
+    ("ix_conversations_doctor_updated", "conversations", ("doctor_id", "updated_at")),
+    # get_prediagnosis_by_conversation / get_all_prediagnoses_by_conversation
+    ("ix_prediagnoses_conversation_created", "prediagnoses", ("conversation_id", "created_at")),
+    # get_patient_prediagnoses
+    ("ix_prediagnoses_patient_created", "prediagnoses", ("patient_id", "created_at")),
+    # get_pending_prediagnosis_jobs
+    ("ix_prediagnosis_jobs_status_created", "prediagnosis_jobs", ("status", "created_at")),
+]
+
+DROPPED = [
+    # prefix of ix_prediagnosis_jobs_status_created
+    ("ix_prediagnosis_jobs_status", "prediagnosis_jobs"),
+    # no query filters on purpose alone; SQLite picked it for the GROUP BY of
+    # get_llm_usage_summary and scanned the table instead of using the created_at range
+    ("ix_llm_usage_purpose", "llm_usage"),
+]
+
+
+def upgrade(connection):
+    for name, table, columns in INDEXES:
+        create_index_if_missing(connection, name, table, *columns)
+    for name, table in DROPPED:
+        drop_index_if_exists(connection, name, table)
@@ -0,0 +1,35 @@
+"""
+Denormalized conversation summaries for the inbox (see operations.update_conversation_summary):
+last message preview and time, message count, unread count per participant and the
+latest prediagnosis. Existing conversations are backfilled; unread counts start at zero.
+"""
+from . import add_column_if_missing
+
+COLUMNS = [
+    ("last_message_preview", "VARCHAR(200)"),
+    ("last_message_at", "TIMESTAMP"),  # what DateTime maps to on Postgres; any name works on SQLite
+    ("message_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("patient_unread_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("doctor_unread_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("latest_prediagnosis_id", "INTEGER"),
+]
+
+BACKFILL = """
+UPDATE conversations SET
+    message_count = (SELECT COUNT(*) FROM messages WHERE messages.conversation_id = conversations.id),
+    last_message_at = (SELECT MAX(created_at) FROM messages WHERE messages.conversation_id = conversations.id),
+    last_message_preview = (
+        SELECT substr(content, 1, 200) FROM messages WHERE messages.conversation_id = conversations.id
+        ORDER BY created_at DESC, id DESC LIMIT 1
+    ),
+    latest_prediagnosis_id = (
+        SELECT id FROM prediagnoses WHERE prediagnoses.conversation_id = conversations.id
+        ORDER BY created_at DESC, id DESC LIMIT 1
+    )
+"""
+
+
+def upgrade(connection):
+    for column, ddl in COLUMNS:
+        add_column_if_missing(connection, "conversations", column, ddl)
+    connection.exec_driver_sql(BACKFILL)
@@ -0,0 +1,95 @@
+"""
+SQLite FTS5 full-text index over message content and prediagnosis text (see operations.search).
+
+External-content tables: the text stays in messages/prediagnoses, the FTS tables only hold
+the inverted index of it (column `body`). Their content comes from the *_search views,
+which add an `owners` column with the conversation's participants as tokens
+("p<patient id> d<doctor id>"), so a patient's or doctor's search is an intersection
+inside the index instead of ranking every match in the table. Triggers keep the index in sync on every write path (ORM inserts, the
+bulk INSERT of create_messages, updates, deletes), and reindex a conversation's rows when
+its patient or doctor changes. Existing rows are indexed with a rebuild. Porter stemming,
+so "headaches" matches "headache".
+
+Skipped on other databases; the search endpoint reports that it is unavailable there.
+"""
+
+
+def owners(row: str) -> str:
+    """SQL for the owner tokens of a conversation row"""
+    return f"'p' || {row}.patient_id || ' ' || coalesce('d' || {row}.doctor_id, '')"
+
+
+def prediagnosis_body(row: str) -> str:
+    """SQL for the indexed text of a prediagnosis row (all its text fields)"""
+    fields = ("potential_diseases", "course_of_action", "support_messages", "recommended_practitioners")
+    return " || ' ' || ".join(f"coalesce({row}.{field}, '')" for field in fields)
+
+
+STATEMENTS = [
+    # Messages
+    f"""CREATE VIEW IF NOT EXISTS messages_search AS
+    SELECT messages.id AS id, messages.content AS body, {owners('conversations')} AS owners
+    FROM messages JOIN conversations ON conversations.id = messages.conversation_id""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        body, owners, content='messages_search', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, body, owners)
+        SELECT new.id, new.content, {owners('c')} FROM conversations c WHERE c.id = new.conversation_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, body, owners)
+        SELECT 'delete', old.id, old.content, {owners('c')} FROM conversations c WHERE c.id = old.conversation_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, body, owners)
+        SELECT 'delete', old.id, old.content, {owners('c')} FROM conversations c WHERE c.id = old.conversation_id;
+        INSERT INTO messages_fts(rowid, body, owners)
+        SELECT new.id, new.content, {owners('c')} FROM conversations c WHERE c.id = new.conversation_id;
+    END""",
+    "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')",
+
+    # Prediagnoses
+    f"""CREATE VIEW IF NOT EXISTS prediagnoses_search AS
+    SELECT prediagnoses.id AS id, {prediagnosis_body('prediagnoses')} AS body, {owners('conversations')} AS owners
+    FROM prediagnoses JOIN conversations ON conversations.id = prediagnoses.conversation_id""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS prediagnoses_fts USING fts5(
+        body, owners, content='prediagnoses_search', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS prediagnoses_fts_insert AFTER INSERT ON prediagnoses BEGIN
+        INSERT INTO prediagnoses_fts(rowid, body, owners)
+        SELECT new.id, {prediagnosis_body('new')}, {owners('c')} FROM conversations c WHERE c.id = new.conversation_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS prediagnoses_fts_delete AFTER DELETE ON prediagnoses BEGIN
+        INSERT INTO prediagnoses_fts(prediagnoses_fts, rowid, body, owners)
+        SELECT 'delete', old.id, {prediagnosis_body('old')}, {owners('c')} FROM conversations c WHERE c.id = old.conversation_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS prediagnoses_fts_update
+    AFTER UPDATE OF potential_diseases, course_of_action, support_messages, recommended_practitioners ON prediagnoses BEGIN
+        INSERT INTO prediagnoses_fts(prediagnoses_fts, rowid, body, owners)
+        SELECT 'delete', old.id, {prediagnosis_body('old')}, {owners('c')} FROM conversations c WHERE c.id = old.conversation_id;
+        INSERT INTO prediagnoses_fts(rowid, body, owners)
+        SELECT new.id, {prediagnosis_body('new')}, {owners('c')} FROM conversations c WHERE c.id = new.conversation_id;
+    END""",
+    "INSERT INTO prediagnoses_fts(prediagnoses_fts) VALUES ('rebuild')",
+
+    # A new patient or doctor on a conversation changes the owner tokens of all its rows
+    f"""CREATE TRIGGER IF NOT EXISTS conversations_fts_owners AFTER UPDATE OF patient_id, doctor_id ON conversations
+    WHEN old.patient_id IS NOT new.patient_id OR old.doctor_id IS NOT new.doctor_id BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, body, owners)
+        SELECT 'delete', m.id, m.content, {owners('old')} FROM messages m WHERE m.conversation_id = old.id;
+        INSERT INTO messages_fts(rowid, body, owners)
+        SELECT m.id, m.content, {owners('new')} FROM messages m WHERE m.conversation_id = new.id;
+        INSERT INTO prediagnoses_fts(prediagnoses_fts, rowid, body, owners)
+        SELECT 'delete', p.id, {prediagnosis_body('p')}, {owners('old')} FROM prediagnoses p WHERE p.conversation_id = old.id;
+        INSERT INTO prediagnoses_fts(rowid, body, owners)
+        SELECT p.id, {prediagnosis_body('p')}, {owners('new')} FROM prediagnoses p WHERE p.conversation_id = new.id;
+    END""",
+]
+
+
+def upgrade(connection):
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in STATEMENTS:
+        connection.exec_driver_sql(statement)
@@ -0,0 +1,10 @@
+"""
+Leases on running prediagnosis jobs (see operations.claim_prediagnosis_job): a worker
+renews its job's lease while it runs, and only jobs whose lease expired are taken
+over by another worker. Jobs already running have none and count as expired.
+"""
+from . import add_column_if_missing
+
+
+def upgrade(connection):
+    add_column_if_missing(connection, "prediagnosis_jobs", "lease_expires_at", "TIMESTAMP")
@@ -0,0 +1,22 @@
+"""
+user_invalidations: one row per changed user, written in the same transaction as the
+change, which every process polls to drop its cached principal for that user
+(see principals.PrincipalCacheSync). Old rows are pruned by the pollers.
+"""
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table
+
+from . import create_index_if_missing
+
+metadata = MetaData()
+
+user_invalidations = Table(
+    "user_invalidations", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+
+
+def upgrade(connection):
+    user_invalidations.create(connection, checkfirst=True)
+    create_index_if_missing(connection, "ix_user_invalidations_created_at", "user_invalidations", "created_at")
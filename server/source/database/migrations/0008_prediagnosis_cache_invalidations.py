@@ -0,0 +1,24 @@
+"""
+prediagnosis_cache_invalidations: one row per invalidated cache key (a null key means
+the whole cache), which every process polls to drop the key from its in-memory LRU
+(see cache.PrediagnosisCacheSync). Old rows are pruned by the pollers.
+"""
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table
+
+from . import create_index_if_missing
+
+metadata = MetaData()
+
+prediagnosis_cache_invalidations = Table(
+    "prediagnosis_cache_invalidations", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("key", String(64)),
+    Column("created_at", DateTime, nullable=False),
+)
+
+
+def upgrade(connection):
+    prediagnosis_cache_invalidations.create(connection, checkfirst=True)
+    create_index_if_missing(
+        connection, "ix_prediagnosis_cache_invalidations_created_at", "prediagnosis_cache_invalidations", "created_at"
+    )
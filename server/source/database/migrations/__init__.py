@@ -0,0 +1,105 @@
+"""
+In-repo schema migrations.
+Each module here named `NNNN_description.py` defines `upgrade(connection)`. Applied
+versions are recorded in the `schema_migrations` table; pending ones run in order,
+each in its own transaction. Migrations must not import the models (they describe
+the schema at one point in time) and must be idempotent, because databases created
+before this runner existed already have some of their tables and indexes.
+
+    python -m source.database.migrations status
+    python -m source.database.migrations upgrade
+
+The app runs `upgrade` at startup (see app.lifespan); importing the models doesn't.
+"""
+import importlib
+import logging
+import pkgutil
+from datetime import datetime
+from types import ModuleType
+from typing import List, Tuple
+
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, inspect, select
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", String(100), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def discover() -> List[Tuple[str, ModuleType]]:
+    """All migration modules, in version order"""
+    versions = sorted(
+        name for _, name, is_package in pkgutil.iter_modules(__path__)
+        if not is_package and name[:4].isdigit()
+    )
+    return [(version, importlib.import_module(f"{__name__}.{version}")) for version in versions]
+
+
+def applied_versions(connection: Connection) -> set:
+    schema_migrations.create(connection, checkfirst=True)
+    return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def _lock(connection: Connection):
+    """Serialize concurrent runners, e.g. several workers starting at once"""
+    if connection.dialect.name == "sqlite":
+        # pysqlite doesn't open a transaction for DDL on its own
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    elif connection.dialect.name == "postgresql":
+        connection.exec_driver_sql("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))")
+
+
+def upgrade(engine: Engine) -> List[str]:
+    """Apply pending migrations; returns the versions applied"""
+    applied = []
+    for version, module in discover():
+        with engine.begin() as connection:
+            _lock(connection)
+            if version in applied_versions(connection):
+                continue
+            module.upgrade(connection)
+            connection.execute(schema_migrations.insert().values(version=version, applied_at=datetime.now()))
+        applied.append(version)
+        logger.info("Applied migration %s", version)
+    return applied
+
+
+def status(engine: Engine) -> List[Tuple[str, bool]]:
+    """Every known migration with whether it has been applied"""
+    with engine.begin() as connection:
+        done = applied_versions(connection)
+    return [(version, version in done) for version, _ in discover()]
+
+
+# ============= HELPERS FOR MIGRATIONS =============
+
+def has_column(connection: Connection, table: str, column: str) -> bool:
+    return column in {c["name"] for c in inspect(connection).get_columns(table)}
+
+
+def has_index(connection: Connection, table: str, name: str) -> bool:
+    return name in {i["name"] for i in inspect(connection).get_indexes(table)}
+
+
+def add_column_if_missing(connection: Connection, table: str, column: str, ddl: str):
+    """ALTER TABLE ... ADD COLUMN unless the column exists (`ddl` is its type and constraints)"""
+    if not has_column(connection, table, column):
+        connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def create_index_if_missing(connection: Connection, name: str, table: str, *columns: str, unique: bool = False):
+    if not has_index(connection, table, name):
+        reflected = Table(table, MetaData(), autoload_with=connection)
+        Index(name, *(reflected.c[column] for column in columns), unique=unique).create(connection)
+
+
+def drop_index_if_exists(connection: Connection, name: str, table: str):
+    if has_index(connection, table, name):
+        reflected = Table(table, MetaData(), autoload_with=connection)
+        next(index for index in reflected.indexes if index.name == name).drop(connection)
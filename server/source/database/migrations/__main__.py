@@ -0,0 +1,25 @@
+import sys
+import logging
+
+from ..config import build_engine
+from . import status, upgrade
+
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    engine = build_engine()
+
+    if command == "upgrade":
+        if not upgrade(engine):
+            print("Database is up to date")
+    elif command == "status":
+        for version, applied in status(engine):
+            print(f"{'applied' if applied else 'pending':<8} {version}")
+    else:
+        print(f"Unknown command: {command} (expected 'upgrade' or 'status')")
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Float, Enum, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Float, Enum, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
-from sqlalchemy import create_engine
 from datetime import datetime
 import enum
 
-engine = create_engine('sqlite:///database.db', echo=True)
+from .config import build_engine
+from ..metrics import SessionTimer, instrument_engine
+
+engine = build_engine()
+instrument_engine(engine, "sync")
 Base = declarative_base()
 
 
@@ -22,6 +25,13 @@ class MessageRole(enum.Enum):
     SYSTEM = "system"
 
 
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
 # User Management
 class User(Base):
     __tablename__ = "users"
@@ -31,6 +41,7 @@ class User(Base):
     email = Column(String(255), unique=True, nullable=False, index=True)
     hashed_password = Column(String(255), nullable=False)
     role = Column(Enum(UserRole), nullable=False, default=UserRole.PATIENT)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")  # bumped to revoke issued tokens
 
     # Medical info for patients
     medical_history = Column(JSON) # JSON array of conditions
@@ -52,12 +63,27 @@ class Conversation(Base):
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    # Inbox summary, kept up to date by the operations that add messages and prediagnoses
+    # (0004_conversation_summaries)
+    last_message_preview = Column(String(200), nullable=True)
+    last_message_at = Column(DateTime, nullable=True)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    patient_unread_count = Column(Integer, nullable=False, default=0, server_default="0")
+    doctor_unread_count = Column(Integer, nullable=False, default=0, server_default="0")
+    latest_prediagnosis_id = Column(Integer, nullable=True)  # no FK: prediagnoses already references conversations
+
     # Relationships
     patient = relationship("User", foreign_keys=[patient_id])
     doctor = relationship("User", foreign_keys=[doctor_id])
     messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
     pre_diagnoses = relationship("PreDiagnosis", back_populates="conversation", cascade="all, delete-orphan")
 
+    # Indexes are created by migrations (0003_query_indexes); declared here to keep the model in sync
+    __table_args__ = (
+        Index("ix_conversations_patient_updated", "patient_id", "updated_at"),
+        Index("ix_conversations_doctor_updated", "doctor_id", "updated_at"),
+    )
+
 
 # Message Storage
 class Message(Base):
@@ -75,6 +101,11 @@ class Message(Base):
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
 
+    __table_args__ = (
+        # Keyset pagination: each page is one index range scan (see operations.get_messages_page)
+        Index("ix_messages_conversation_created_id", "conversation_id", "created_at", "id"),
+    )
+
 
 class PreDiagnosis(Base):
     __tablename__ = "prediagnoses"
@@ -95,9 +126,86 @@ class PreDiagnosis(Base):
     # Relationships
     conversation = relationship("Conversation", back_populates="pre_diagnoses")
 
+    __table_args__ = (
+        Index("ix_prediagnoses_conversation_created", "conversation_id", "created_at"),
+        Index("ix_prediagnoses_patient_created", "patient_id", "created_at"),
+    )
+
+
+# Background prediagnosis jobs (persisted so queued work survives restarts)
+class PrediagnosisJob(Base):
+    __tablename__ = "prediagnosis_jobs"
+
+    id = Column(String(36), primary_key=True, index=True)  # UUID
+    patient_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    conversation_id = Column(String(36), ForeignKey("conversations.id"), nullable=True)  # created by the worker if empty
+
+    symptoms = Column(JSON, nullable=False)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    prediagnosis_id = Column(Integer, ForeignKey("prediagnoses.id"), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.now)
+    started_at = Column(DateTime, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)  # a running job's claim, renewed by its worker
+    finished_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    prediagnosis = relationship("PreDiagnosis")
+
+    __table_args__ = (
+        Index("ix_prediagnosis_jobs_status_created", "status", "created_at"),
+    )
+
+
+# Token usage of each LLM call (one row per call)
+class LLMUsage(Base):
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    purpose = Column(String(50), nullable=False)  # e.g. "prediagnosis"
+    model = Column(String(100), nullable=False)
+
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cache_read_input_tokens = Column(Integer, nullable=False, default=0)
+    cache_creation_input_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Float, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.now, index=True)
+
+
+# Cached prediagnosis results, keyed by a hash of normalized symptoms + medical history
+class PrediagnosisCacheEntry(Base):
+    __tablename__ = "prediagnosis_cache"
+
+    key = Column(String(64), primary_key=True)
+    result = Column(JSON, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.now)
+    last_accessed_at = Column(DateTime, default=datetime.now, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+# Cache keys invalidated since (null: all of them), so every process drops them from memory
+# (see cache.PrediagnosisCacheSync)
+class PrediagnosisCacheInvalidation(Base):
+    __tablename__ = "prediagnosis_cache_invalidations"
+
+    id = Column(Integer, primary_key=True)
+    key = Column(String(64))
+    created_at = Column(DateTime, nullable=False, default=datetime.now, index=True)
+
+
+# Users changed since, so every process drops their cached principal (see principals.PrincipalCacheSync)
+class UserInvalidation(Base):
+    __tablename__ = "user_invalidations"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now, index=True)
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
 
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -105,8 +213,9 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Dependency for FastAPI
 def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+    with SessionTimer("sync"):
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
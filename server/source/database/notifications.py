@@ -0,0 +1,54 @@
+"""
+Commit notifications for new conversation rows.
+Inserted messages and prediagnoses are collected on their session and handed to
+the registered listeners only once the transaction commits (never on rollback).
+Listeners get plain dicts of column values, since committed objects are expired
+and may belong to another thread's session. Kept free of app imports, like the
+principal cache: the realtime hub registers itself as a listener on startup.
+"""
+from typing import Callable, List
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from . import models
+
+_PENDING_KEY = "conversation_events"
+
+# Called with (kind, row) for each committed insert; kind is "message" or "prediagnosis"
+listeners: List[Callable[[str, dict], None]] = []
+
+
+def queue(session: Session, kind: str, row: dict):
+    """Hold an event until `session` commits (for inserts that bypass mapper events, e.g. bulk INSERT)"""
+    if listeners:
+        session.info.setdefault(_PENDING_KEY, []).append((kind, row))
+
+
+def _columns(mapper, target) -> dict:
+    return {attr.key: getattr(target, attr.key) for attr in mapper.column_attrs}
+
+
+@event.listens_for(models.Message, "after_insert")
+def _message_inserted(mapper, connection, target):
+    queue(object_session(target), "message", _columns(mapper, target))
+
+
+@event.listens_for(models.PreDiagnosis, "after_insert")
+def _prediagnosis_inserted(mapper, connection, target):
+    queue(object_session(target), "prediagnosis", _columns(mapper, target))
+
+
+@event.listens_for(Session, "after_commit")
+def _notify(session):
+    for kind, row in session.info.pop(_PENDING_KEY, []):
+        for listener in listeners:
+            try:
+                listener(kind, row)
+            except Exception as e:
+                print(f"Error notifying {kind} listener: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -1,8 +1,26 @@
 from sqlalchemy.orm import Session
-from datetime import datetime
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import func, tuple_, insert, text, or_, and_, String, Integer, Float, DateTime
+from sqlalchemy.engine import Row
+from datetime import datetime, timedelta
 from . import models
-from typing import Optional, List
+from .principals import principal_cache
+from . import notifications
+from typing import Optional, List, Tuple
 import uuid
+import re
+
+# Message pagination
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_PAGE_MAX_SIZE = 200
+
+# Characters of the last message kept on the conversation (Conversation.last_message_preview)
+MESSAGE_PREVIEW_LENGTH = 200
+
+# Search pagination, and the words of context around each highlighted match
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_MAX_SIZE = 100
+SEARCH_SNIPPET_TOKENS = 16
 
 
 # ============= USER OPERATIONS =============
@@ -45,6 +63,29 @@ def update_user_medical_history(db: Session, user_id: int, medical_history: dict
     if user:
         user.medical_history = medical_history
         db.commit()
+        principal_cache.invalidate(user_id)
+        db.refresh(user)
+    return user
+
+
+def update_user_role(db: Session, user_id: int, role: models.UserRole) -> models.User:
+    """Change a user's role. Bumps token_version (see principals.py), so tokens carrying the old role stop working"""
+    user = get_user_by_id(db, user_id)
+    if user:
+        user.role = role
+        db.commit()
+        principal_cache.invalidate(user_id)
+        db.refresh(user)
+    return user
+
+
+def revoke_user_tokens(db: Session, user_id: int) -> models.User:
+    """Invalidate every access token issued to a user so far"""
+    user = get_user_by_id(db, user_id)
+    if user:
+        user.token_version = (user.token_version or 0) + 1
+        db.commit()
+        principal_cache.invalidate(user_id)
         db.refresh(user)
     return user
 
@@ -72,19 +113,80 @@ def create_conversation(
 
 
 def get_conversation_by_id(db: Session, conversation_id: str) -> Optional[models.Conversation]:
-    """Get conversation by ID with all related data"""
-    return db.query(models.Conversation).filter(models.Conversation.id == conversation_id).first()
+    """Get conversation by ID (served from the session's identity map if it was already loaded)"""
+    return db.get(models.Conversation, conversation_id)
+
+
+def load_conversation_details(db: Session, conversation: models.Conversation) -> models.Conversation:
+    """
+    Load a conversation's messages and prediagnoses onto it, oldest first (two queries,
+    whatever their size). Separate from the lookup so conditional GETs can answer
+    304 Not Modified before any message rows are read.
+    """
+    messages = db.query(models.Message)\
+        .filter(models.Message.conversation_id == conversation.id)\
+        .order_by(models.Message.created_at.asc(), models.Message.id.asc())\
+        .all()
+    pre_diagnoses = db.query(models.PreDiagnosis)\
+        .filter(models.PreDiagnosis.conversation_id == conversation.id)\
+        .order_by(models.PreDiagnosis.created_at.asc())\
+        .all()
+    set_committed_value(conversation, "messages", messages)
+    set_committed_value(conversation, "pre_diagnoses", pre_diagnoses)
+    return conversation
 
 
-def get_user_conversations(db: Session, user_id: int, limit: int = 50) -> List[models.Conversation]:
-    """Get all conversations for a patient"""
+def get_user_conversations(
+    db: Session,
+    user_id: int,
+    limit: int = 50,
+    role: models.UserRole = models.UserRole.PATIENT
+) -> List[models.Conversation]:
+    """
+    A user's inbox, most recently active first: a doctor's assigned conversations, or a patient's own.
+    The summary columns make each row complete, so this is one range scan of
+    ix_conversations_doctor_updated / ix_conversations_patient_updated.
+    """
+    owner = models.Conversation.doctor_id if role == models.UserRole.DOCTOR else models.Conversation.patient_id
     return db.query(models.Conversation)\
-        .filter(models.Conversation.patient_id == user_id)\
+        .filter(owner == user_id)\
         .order_by(models.Conversation.updated_at.desc())\
         .limit(limit)\
         .all()
 
 
+def mark_conversation_read(db: Session, conversation_id: str, user_id: int) -> Optional[models.Conversation]:
+    """Reset the user's unread count on a conversation"""
+    conversation = get_conversation_by_id(db, conversation_id)
+    if conversation:
+        if user_id == conversation.patient_id:
+            conversation.patient_unread_count = 0
+        if user_id == conversation.doctor_id:
+            conversation.doctor_unread_count = 0
+        # Reading isn't activity: keep updated_at (and the inbox order) instead of letting onupdate bump it
+        conversation.updated_at = models.Conversation.updated_at
+        db.commit()
+        db.refresh(conversation)
+    return conversation
+
+
+def update_conversation_summary(conversation: models.Conversation, sender_id: int, contents: List[str], at: datetime):
+    """
+    Account for new messages on the conversation's summary columns, in the caller's transaction.
+    Counters are incremented in SQL, so concurrent writers don't lose updates.
+    Every participant other than the sender gets the messages as unread.
+    """
+    Conversation = models.Conversation
+    conversation.updated_at = at
+    conversation.last_message_at = at
+    conversation.last_message_preview = contents[-1][:MESSAGE_PREVIEW_LENGTH]
+    conversation.message_count = Conversation.message_count + len(contents)
+    if sender_id != conversation.patient_id:
+        conversation.patient_unread_count = Conversation.patient_unread_count + len(contents)
+    if conversation.doctor_id is not None and sender_id != conversation.doctor_id:
+        conversation.doctor_unread_count = Conversation.doctor_unread_count + len(contents)
+
+
 def assign_doctor_to_conversation(db: Session, conversation_id: str, doctor_id: int) -> models.Conversation:
     """Assign a doctor to a conversation"""
     conversation = get_conversation_by_id(db, conversation_id)
@@ -128,24 +230,57 @@ def create_message(
     content: str
 ) -> models.Message:
     """Add a message to a conversation"""
+    now = datetime.now()
     db_message = models.Message(
         conversation_id=conversation_id,
         sender_id=sender_id,
         role=role,
-        content=content
+        content=content,
+        created_at=now
     )
     db.add(db_message)
 
-    # Update conversation timestamp
+    # Update conversation timestamp and summary
     conversation = get_conversation_by_id(db, conversation_id)
     if conversation:
-        conversation.updated_at = datetime.now()
+        update_conversation_summary(conversation, sender_id, [content], now)
 
     db.commit()
     db.refresh(db_message)
     return db_message
 
 
+def create_messages(
+    db: Session,
+    conversation_id: str,
+    sender_id: int,
+    messages: List[Tuple[models.MessageRole, str]]
+) -> List[Row]:
+    """
+    Add several messages to a conversation, in order, with one INSERT and one commit.
+    Returns the inserted rows as read back by RETURNING, so nothing is reloaded afterwards.
+    """
+    now = datetime.now()  # one timestamp for the batch; ids keep the order
+    result = db.execute(
+        insert(models.Message).returning(*models.Message.__table__.columns),
+        [
+            {"conversation_id": conversation_id, "sender_id": sender_id, "role": role, "content": content, "created_at": now}
+            for role, content in messages
+        ]
+    )
+    rows = sorted(result.all(), key=lambda row: row.id)  # one statement assigns ids in VALUES order
+    for row in rows:
+        notifications.queue(db, "message", row._asdict())  # bulk INSERT skips the mapper events
+
+    # Update conversation timestamp and summary once for the whole batch
+    conversation = get_conversation_by_id(db, conversation_id)
+    if conversation:
+        update_conversation_summary(conversation, sender_id, [content for _, content in messages], now)
+
+    db.commit()
+    return rows
+
+
 def get_conversation_messages(
     db: Session,
     conversation_id: str,
@@ -162,13 +297,49 @@ def get_conversation_messages(
     return query.all()
 
 
+def get_messages_page(
+    db: Session,
+    conversation_id: str,
+    page_size: int = MESSAGE_PAGE_SIZE,
+    before: Optional[int] = None,
+    after: Optional[int] = None
+) -> Optional[Tuple[List[models.Message], Optional[int]]]:
+    """
+    One page of a conversation's messages, oldest first.
+    Keyset pagination on (conversation_id, created_at, id): every page is a single index
+    range scan, however long the conversation is. `before`/`after` are message ids; with
+    neither, the latest page is returned. Returns (messages, next_cursor), where next_cursor
+    continues in the same direction (None when there is nothing more), or None if the
+    cursor message is not in the conversation.
+    """
+    query = db.query(models.Message).filter(models.Message.conversation_id == conversation_id)
+    position = tuple_(models.Message.created_at, models.Message.id)
+
+    cursor_id = after if after is not None else before
+    if cursor_id is not None:
+        cursor = db.query(models.Message.created_at, models.Message.id)\
+            .filter(models.Message.id == cursor_id, models.Message.conversation_id == conversation_id)\
+            .first()
+        if cursor is None:
+            return None
+        cursor_position = tuple_(cursor.created_at, cursor.id)
+        query = query.filter(position > cursor_position if after is not None else position < cursor_position)
+
+    # Fetch one extra row to know whether another page follows
+    if after is not None:
+        rows = query.order_by(models.Message.created_at.asc(), models.Message.id.asc()).limit(page_size + 1).all()
+        page = rows[:page_size]
+        return page, (page[-1].id if len(rows) > page_size else None)
+
+    rows = query.order_by(models.Message.created_at.desc(), models.Message.id.desc()).limit(page_size + 1).all()
+    page = rows[:page_size][::-1]
+    return page, (page[0].id if len(rows) > page_size else None)
+
+
 def get_latest_messages(db: Session, conversation_id: str, count: int = 10) -> List[models.Message]:
-    """Get the latest N messages from a conversation"""
-    return db.query(models.Message)\
-        .filter(models.Message.conversation_id == conversation_id)\
-        .order_by(models.Message.created_at.desc())\
-        .limit(count)\
-        .all()
+    """Get the latest N messages from a conversation, oldest first (the tail page)"""
+    messages, _ = get_messages_page(db, conversation_id, page_size=count)
+    return messages
 
 
 # ============= PREDIAGNOSIS OPERATIONS =============
@@ -194,11 +365,47 @@ def create_prediagnosis(
         recommended_practitioners=recommended_practitioners
     )
     db.add(db_prediagnosis)
+    db.flush()  # assigns the id for the conversation summary
+
+    conversation = get_conversation_by_id(db, conversation_id)
+    if conversation:
+        conversation.latest_prediagnosis_id = db_prediagnosis.id
+        conversation.updated_at = db_prediagnosis.created_at
+
     db.commit()
     db.refresh(db_prediagnosis)
     return db_prediagnosis
 
 
+def create_ai_prediagnosis(
+    db: Session,
+    patient_id: int,
+    symptoms: List[str],
+    ai_result: dict,
+    conversation_id: Optional[str] = None
+) -> models.PreDiagnosis:
+    """Store an AI-generated prediagnosis, opening a new conversation for it if none is given"""
+    if not conversation_id:
+        conversation = create_conversation(
+            db=db,
+            patient_id=patient_id,
+            title=f"Symptoms: {', '.join(symptoms[:3])}"
+        )
+        conversation_id = conversation.id
+
+    # Note: doctor_id is set to patient_id for now since it's AI-generated
+    return create_prediagnosis(
+        db=db,
+        conversation_id=conversation_id,
+        patient_id=patient_id,
+        doctor_id=patient_id,  # Temporary: AI-generated
+        potential_diseases=ai_result["potential_diseases"],
+        course_of_action=ai_result["course_of_action"],
+        therapy_message=ai_result.get("support_messages"),
+        recommended_practitioners=ai_result.get("recommended_practitioners")
+    )
+
+
 def get_prediagnosis_by_conversation(db: Session, conversation_id: str) -> Optional[models.PreDiagnosis]:
     """Get the pre-diagnosis for a conversation"""
     return db.query(models.PreDiagnosis)\
@@ -238,6 +445,11 @@ def update_prediagnosis(
         if recommended_practitioners is not None:
             prediagnosis.recommended_practitioners = recommended_practitioners
 
+        # Conversation reads are validated by its updated_at (see conditional.py)
+        conversation = get_conversation_by_id(db, prediagnosis.conversation_id)
+        if conversation:
+            conversation.updated_at = datetime.now()
+
         db.commit()
         db.refresh(prediagnosis)
 
@@ -251,3 +463,265 @@ def get_patient_prediagnoses(db: Session, patient_id: int, limit: int = 10) -> L
         .order_by(models.PreDiagnosis.created_at.desc())\
         .limit(limit)\
         .all()
+
+
+
+# ============= SEARCH OPERATIONS =============
+
+# Ranked matches from the FTS5 indexes of migration 0005, messages and prediagnoses together.
+# bm25 is lower for better matches and ignores the owners column; snippets mark matched
+# words with ** (markdown bold).
+_SEARCH_SQL = """
+SELECT 'message' AS kind, messages.id AS id, messages.conversation_id AS conversation_id,
+       conversations.title AS conversation_title, messages.created_at AS created_at,
+       snippet(messages_fts, 0, '**', '**', '...', :snippet_tokens) AS snippet, bm25(messages_fts, 1.0, 0.0) AS score
+FROM messages_fts
+JOIN messages ON messages.id = messages_fts.rowid
+JOIN conversations ON conversations.id = messages.conversation_id
+WHERE messages_fts MATCH :query {access}
+UNION ALL
+SELECT 'prediagnosis', prediagnoses.id, prediagnoses.conversation_id,
+       conversations.title, prediagnoses.created_at,
+       snippet(prediagnoses_fts, 0, '**', '**', '...', :snippet_tokens), bm25(prediagnoses_fts, 1.0, 0.0)
+FROM prediagnoses_fts
+JOIN prediagnoses ON prediagnoses.id = prediagnoses_fts.rowid
+JOIN conversations ON conversations.id = prediagnoses.conversation_id
+WHERE prediagnoses_fts MATCH :query {access}
+ORDER BY score, created_at DESC
+LIMIT :limit OFFSET :offset
+"""
+
+# The same access rules as get_conversation: the owner token narrows the match inside the
+# index, the SQL condition checks the conversation as it is now
+_SEARCH_ACCESS = {
+    models.UserRole.PATIENT: ("p", "AND conversations.patient_id = :user_id"),
+    models.UserRole.DOCTOR: ("d", "AND conversations.doctor_id = :user_id"),
+    models.UserRole.ADMIN: (None, ""),
+}
+
+
+def search_statement(role: models.UserRole):
+    """The search query, limited to the conversations `role` may open (as in get_conversation)"""
+    return text(_SEARCH_SQL.format(access=_SEARCH_ACCESS[role][1])).columns(
+        kind=String, id=Integer, conversation_id=String, conversation_title=String,
+        created_at=DateTime, snippet=String, score=Float
+    )
+
+
+def fts_query(q: str, user_id: int, role: models.UserRole) -> Optional[str]:
+    """
+    User input as an FTS5 query on the `body` column of both indexes: every word must match. Words are quoted, so FTS5 operators and punctuation in the input are
+    searched for literally, never parsed. Patients and doctors also match their owner token.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    query = "body : (" + " ".join(f'"{word}"' for word in words) + ")"
+    prefix = _SEARCH_ACCESS[role][0]
+    if prefix:
+        query += f' AND owners : "{prefix}{user_id}"'
+    return query
+
+
+def search(
+    db: Session,
+    q: str,
+    user_id: int,
+    role: models.UserRole,
+    page: int = 1,
+    page_size: int = SEARCH_PAGE_SIZE
+) -> Optional[Tuple[List[dict], Optional[int]]]:
+    """
+    Full-text search over the messages and prediagnoses the user can access, best match first.
+    Cost follows the number of rows matching the words, not the table size (no LIKE scan).
+    Returns (results, next_page), or None when the database has no search index (not SQLite).
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return None
+    query = fts_query(q, user_id, role)
+    if query is None:
+        return [], None
+
+    # Fetch one extra row to know whether another page follows
+    rows = db.execute(search_statement(role), {
+        "query": query, "user_id": user_id, "snippet_tokens": SEARCH_SNIPPET_TOKENS,
+        "limit": page_size + 1, "offset": (page - 1) * page_size,
+    }).mappings().all()
+    results = [dict(row) for row in rows[:page_size]]
+    return results, (page + 1 if len(rows) > page_size else None)
+
+
+# ============= PREDIAGNOSIS JOB OPERATIONS =============
+
+def create_prediagnosis_job(
+    db: Session,
+    patient_id: int,
+    symptoms: List[str],
+    conversation_id: Optional[str] = None
+) -> models.PrediagnosisJob:
+    """Queue a background prediagnosis job"""
+    db_job = models.PrediagnosisJob(
+        id=str(uuid.uuid4()),
+        patient_id=patient_id,
+        conversation_id=conversation_id,
+        symptoms=symptoms,
+        status=models.JobStatus.QUEUED
+    )
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+
+def get_prediagnosis_job(db: Session, job_id: str) -> Optional[models.PrediagnosisJob]:
+    """Get a prediagnosis job by ID"""
+    return db.query(models.PrediagnosisJob).filter(models.PrediagnosisJob.id == job_id).first()
+
+
+def get_pending_prediagnosis_jobs(db: Session, queued_before: Optional[datetime] = None) -> List[models.PrediagnosisJob]:
+    """
+    Jobs to (re)queue, oldest first: queued ones (created before `queued_before`, when
+    given) and running ones whose lease has expired, i.e. whose worker died.
+    Claiming still decides which worker runs each one.
+    """
+    Job = models.PrediagnosisJob
+    queued = db.query(Job).filter(Job.status == models.JobStatus.QUEUED)
+    if queued_before is not None:
+        queued = queued.filter(Job.created_at < queued_before)
+    abandoned = db.query(Job).filter(
+        Job.status == models.JobStatus.RUNNING,
+        or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < datetime.now()),
+    )
+    jobs = queued.order_by(Job.created_at.asc()).all() + abandoned.order_by(Job.created_at.asc()).all()
+    return sorted(jobs, key=lambda job: job.created_at)
+
+
+def claim_prediagnosis_job(db: Session, job_id: str, lease_seconds: float) -> Optional[models.PrediagnosisJob]:
+    """
+    Move a job to running and count the attempt, in one conditional UPDATE: only a queued
+    job or a running one whose lease expired can be claimed. Returns None when another
+    worker claimed it first (or it has finished), so each job runs once at a time.
+    """
+    Job = models.PrediagnosisJob
+    now = datetime.now()
+    claimed = db.query(Job).filter(
+        Job.id == job_id,
+        or_(
+            Job.status == models.JobStatus.QUEUED,
+            and_(
+                Job.status == models.JobStatus.RUNNING,
+                or_(Job.lease_expires_at.is_(None), Job.lease_expires_at < now),
+            ),
+        ),
+    ).update({
+        Job.status: models.JobStatus.RUNNING,
+        Job.attempts: func.coalesce(Job.attempts, 0) + 1,
+        Job.started_at: now,
+        Job.lease_expires_at: now + timedelta(seconds=lease_seconds),
+        Job.error: None,
+    }, synchronize_session=False)
+    db.commit()
+    return get_prediagnosis_job(db, job_id) if claimed else None
+
+
+def renew_prediagnosis_job_lease(db: Session, job_id: str, attempt: int, lease_seconds: float) -> bool:
+    """Extend the lease of the running `attempt` of a job; False if it has been reclaimed since"""
+    Job = models.PrediagnosisJob
+    renewed = db.query(Job).filter(
+        Job.id == job_id, Job.status == models.JobStatus.RUNNING, Job.attempts == attempt,
+    ).update({Job.lease_expires_at: datetime.now() + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+    db.commit()
+    return renewed == 1
+
+
+def _finish_prediagnosis_job(db: Session, job_id: str, attempt: int, values: dict) -> Optional[models.PrediagnosisJob]:
+    """Finish the running `attempt` of a job in one conditional UPDATE; None if it has been reclaimed since"""
+    Job = models.PrediagnosisJob
+    finished = db.query(Job).filter(
+        Job.id == job_id, Job.status == models.JobStatus.RUNNING, Job.attempts == attempt,
+    ).update({**values, Job.finished_at: datetime.now()}, synchronize_session=False)
+    db.commit()
+    return get_prediagnosis_job(db, job_id) if finished else None
+
+
+def mark_prediagnosis_job_done(
+    db: Session,
+    job_id: str,
+    attempt: int,
+    prediagnosis_id: int,
+    conversation_id: str
+) -> Optional[models.PrediagnosisJob]:
+    """Mark a job's running `attempt` as done and link the stored prediagnosis; None if it was reclaimed"""
+    Job = models.PrediagnosisJob
+    return _finish_prediagnosis_job(db, job_id, attempt, {
+        Job.status: models.JobStatus.DONE,
+        Job.prediagnosis_id: prediagnosis_id,
+        Job.conversation_id: conversation_id,
+    })
+
+
+def mark_prediagnosis_job_failed(db: Session, job_id: str, attempt: int, error: str) -> Optional[models.PrediagnosisJob]:
+    """Mark a job's running `attempt` as failed with an error message; None if it was reclaimed"""
+    Job = models.PrediagnosisJob
+    return _finish_prediagnosis_job(db, job_id, attempt, {Job.status: models.JobStatus.FAILED, Job.error: error})
+
+
+# ============= LLM USAGE OPERATIONS =============
+
+def create_llm_usage(
+    db: Session,
+    purpose: str,
+    model: str,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+    cache_read_input_tokens: int = 0,
+    cache_creation_input_tokens: int = 0,
+    latency_ms: Optional[float] = None
+) -> models.LLMUsage:
+    """Record the token usage of one LLM call"""
+    db_usage = models.LLMUsage(
+        purpose=purpose,
+        model=model,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cache_read_input_tokens=cache_read_input_tokens,
+        cache_creation_input_tokens=cache_creation_input_tokens,
+        latency_ms=latency_ms
+    )
+    db.add(db_usage)
+    db.commit()
+    return db_usage
+
+
+def get_llm_usage_summary(db: Session, since: Optional[datetime] = None) -> List[dict]:
+    """Aggregate LLM token usage per purpose and model"""
+    query = db.query(
+        models.LLMUsage.purpose,
+        models.LLMUsage.model,
+        func.count(models.LLMUsage.id),
+        func.sum(models.LLMUsage.input_tokens),
+        func.sum(models.LLMUsage.output_tokens),
+        func.sum(models.LLMUsage.cache_read_input_tokens),
+        func.sum(models.LLMUsage.cache_creation_input_tokens),
+        func.avg(models.LLMUsage.latency_ms)
+    )
+    if since is not None:
+        query = query.filter(models.LLMUsage.created_at >= since)
+
+    rows = query.group_by(models.LLMUsage.purpose, models.LLMUsage.model)\
+        .order_by(models.LLMUsage.purpose, models.LLMUsage.model)\
+        .all()
+
+    return [
+        {
+            "purpose": purpose,
+            "model": model,
+            "calls": calls,
+            "input_tokens": input_tokens or 0,
+            "output_tokens": output_tokens or 0,
+            "cache_read_input_tokens": cache_read or 0,
+            "cache_creation_input_tokens": cache_write or 0,
+            "avg_latency_ms": avg_latency
+        }
+        for purpose, model, calls, input_tokens, output_tokens, cache_read, cache_write, avg_latency in rows
+    ]
\ No newline at end of file
@@ -0,0 +1,206 @@
+import os
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import event, inspect, func, select
+from starlette.concurrency import run_in_threadpool
+
+from . import models
+from ..metrics import cache_lookups
+
+# Configuration
+USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', '300'))  # 0 disables the cache
+USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', '10000'))
+USER_CACHE_SYNC_INTERVAL_SECONDS = float(os.getenv('USER_CACHE_SYNC_INTERVAL_SECONDS', '1'))  # 0 disables
+
+
+class Principal:
+    """The authenticated caller: just what access checks need, without an ORM object or session"""
+
+    __slots__ = ("id", "role", "email", "token_version")
+
+    def __init__(self, id: int, role: models.UserRole, email: str, token_version: int = 0):
+        self.id = id
+        self.role = role
+        self.email = email
+        self.token_version = token_version
+
+    @classmethod
+    def from_user(cls, user: models.User) -> "Principal":
+        return cls(id=user.id, role=user.role, email=user.email, token_version=user.token_version or 0)
+
+    @classmethod
+    def from_claims(cls, payload: dict) -> Optional["Principal"]:
+        """Principal from verified JWT claims, or None if they are malformed"""
+        try:
+            return cls(
+                id=int(payload["sub"]),
+                role=models.UserRole(payload["role"]),
+                email=payload.get("email"),
+                token_version=int(payload.get("ver", 0)),
+            )
+        except (KeyError, ValueError, TypeError):
+            return None
+
+    def __repr__(self):
+        return f"Principal(id={self.id}, role={self.role.value}, email={self.email!r})"
+
+
+class PrincipalCache:
+    """
+    In-process LRU of principals keyed by user id, so authenticating a request
+    doesn't need a SELECT on users. Entries are dropped when the user row changes:
+    at once in the process that changed it, and within one PrincipalCacheSync poll
+    in the others. The TTL is the backstop if polling stops.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.enabled = ttl_seconds > 0 and max_entries > 0
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user id -> (expires_at, principal)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0  # bumped on every invalidation
+
+    def get(self, user_id: int) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= datetime.now():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                principal = None
+            else:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                principal = entry[1]
+        cache_lookups.labels("user", "hit" if principal else "miss").inc()
+        return principal
+
+    def set(self, principal: Principal, generation: int):
+        """Cache a principal read when `generation` was current; skipped if an invalidation happened since"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[principal.id] = (datetime.now() + self.ttl, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Drop one user, or everyone when user_id is None"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+            self.invalidations += 1
+            self.generation += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": int(self.ttl.total_seconds()),
+            }
+
+
+class PrincipalCacheSync:
+    """
+    Applies user changes made by other processes (role changes, token revocations) to
+    this process's cache: every `interval_seconds` it reads the user_invalidations rows
+    added since the last poll and drops those users. Rows older than the cache TTL
+    can't matter to any cache and are pruned.
+    Ids are compared, not times, so SQLite's one-writer-at-a-time keeps them in commit order.
+    """
+
+    def __init__(self, cache: PrincipalCache, interval_seconds: float = USER_CACHE_SYNC_INTERVAL_SECONDS):
+        self.cache = cache
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._last_id = 0
+        self._last_pruned = datetime.min
+
+    async def start(self):
+        if self.interval_seconds > 0 and self.cache.enabled and self._task is None:
+            self._last_id = await run_in_threadpool(self._latest_id)
+            self._task = asyncio.create_task(self._loop(), name="user-cache-sync")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _latest_id(self) -> int:
+        with models.SessionLocal() as db:
+            return db.execute(select(func.max(models.UserInvalidation.id))).scalar() or 0
+
+    def poll(self) -> int:
+        """Drop the users changed elsewhere since the last poll; returns how many rows were applied"""
+        Invalidation = models.UserInvalidation
+        with models.SessionLocal() as db:
+            rows = db.execute(
+                select(Invalidation.id, Invalidation.user_id)
+                .where(Invalidation.id > self._last_id)
+                .order_by(Invalidation.id)
+            ).all()
+            for row in rows:
+                self.cache.invalidate(row.user_id)
+            if rows:
+                self._last_id = rows[-1].id
+
+            now = datetime.now()
+            if now - self._last_pruned >= self.cache.ttl:
+                db.query(Invalidation).filter(Invalidation.created_at < now - self.cache.ttl)\
+                    .delete(synchronize_session=False)
+                db.commit()
+                self._last_pruned = now
+        return len(rows)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await run_in_threadpool(self.poll)
+            except Exception as e:
+                print(f"Error syncing the user cache: {e}")
+
+
+principal_cache = PrincipalCache(USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
+principal_cache_sync = PrincipalCacheSync(principal_cache)
+
+
+# A role change revokes every token issued under the old role
+@event.listens_for(models.User, "before_update")
+def _bump_token_version(mapper, connection, target):
+    if inspect(target).attrs.role.history.has_changes():
+        target.token_version = (target.token_version or 0) + 1
+
+
+# Any flushed change to a user row (role, email, medical history, ...) drops its cached principal,
+# whichever code path or session made it. Operations invalidate again after commit, so a
+# request racing the commit can't re-cache the old row. The user_invalidations row, committed
+# with the change, tells the other processes.
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    principal_cache.invalidate(target.id)
+    connection.execute(
+        models.UserInvalidation.__table__.insert().values(user_id=target.id, created_at=datetime.now())
+    )
@@ -0,0 +1,216 @@
+import os
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .database import models, operations
+from .ml_models.cache import generate_prediagnosis_cached
+from .ml_models.vocabulary import symptom_vocabulary
+
+# Number of worker tasks pulling prediagnosis jobs off the queue
+PREDIAGNOSIS_JOB_WORKERS = int(os.getenv('PREDIAGNOSIS_JOB_WORKERS', '4'))
+# Job ids waiting for a worker; beyond this new jobs are refused with 503
+PREDIAGNOSIS_JOB_QUEUE_SIZE = int(os.getenv('PREDIAGNOSIS_JOB_QUEUE_SIZE', '1000'))
+# How long a claimed job stays claimed without its worker renewing it (every third of this)
+PREDIAGNOSIS_JOB_LEASE_SECONDS = float(os.getenv('PREDIAGNOSIS_JOB_LEASE_SECONDS', '120'))
+
+
+class JobQueueUnavailable(Exception):
+    """Raised by enqueue when the workers aren't running"""
+
+
+class PrediagnosisJobQueue:
+    """
+    In-process, bounded queue of prediagnosis job ids served by a pool of asyncio worker tasks.
+    Job state lives in the prediagnosis_jobs table; the queue only carries ids. A worker
+    claims a job atomically before running it and renews its lease while it runs, so with
+    several processes each job still runs once. Every `lease_seconds` the queue re-reads
+    jobs nobody is running (left queued, or running with an expired lease) from the table.
+    """
+
+    def __init__(self, num_workers: int, queue_size: int, lease_seconds: float):
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.lease_seconds = lease_seconds
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._workers: List[asyncio.Task] = []
+        self.overflowed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        """Start the workers and the recovery sweep, which first re-queues unfinished jobs"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"prediagnosis-worker-{i}")
+            for i in range(self.num_workers)
+        ]
+        self._workers.append(asyncio.create_task(self._recover(), name="prediagnosis-recovery"))
+
+    async def stop(self):
+        """Cancel the workers. Jobs in flight stay 'running' until their lease expires, then are resumed"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        self._loop = None
+
+    def accepting(self) -> bool:
+        """Whether a new job would get a place in the queue (checked before creating it)"""
+        return self.running and self._queue.qsize() < self.queue_size
+
+    def enqueue(self, job_id: str):
+        """
+        Hand a persisted job to the workers; safe to call from threadpool threads.
+        If the queue filled up meanwhile, the job stays queued in the table for the sweep.
+        """
+        if self._loop is None:
+            raise JobQueueUnavailable("Prediagnosis workers are not running")
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self._put(job_id)
+        else:
+            self._loop.call_soon_threadsafe(self._put, job_id)
+
+    def _put(self, job_id: str):
+        if self._queue is None:
+            return
+        try:
+            self._queue.put_nowait(job_id)
+        except asyncio.QueueFull:
+            self.overflowed += 1
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await run_prediagnosis_job(job_id, self.lease_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error running prediagnosis job {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _recover(self):
+        # On start every queued job; afterwards only ones queued long enough ago that
+        # their own process should have run them (it died, or its queue was full)
+        queued_before = datetime.now()
+        while True:
+            try:
+                for job_id in await run_in_threadpool(_recoverable_jobs, queued_before):
+                    if self._queue.full():
+                        break
+                    self._queue.put_nowait(job_id)
+            except Exception as e:
+                print(f"Error recovering prediagnosis jobs: {e}")
+            await asyncio.sleep(self.lease_seconds)
+            queued_before = datetime.now() - timedelta(seconds=self.lease_seconds)
+
+
+def _recoverable_jobs(queued_before: datetime) -> List[str]:
+    with models.SessionLocal() as db:
+        return [job.id for job in operations.get_pending_prediagnosis_jobs(db, queued_before)]
+
+
+def _renew_lease(job_id: str, attempt: int, lease_seconds: float) -> bool:
+    with models.SessionLocal() as db:
+        return operations.renew_prediagnosis_job_lease(db, job_id, attempt, lease_seconds)
+
+
+async def _keep_lease(job_id: str, attempt: int, lease_seconds: float):
+    """Renew a claimed job's lease until cancelled; returns if another worker has reclaimed it"""
+    while True:
+        await asyncio.sleep(lease_seconds / 3)
+        if not await run_in_threadpool(_renew_lease, job_id, attempt, lease_seconds):
+            return
+
+
+async def run_prediagnosis_job(job_id: str, lease_seconds: float = PREDIAGNOSIS_JOB_LEASE_SECONDS):
+    """Claim a job and run it, keeping its lease alive; does nothing if another worker has it"""
+    job = await run_in_threadpool(_claim, job_id, lease_seconds)
+    if not job:
+        return
+
+    work = asyncio.ensure_future(_run_claimed_job(job, lease_seconds))
+    heartbeat = asyncio.ensure_future(_keep_lease(job.id, job.attempts, lease_seconds))
+    try:
+        await asyncio.wait({work, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        lost_lease = heartbeat.done() and not work.done()
+        for task in (work, heartbeat):
+            task.cancel()
+        await asyncio.gather(work, heartbeat, return_exceptions=True)
+    if lost_lease:
+        print(f"Prediagnosis job {job_id} lost its lease to another worker; stopped")
+
+
+# Each threadpool step opens its own session: cancelling the job stops the await, not
+# the thread, so a session shared across steps could be closed while a thread still used it
+
+def _claim(job_id: str, lease_seconds: float) -> Optional[models.PrediagnosisJob]:
+    with models.SessionLocal() as db:
+        return operations.claim_prediagnosis_job(db, job_id, lease_seconds)
+
+
+def _medical_history(patient_id: int) -> Optional[dict]:
+    with models.SessionLocal() as db:
+        patient = operations.get_user_by_id(db, patient_id)
+        return patient.medical_history if patient else None
+
+
+def _store_result(job: models.PrediagnosisJob, lease_seconds: float, ai_result: dict) -> bool:
+    """
+    Store the prediagnosis and mark the job done, unless the attempt has lost its claim.
+    Renewing first means a reclaimed job doesn't get a second prediagnosis stored.
+    """
+    with models.SessionLocal() as db:
+        if not operations.renew_prediagnosis_job_lease(db, job.id, job.attempts, lease_seconds):
+            return False
+        prediagnosis = operations.create_ai_prediagnosis(
+            db, job.patient_id, symptom_vocabulary.normalize_all(job.symptoms), ai_result, job.conversation_id
+        )
+        return operations.mark_prediagnosis_job_done(
+            db, job.id, job.attempts, prediagnosis.id, prediagnosis.conversation_id
+        ) is not None
+
+
+def _store_failure(job: models.PrediagnosisJob, error: str) -> bool:
+    with models.SessionLocal() as db:
+        return operations.mark_prediagnosis_job_failed(db, job.id, job.attempts, error) is not None
+
+
+async def _run_claimed_job(job: models.PrediagnosisJob, lease_seconds: float):
+    """Generate the prediagnosis and store it, if this attempt still holds the job"""
+    try:
+        medical_history = await run_in_threadpool(_medical_history, job.patient_id)
+        ai_result = await generate_prediagnosis_cached(None, job.symptoms, medical_history)
+        if not ai_result:
+            raise RuntimeError("Failed to generate prediagnosis")
+        stored = await run_in_threadpool(_store_result, job, lease_seconds, ai_result)
+    except Exception as e:
+        stored = await run_in_threadpool(_store_failure, job, str(e))
+    if not stored:
+        print(f"Prediagnosis job {job.id} lost its lease to another worker; result discarded")
+
+
+prediagnosis_jobs = PrediagnosisJobQueue(
+    num_workers=PREDIAGNOSIS_JOB_WORKERS,
+    queue_size=PREDIAGNOSIS_JOB_QUEUE_SIZE,
+    lease_seconds=PREDIAGNOSIS_JOB_LEASE_SECONDS,
+)
@@ -0,0 +1,225 @@
+"""
+Prometheus metrics, served at GET /metrics.
+
+Metrics live in prometheus_client's in-process registry: recording one is a lock and
+an add. With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty
+directory (cleared before every start, shared by all workers); each process then
+writes its values to memory-mapped files there and /metrics adds up every process's
+files, whichever worker answers the scrape.
+
+Hit ratios are left to the query, e.g.
+    sum(rate(cache_lookups_total{cache="prediagnosis",result!="miss"}[5m]))
+      / sum(rate(cache_lookups_total{cache="prediagnosis"}[5m]))
+"""
+import os
+import time
+import asyncio
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# prometheus_client picks its storage (in-process or multiprocess files) when imported
+load_dotenv()
+
+import anyio.to_thread
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Configuration
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR', '')  # set for multi-worker deployments
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # when set, /metrics requires "Authorization: Bearer <token>"
+METRICS_SAMPLE_INTERVAL_SECONDS = float(os.getenv('METRICS_SAMPLE_INTERVAL_SECONDS', '1'))  # 0 disables sampling
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+# ============= HTTP =============
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency (streamed responses: until the last chunk)",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress", "Requests being served", multiprocess_mode="livesum",
+)
+threadpool_threads_in_use = Gauge(
+    "threadpool_threads_in_use", "Threadpool workers running sync routes and run_in_threadpool calls (sampled)",
+    multiprocess_mode="livesum",
+)
+threadpool_threads_max = Gauge(
+    "threadpool_threads_max", "Threadpool size", multiprocess_mode="livesum",
+)
+
+# ============= DATABASE =============
+
+db_sessions = Counter("db_sessions", "Request sessions opened", ["kind"])
+db_session_duration = Histogram(
+    "db_session_duration_seconds", "How long a request session stays open", ["kind"], buckets=LATENCY_BUCKETS,
+)
+db_connections_checked_out = Gauge(
+    "db_connections_checked_out", "Pooled connections in use", ["engine"], multiprocess_mode="livesum",
+)
+db_connection_checkouts = Counter("db_connection_checkouts", "Connections taken from the pool", ["engine"])
+db_queries = Counter("db_queries", "Statements executed", ["engine", "statement"])
+db_query_errors = Counter("db_query_errors", "Statements that raised", ["engine"])
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "Statement execution time", ["engine", "statement"], buckets=QUERY_BUCKETS,
+)
+
+# ============= LLM =============
+
+llm_upstream_duration = Histogram(
+    "llm_upstream_duration_seconds", "One attempt against the Anthropic API (streams: until closed)",
+    ["outcome"], buckets=LATENCY_BUCKETS,
+)
+llm_call_duration = Histogram(
+    "llm_call_duration_seconds", "A completed LLM call, retries included", ["purpose"], buckets=LATENCY_BUCKETS,
+)
+llm_client_events = Counter(
+    "llm_client_events", "LLM client calls, errors, retries, hedges and short-circuits", ["event"],
+)
+llm_errors = Counter("llm_errors", "Failed attempts against the Anthropic API", ["error"])
+llm_tokens = Counter("llm_tokens", "Tokens billed", ["purpose", "model", "type"])
+
+# ============= CACHES =============
+
+cache_lookups = Counter("cache_lookups", "Cache lookups by result", ["cache", "result"])
+
+
+# ============= REQUEST MIDDLEWARE =============
+
+class MetricsMiddleware:
+    """
+    Times every HTTP request by method, route template and status. Paths that match no
+    route are reported as "unmatched" so scanners can't grow the label set.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_progress.dec()
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_duration.labels(scope["method"], route, str(status_code)).observe(time.perf_counter() - started)
+
+
+# ============= DATABASE INSTRUMENTATION =============
+
+def statement_type(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    return keyword.lower() if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "other"
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Count and time statements and track pool checkouts of a (sync) engine"""
+    checked_out = db_connections_checked_out.labels(name)
+    checkouts = db_connection_checkouts.labels(name)
+    errors = db_query_errors.labels(name)
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        checked_out.inc()
+        checkouts.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        checked_out.dec()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(connection, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - connection.info["metrics_started"].pop()
+        kind = statement_type(statement)
+        db_queries.labels(name, kind).inc()
+        db_query_duration.labels(name, kind).observe(elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("metrics_started") if context.connection is not None else None
+        if started:
+            started.pop()
+        errors.inc()
+
+
+class SessionTimer:
+    """Counts a request session and times it until closed"""
+
+    def __init__(self, kind: str):
+        self._sessions = db_sessions.labels(kind)
+        self._duration = db_session_duration.labels(kind)
+
+    def __enter__(self):
+        self._sessions.inc()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._duration.observe(time.perf_counter() - self._started)
+
+
+# ============= SAMPLING =============
+
+class MetricsSampler:
+    """Reads gauges that have no event to hook (threadpool use) every `interval_seconds`"""
+
+    def __init__(self, interval_seconds: float = METRICS_SAMPLE_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.interval_seconds > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="metrics-sampler")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if PROMETHEUS_MULTIPROC_DIR:
+            # Drop this process's live gauges; its counters and histograms are kept
+            multiprocess.mark_process_dead(os.getpid())
+
+    def sample(self):
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        threadpool_threads_in_use.set(limiter.borrowed_tokens)
+        threadpool_threads_max.set(limiter.total_tokens)
+
+    async def _loop(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval_seconds)
+
+
+def render() -> bytes:
+    """The exposition text: this process's registry, or every worker's files in multiprocess mode"""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=PROMETHEUS_MULTIPROC_DIR)
+    return generate_latest(registry)
+
+
+metrics_sampler = MetricsSampler()
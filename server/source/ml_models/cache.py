@@ -0,0 +1,329 @@
+import os
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, List
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from ..database import models
+from ..metrics import cache_lookups
+from .suggestions import stream_prediagnosis_async, REQUIRED_FIELDS
+from .engines import prediagnosis_engine
+from .vocabulary import symptom_vocabulary
+
+# Configuration
+PREDIAGNOSIS_CACHE_TTL_SECONDS = int(os.getenv('PREDIAGNOSIS_CACHE_TTL_SECONDS', str(60 * 60 * 24)))  # 24 hours
+PREDIAGNOSIS_CACHE_MAX_ENTRIES = int(os.getenv('PREDIAGNOSIS_CACHE_MAX_ENTRIES', '1024'))  # in memory
+PREDIAGNOSIS_CACHE_DB_MAX_ENTRIES = int(os.getenv('PREDIAGNOSIS_CACHE_DB_MAX_ENTRIES', '100000'))  # in SQLite
+PREDIAGNOSIS_CACHE_TRIM_EVERY = int(os.getenv('PREDIAGNOSIS_CACHE_TRIM_EVERY', '100'))  # stores between table trims
+PREDIAGNOSIS_CACHE_SYNC_INTERVAL_SECONDS = float(os.getenv('PREDIAGNOSIS_CACHE_SYNC_INTERVAL_SECONDS', '1'))  # 0 disables
+
+
+def make_cache_key(symptoms: List[str], medical_history: Optional[dict] = None) -> str:
+    """Stable hash of the sorted canonical symptom names plus the canonical medical history JSON"""
+    canonical_symptoms = sorted(set(symptom_vocabulary.normalize_all(symptoms)))
+    payload = json.dumps(
+        {"symptoms": canonical_symptoms, "medical_history": medical_history or None},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PrediagnosisCache:
+    """
+    Two-level prediagnosis result cache: an in-process LRU in front of the
+    prediagnosis_cache SQLite table. Both levels honour the same TTL.
+    The table is trimmed every `trim_every` stores, so it can run that many rows
+    over db_max_entries in between.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int, db_max_entries: int, trim_every: int = 1):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_entries = max_entries
+        self.db_max_entries = db_max_entries
+        self.trim_every = max(trim_every, 1)
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        self._stores_since_trim = 0
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ============= IN-PROCESS LRU =============
+
+    def lookup(self, key: str) -> Optional[dict]:
+        """Look a key up in memory only. Does not count a miss, since the table may still have it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at <= datetime.now():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        cache_lookups.labels("prediagnosis", "hit").inc()
+        return result
+
+    def _remember(self, key: str, result: dict, expires_at: datetime):
+        with self._lock:
+            self._entries[key] = (expires_at, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def forget(self, key: Optional[str] = None):
+        """Drop one key, or every entry, from memory only"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    # ============= SQLITE BACKING TABLE =============
+
+    def load(self, db: Session, key: str) -> Optional[dict]:
+        """Look a key up in the backing table, promoting it into memory on a hit"""
+        now = datetime.now()
+        entry = db.query(models.PrediagnosisCacheEntry)\
+            .filter(models.PrediagnosisCacheEntry.key == key)\
+            .first()
+
+        if entry is None or entry.expires_at <= now:
+            # End the read transaction so the connection goes back to the pool
+            # while the caller waits on the LLM
+            db.rollback()
+            with self._lock:
+                self.misses += 1
+            cache_lookups.labels("prediagnosis", "miss").inc()
+            return None
+
+        entry.last_accessed_at = now
+        db.commit()
+
+        with self._lock:
+            self.db_hits += 1
+        cache_lookups.labels("prediagnosis", "db_hit").inc()
+        self._remember(key, entry.result, entry.expires_at)
+        return entry.result
+
+    def get(self, db: Session, key: str) -> Optional[dict]:
+        """Look a key up in memory, then in the backing table"""
+        result = self.lookup(key)
+        if result is not None:
+            return result
+        return self.load(db, key)
+
+    def set(self, db: Session, key: str, result: dict):
+        """Store a result in memory and in the backing table"""
+        now = datetime.now()
+        expires_at = now + self.ttl
+
+        entry = db.get(models.PrediagnosisCacheEntry, key)
+        if entry is None:
+            entry = models.PrediagnosisCacheEntry(key=key)
+            db.add(entry)
+        entry.result = result
+        entry.created_at = now
+        entry.last_accessed_at = now
+        entry.expires_at = expires_at
+        db.commit()
+
+        with self._lock:
+            self._stores_since_trim += 1
+            trim = self._stores_since_trim >= self.trim_every
+            if trim:
+                self._stores_since_trim = 0
+        if trim:
+            self._evict_persisted(db, now)
+        self._remember(key, result, expires_at)
+
+    def _evict_persisted(self, db: Session, now: datetime):
+        """Drop expired rows, then the least recently used rows over the size limit"""
+        expired = db.query(models.PrediagnosisCacheEntry)\
+            .filter(models.PrediagnosisCacheEntry.expires_at <= now)\
+            .delete(synchronize_session=False)
+
+        excess = db.query(models.PrediagnosisCacheEntry).count() - self.db_max_entries
+        if excess > 0:
+            oldest = [key for (key,) in db.query(models.PrediagnosisCacheEntry.key)
+                      .order_by(models.PrediagnosisCacheEntry.last_accessed_at.asc())
+                      .limit(excess)]
+            db.query(models.PrediagnosisCacheEntry)\
+                .filter(models.PrediagnosisCacheEntry.key.in_(oldest))\
+                .delete(synchronize_session=False)
+        else:
+            excess = 0
+
+        if expired or excess:
+            db.commit()
+            with self._lock:
+                self.evictions += expired + excess
+
+    # ============= INVALIDATION & STATS =============
+
+    def invalidate(self, db: Session, key: Optional[str] = None) -> int:
+        """
+        Remove one key, or every entry when no key is given. Returns number of rows removed.
+        Other processes drop the key from memory on their next PrediagnosisCacheSync poll.
+        """
+        query = db.query(models.PrediagnosisCacheEntry)
+        if key is not None:
+            query = query.filter(models.PrediagnosisCacheEntry.key == key)
+        removed = query.delete(synchronize_session=False)
+        db.add(models.PrediagnosisCacheInvalidation(key=key, created_at=datetime.now()))
+        db.commit()
+
+        self.forget(key)
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.db_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": int(self.ttl.total_seconds()),
+            }
+
+
+class PrediagnosisCacheSync:
+    """
+    Applies invalidations made by other processes to this process's in-memory LRU:
+    every `interval_seconds` it reads the prediagnosis_cache_invalidations rows added
+    since the last poll and forgets those keys. Rows older than the cache TTL can't
+    matter to any cache and are pruned.
+    """
+
+    def __init__(self, cache: PrediagnosisCache, interval_seconds: float = PREDIAGNOSIS_CACHE_SYNC_INTERVAL_SECONDS):
+        self.cache = cache
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._last_id = 0
+        self._last_pruned = datetime.min
+
+    async def start(self):
+        if self.interval_seconds > 0 and self.cache.max_entries > 0 and self._task is None:
+            self._last_id = await run_in_threadpool(self._latest_id)
+            self._task = asyncio.create_task(self._loop(), name="prediagnosis-cache-sync")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _latest_id(self) -> int:
+        with models.SessionLocal() as db:
+            return db.execute(select(func.max(models.PrediagnosisCacheInvalidation.id))).scalar() or 0
+
+    def poll(self) -> int:
+        """Forget the keys invalidated elsewhere since the last poll; returns how many rows were applied"""
+        Invalidation = models.PrediagnosisCacheInvalidation
+        with models.SessionLocal() as db:
+            rows = db.execute(
+                select(Invalidation.id, Invalidation.key)
+                .where(Invalidation.id > self._last_id)
+                .order_by(Invalidation.id)
+            ).all()
+            for row in rows:
+                self.cache.forget(row.key)
+            if rows:
+                self._last_id = rows[-1].id
+
+            now = datetime.now()
+            if now - self._last_pruned >= self.cache.ttl:
+                db.query(Invalidation).filter(Invalidation.created_at < now - self.cache.ttl)\
+                    .delete(synchronize_session=False)
+                db.commit()
+                self._last_pruned = now
+        return len(rows)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await run_in_threadpool(self.poll)
+            except Exception as e:
+                print(f"Error syncing the prediagnosis cache: {e}")
+
+
+prediagnosis_cache = PrediagnosisCache(
+    ttl_seconds=PREDIAGNOSIS_CACHE_TTL_SECONDS,
+    max_entries=PREDIAGNOSIS_CACHE_MAX_ENTRIES,
+    db_max_entries=PREDIAGNOSIS_CACHE_DB_MAX_ENTRIES,
+    trim_every=PREDIAGNOSIS_CACHE_TRIM_EVERY,
+)
+prediagnosis_cache_sync = PrediagnosisCacheSync(prediagnosis_cache)
+
+
+def _in_session(method, db: Optional[Session], *args):
+    """Call a cache method with `db`, or with a session of its own when db is None"""
+    if db is not None:
+        return method(db, *args)
+    with models.SessionLocal() as own:
+        return method(own, *args)
+
+
+async def generate_prediagnosis_cached(db: Optional[Session], symptoms: List[str], medical_history: Optional[dict] = None):
+    """
+    Serve a prediagnosis from the cache or the local engine, falling back to the LLM
+    and caching its result. With db=None each table step opens its own session, for
+    callers that may be cancelled while one of those steps is still running in a thread.
+    """
+    key = make_cache_key(symptoms, medical_history)
+    patient_data = {"symptoms": symptoms}
+
+    # Memory hits and the local engine never leave the event loop;
+    # table lookups and writes go to the threadpool
+    result = prediagnosis_cache.lookup(key)
+    if result is None:
+        result = prediagnosis_engine.predict_local(patient_data, medical_history)
+    if result is None:
+        result = await run_in_threadpool(_in_session, prediagnosis_cache.load, db, key)
+    if result is not None:
+        return result
+
+    result = await prediagnosis_engine.predict_remote(patient_data, medical_history)
+    if result:
+        await run_in_threadpool(_in_session, prediagnosis_cache.set, db, key, result)
+    return result
+
+
+async def stream_prediagnosis_cached(db: Optional[Session], symptoms: List[str], medical_history: Optional[dict] = None):
+    """Streaming variant of generate_prediagnosis_cached. Yields (field, value) pairs"""
+    key = make_cache_key(symptoms, medical_history)
+
+    result = prediagnosis_cache.lookup(key)
+    if result is None:
+        result = prediagnosis_engine.predict_local({"symptoms": symptoms}, medical_history)
+    if result is None:
+        result = await run_in_threadpool(_in_session, prediagnosis_cache.load, db, key)
+    if result is not None:
+        for field in REQUIRED_FIELDS:
+            yield field, result[field]
+        return
+
+    result = {}
+    async for field, value in stream_prediagnosis_async({"symptoms": symptoms}, medical_history):
+        result[field] = value
+        yield field, value
+
+    await run_in_threadpool(_in_session, prediagnosis_cache.set, db, key, result)
@@ -0,0 +1,50 @@
+import os
+import time
+from typing import List
+
+from .llm_client import llm
+from .usage import record_llm_usage_async
+
+# Configuration
+CHAT_CONTEXT_MESSAGES = int(os.getenv('CHAT_CONTEXT_MESSAGES', '20'))  # latest messages sent as context
+CHAT_MAX_TOKENS = int(os.getenv('CHAT_MAX_TOKENS', '4096'))
+
+CHAT_MODEL = "claude-sonnet-4-5-20250929"
+
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful healthcare AI assistant. You provide information and support but always "
+    "remind users to consult with healthcare professionals for medical advice. Be empathetic, "
+    "clear, and professional."
+)
+
+
+def build_chat_messages(history: List[dict]) -> List[dict]:
+    """
+    Anthropic messages from stored conversation messages (oldest first).
+    System messages are dropped and the list starts at the first user message,
+    so a stored greeting from the assistant isn't sent as the opening turn.
+    """
+    messages = [
+        {"role": message["role"], "content": message["content"]}
+        for message in history
+        if message["role"] in ("user", "assistant")
+    ]
+    while messages and messages[0]["role"] != "user":
+        messages.pop(0)
+    return messages
+
+
+async def stream_chat_reply(history: List[dict]):
+    """Stream the assistant's reply to a conversation, yielding text chunks as they arrive"""
+    started = time.perf_counter()
+    async with llm.stream(
+        model=CHAT_MODEL,
+        max_tokens=CHAT_MAX_TOKENS,
+        system=CHAT_SYSTEM_PROMPT,
+        messages=build_chat_messages(history),
+    ) as stream:
+        async for text in stream.text_stream:
+            yield text
+        final_message = await stream.get_final_message()
+
+    await record_llm_usage_async("chat", CHAT_MODEL, final_message.usage, time.perf_counter() - started)
@@ -0,0 +1,301 @@
+import os
+import re
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, List
+
+from .suggestions import generate_prediagnosis_async, generate_prediagnosis_sync
+from .vocabulary import symptom_vocabulary
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the local engine
+    np = None
+
+# Configuration
+LOCAL_MODEL_PATH = os.getenv('LOCAL_MODEL_PATH')  # local engine is disabled when unset
+LOCAL_ENGINE_CONFIDENCE_THRESHOLD = float(os.getenv('LOCAL_ENGINE_CONFIDENCE_THRESHOLD', '0.6'))
+LOCAL_ENGINE_TOP_K = int(os.getenv('LOCAL_ENGINE_TOP_K', '3'))
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class EngineStats:
+    """Per-engine call, fallback and latency counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.answered = 0
+        self.fallbacks = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float, answered: bool, error: bool = False):
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            if error:
+                self.errors += 1
+            elif answered:
+                self.answered += 1
+            else:
+                self.fallbacks += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "answered": self.answered,
+                "fallbacks": self.fallbacks,
+                "errors": self.errors,
+                "avg_ms": (self.total_seconds / self.calls) * 1000 if self.calls else 0.0,
+                "max_ms": self.max_seconds * 1000,
+            }
+
+
+class PrediagnosisEngine(ABC):
+    """
+    Interface for anything that can produce a prediagnosis.
+    Both methods return a dict with the four response fields (and optionally a
+    'confidence' in [0, 1]), or None when the engine has no answer. predict_sync
+    blocks: in-process engines run it on the event loop, others only off it.
+    """
+
+    name = "engine"
+    in_process = False  # True for engines that never leave the process
+
+    @abstractmethod
+    async def predict(self, patient_data: dict, medical_history: Optional[dict] = None) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def predict_sync(self, patient_data: dict, medical_history: Optional[dict] = None) -> Optional[dict]:
+        ...
+
+
+class AnthropicEngine(PrediagnosisEngine):
+    """The LLM path: always answers unless the call fails"""
+
+    name = "anthropic"
+
+    async def predict(self, patient_data, medical_history=None):
+        return await generate_prediagnosis_async(patient_data, medical_history)
+
+    def predict_sync(self, patient_data, medical_history=None):
+        return generate_prediagnosis_sync(patient_data, medical_history)
+
+
+# ============= LOCAL ENGINE =============
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def history_terms(medical_history: Optional[dict]) -> List[str]:
+    """Pull the free-text terms worth scoring out of a medical history record"""
+    if not medical_history:
+        return []
+    terms = []
+    for condition in _entries(medical_history.get("chronic_conditions")):
+        terms.append(str(condition.get("condition", "")) if isinstance(condition, dict) else str(condition))
+    for medication in _entries(medical_history.get("current_medications")):
+        terms.append(str(medication.get("name", "")) if isinstance(medication, dict) else str(medication))
+    terms.extend(str(allergy) for allergy in _entries(medical_history.get("allergies")))
+    return terms
+
+
+def _entries(value) -> list:
+    """A history field as a list; a plain string ("Penicillin") is one entry, not its characters"""
+    if not value:
+        return []
+    if isinstance(value, (str, dict)):
+        return [value]
+    return list(value)
+
+
+class LocalModel:
+    """
+    Bag-of-words disease model.
+    weights is a (labels x vocabulary) matrix whose rows are L2-normalized, so
+    scoring a binary symptom vector is a cosine similarity per label.
+    """
+
+    def __init__(self, vocabulary: List[str], labels: List[dict], weights):
+        self.vocabulary = {term: i for i, term in enumerate(vocabulary)}
+        self.labels = labels
+        weights = np.asarray(weights, dtype=np.float32)
+        if weights.shape != (len(labels), len(vocabulary)):
+            raise ValueError(f'Weight matrix shape {weights.shape} does not match '
+                             f'{len(labels)} labels x {len(vocabulary)} terms')
+        norms = np.linalg.norm(weights, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.weights = weights / norms
+
+    def encode(self, texts: List[str]) -> "np.ndarray":
+        """Indices of the vocabulary terms present in the texts (the sparse binary vector)"""
+        indices = {self.vocabulary[token] for text in texts for token in tokenize(text) if token in self.vocabulary}
+        return np.fromiter(indices, dtype=np.intp, count=len(indices))
+
+    def score(self, indices: "np.ndarray") -> "np.ndarray":
+        """Cosine similarity of each label against the binary vector"""
+        if indices.size == 0:
+            return np.zeros(len(self.labels), dtype=np.float32)
+        return self.weights[:, indices].sum(axis=1) / np.sqrt(indices.size)
+
+
+def load_local_model(path: str) -> LocalModel:
+    """
+    Load a local model file.
+    .json: {"vocabulary": [...], "labels": [...], "weights": [[...], ...]}
+    .npz:  arrays "weights" and "vocabulary", plus "labels" holding the labels list as a JSON string
+    """
+    if np is None:
+        raise RuntimeError("numpy is required for the local prediagnosis engine")
+
+    if path.endswith(".npz"):
+        with np.load(path, allow_pickle=False) as data:
+            return LocalModel(
+                vocabulary=[str(term) for term in data["vocabulary"]],
+                labels=json.loads(str(data["labels"])),
+                weights=data["weights"],
+            )
+
+    with open(path) as f:
+        data = json.load(f)
+    return LocalModel(data["vocabulary"], data["labels"], data["weights"])
+
+
+class LocalEngine(PrediagnosisEngine):
+    """Scores symptoms + history against the local model; only answers above the confidence threshold"""
+
+    name = "local"
+    in_process = True
+
+    def __init__(self, model: LocalModel, threshold: float, top_k: int = 3):
+        self.model = model
+        self.threshold = threshold
+        self.top_k = top_k
+
+    def predict_sync(self, patient_data, medical_history=None):
+        # The model's vocabulary is built on canonical symptom names
+        symptoms = symptom_vocabulary.normalize_all(patient_data.get("symptoms") or [])
+        indices = self.model.encode(symptoms + history_terms(medical_history))
+        scores = self.model.score(indices)
+        if not scores.size:
+            return None
+
+        ranked = np.argsort(scores)[::-1][:self.top_k]
+        confidence = float(scores[ranked[0]])
+        if confidence < self.threshold:
+            return None
+
+        # Keep runners-up that score close to the best label
+        top = [self.model.labels[i] for i in ranked if scores[i] >= confidence * 0.75]
+        practitioners = []
+        for label in top:
+            for practitioner in label.get("recommended_practitioners", "").split(","):
+                practitioner = practitioner.strip()
+                if practitioner and practitioner not in practitioners:
+                    practitioners.append(practitioner)
+
+        return {
+            "potential_diseases": ", ".join(label["disease"] for label in top),
+            "course_of_action": top[0].get("course_of_action", ""),
+            "support_messages": top[0].get("support_messages", ""),
+            "recommended_practitioners": ", ".join(practitioners),
+            "confidence": confidence,
+        }
+
+    async def predict(self, patient_data, medical_history=None):
+        return self.predict_sync(patient_data, medical_history)
+
+
+# ============= ENGINE CHAIN =============
+
+class EngineChain:
+    """Tries engines in order and returns the first answer, recording latency per engine"""
+
+    def __init__(self, engines: List[PrediagnosisEngine]):
+        self.engines = engines
+        self.stats = {engine.name: EngineStats() for engine in engines}
+
+    def _record(self, engine, started, result, error=False):
+        self.stats[engine.name].record(time.perf_counter() - started, answered=result is not None, error=error)
+
+    def _first_answer_sync(self, engines, patient_data, medical_history) -> Optional[dict]:
+        for engine in engines:
+            started = time.perf_counter()
+            try:
+                result = engine.predict_sync(patient_data, medical_history)
+            except Exception as e:
+                print(f"Error in {engine.name} prediagnosis engine: {e}")
+                self._record(engine, started, None, error=True)
+                continue
+            self._record(engine, started, result)
+            if result is not None:
+                return result
+        return None
+
+    def predict_local(self, patient_data, medical_history=None) -> Optional[dict]:
+        """Run only the in-process engines. Cheap enough to call on the event loop"""
+        local = [engine for engine in self.engines if engine.in_process]
+        return self._first_answer_sync(local, patient_data, medical_history)
+
+    async def predict_remote(self, patient_data, medical_history=None) -> Optional[dict]:
+        """Run the remaining (network-backed) engines in order"""
+        for engine in self.engines:
+            if engine.in_process:
+                continue
+            started = time.perf_counter()
+            try:
+                result = await engine.predict(patient_data, medical_history)
+            except Exception as e:
+                print(f"Error in {engine.name} prediagnosis engine: {e}")
+                self._record(engine, started, None, error=True)
+                continue
+            self._record(engine, started, result)
+            if result is not None:
+                return result
+        return None
+
+    async def predict(self, patient_data, medical_history=None) -> Optional[dict]:
+        result = self.predict_local(patient_data, medical_history)
+        if result is None:
+            result = await self.predict_remote(patient_data, medical_history)
+        return result
+
+    def predict_sync(self, patient_data, medical_history=None) -> Optional[dict]:
+        """Blocking variant of predict for sync callers: every engine in order, via predict_sync"""
+        return self._first_answer_sync(self.engines, patient_data, medical_history)
+
+    def snapshot(self) -> dict:
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+
+def build_engine_chain() -> EngineChain:
+    """Local engine first (when a model is configured), then the Anthropic fallback"""
+    engines: List[PrediagnosisEngine] = []
+    if LOCAL_MODEL_PATH:
+        try:
+            engines.append(LocalEngine(
+                load_local_model(LOCAL_MODEL_PATH),
+                threshold=LOCAL_ENGINE_CONFIDENCE_THRESHOLD,
+                top_k=LOCAL_ENGINE_TOP_K,
+            ))
+        except Exception as e:
+            print(f"Local prediagnosis engine disabled, could not load {LOCAL_MODEL_PATH}: {e}")
+    engines.append(AnthropicEngine())
+    return EngineChain(engines)
+
+
+prediagnosis_engine = build_engine_chain()
+
+
+def generate_prediagnosis(patient_data, medical_history=None) -> Optional[dict]:
+    """Blocking prediagnosis: the local engine when it is confident, else the LLM"""
+    return prediagnosis_engine.predict_sync(patient_data, medical_history)
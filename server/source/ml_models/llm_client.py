@@ -0,0 +1,439 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import anthropic
+import httpx
+from dotenv import load_dotenv
+
+from ..metrics import llm_client_events, llm_errors, llm_upstream_duration
+
+load_dotenv()
+
+# Configuration
+ANTH_API_KEY = os.getenv('ANTH_API_KEY')
+ANTHROPIC_BASE_URL = os.getenv('ANTHROPIC_BASE_URL')  # point at a fake server in tests/benchmarks
+
+LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', '30'))  # total budget per call, retries included
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv('LLM_CONNECT_TIMEOUT_SECONDS', '5'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+LLM_RETRY_BASE_DELAY_SECONDS = float(os.getenv('LLM_RETRY_BASE_DELAY_SECONDS', '0.25'))
+LLM_RETRY_MAX_DELAY_SECONDS = float(os.getenv('LLM_RETRY_MAX_DELAY_SECONDS', '4'))
+
+LLM_HEDGE_ENABLED = os.getenv('LLM_HEDGE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', '95'))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20'))
+
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('LLM_CIRCUIT_FAILURE_THRESHOLD', '5'))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv('LLM_CIRCUIT_RESET_SECONDS', '30'))
+
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '100'))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '20'))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv('LLM_KEEPALIVE_EXPIRY_SECONDS', '30'))
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """Connection problems, timeouts, rate limits and upstream 5xx/overloaded responses"""
+    if isinstance(error, (anthropic.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Upstream's retry-after hint, if it sent one"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures and fails fast for
+    `reset_seconds`, then lets a single trial call through (half-open) to decide.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release_trial(self):
+        """
+        Give up a half-open trial that ended without a verdict (cancelled, e.g. the client
+        disconnected), so the next call can run the trial instead of failing fast forever.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < max(min_samples, 1):
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class DeadlineStream:
+    """
+    Wraps an SDK message stream so every read shares one absolute deadline (the SDK's
+    timeout only bounds each read, so a stream that keeps trickling could run forever).
+    Keeps the error a read raised, so the client can tell upstream failures from the caller's.
+    """
+
+    def __init__(self, stream, deadline: float):
+        self._stream = stream
+        self._deadline = deadline
+        self.upstream_error: Optional[Exception] = None
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    async def _bounded(self, iterable):
+        iterator = iterable.__aiter__()
+        while True:
+            try:
+                async with asyncio.timeout_at(self._deadline):
+                    item = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                self.upstream_error = e
+                raise
+            yield item
+
+    def __aiter__(self):
+        return self._bounded(self._stream)
+
+    @property
+    def text_stream(self):
+        return self._bounded(self._stream.text_stream)
+
+    async def get_final_message(self):
+        try:
+            async with asyncio.timeout_at(self._deadline):
+                return await self._stream.get_final_message()
+        except Exception as e:
+            self.upstream_error = e
+            raise
+
+
+class ResilientLLMClient:
+    """
+    Anthropic client wrapper adding per-call deadline budgets, jittered retries for
+    retryable errors, optional hedged requests past the p95 latency, and a circuit breaker.
+    The SDK's own retries are disabled so this layer owns the retry budget.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = ANTH_API_KEY,
+        base_url: Optional[str] = ANTHROPIC_BASE_URL,
+        deadline_seconds: float = LLM_DEADLINE_SECONDS,
+        max_retries: int = LLM_MAX_RETRIES,
+        retry_base_delay: float = LLM_RETRY_BASE_DELAY_SECONDS,
+        retry_max_delay: float = LLM_RETRY_MAX_DELAY_SECONDS,
+        hedge_enabled: bool = LLM_HEDGE_ENABLED,
+        hedge_percentile: float = LLM_HEDGE_PERCENTILE,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker(LLM_CIRCUIT_FAILURE_THRESHOLD, LLM_CIRCUIT_RESET_SECONDS)
+        self.latency = LatencyTracker()
+
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "errors": 0, "retries": 0, "hedges": 0, "hedge_wins": 0, "short_circuited": 0}
+
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+        )
+        timeout = httpx.Timeout(deadline_seconds, connect=LLM_CONNECT_TIMEOUT_SECONDS)
+
+        self.sync_client = anthropic.Anthropic(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            timeout=timeout,
+            http_client=anthropic.DefaultHttpxClient(limits=limits, timeout=timeout),
+        )
+        self.async_client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            timeout=timeout,
+            http_client=anthropic.DefaultAsyncHttpxClient(limits=limits, timeout=timeout),
+        )
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+        llm_client_events.labels(key).inc(amount)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, or upstream's retry-after when given"""
+        hinted = retry_after_seconds(error)
+        if hinted is not None:
+            return min(hinted, self.retry_max_delay)
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * (2 ** attempt)))
+
+    def _check_breaker(self):
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError("LLM upstream is degraded; failing fast")
+
+    def _record_outcome(self, error: Optional[Exception], started: float):
+        elapsed = time.perf_counter() - started
+        llm_upstream_duration.labels("success" if error is None else "error").observe(elapsed)
+        if error is not None:
+            llm_errors.labels(type(error).__name__).inc()
+
+        if error is None:
+            self.breaker.record_success()
+            self.latency.record(elapsed)
+        elif is_retryable(error):
+            self.breaker.record_failure()
+            self._count("errors")
+        else:
+            # Client errors (bad request, auth) say nothing about upstream health
+            self.breaker.record_success()
+            self._count("errors")
+
+    def _record_timeout(self):
+        # The timed-out call was cancelled before it could record its own outcome
+        llm_errors.labels("TimeoutError").inc()
+        self.breaker.record_failure()
+        self._count("errors")
+
+    # ============= ASYNC =============
+
+    async def _call_once(self, kwargs: dict, timeout: float):
+        started = time.perf_counter()
+        try:
+            response = await self.async_client.messages.create(**kwargs, timeout=timeout)
+        except Exception as e:
+            self._record_outcome(e, started)
+            raise
+        self._record_outcome(None, started)
+        return response
+
+    async def _hedged_call(self, kwargs: dict, timeout: float):
+        """Send the request; if it is still pending past the p95 latency, race a second copy"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        hedge_after = self.latency.percentile(self.hedge_percentile, self.hedge_min_samples) \
+            if self.hedge_enabled else None
+        if hedge_after is None or hedge_after >= timeout:
+            try:
+                return await asyncio.wait_for(self._call_once(kwargs, timeout), timeout)
+            except asyncio.TimeoutError:
+                self._record_timeout()
+                raise
+
+        primary = asyncio.ensure_future(self._call_once(kwargs, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        self._count("hedges")
+        hedge = asyncio.ensure_future(self._call_once(kwargs, max(deadline - loop.time(), 0.001)))
+        pending = {primary, hedge}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(deadline - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self._record_timeout()
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+
+    async def create(self, deadline_seconds: Optional[float] = None, **kwargs):
+        """messages.create with deadline, retries, hedging and circuit breaking"""
+        self._count("calls")
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        attempt = 0
+        while True:
+            self._check_breaker()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError("LLM deadline exceeded")
+            try:
+                return await self._hedged_call(kwargs, remaining)
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                self._count("retries")
+                await asyncio.sleep(delay)
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+
+    @asynccontextmanager
+    async def stream(self, deadline_seconds: Optional[float] = None, **kwargs):
+        """
+        messages.stream with a deadline and circuit breaking. Streams are not retried or
+        hedged, since the caller may already have forwarded part of the response. The deadline
+        covers the whole stream, raising TimeoutError once it has passed.
+        Only errors from opening or reading the stream count as its outcome; an exception
+        from the caller's own block (a disconnect, a parse error) just propagates.
+        """
+        self._count("calls")
+        self._check_breaker()
+        started = time.perf_counter()
+        timeout = deadline_seconds or self.deadline_seconds
+        deadline = asyncio.get_running_loop().time() + timeout
+        wrapped = None
+        try:
+            # The per-read timeout bounds opening the stream; DeadlineStream bounds the rest
+            async with self.async_client.messages.stream(**kwargs, timeout=timeout) as stream:
+                wrapped = DeadlineStream(stream, deadline)
+                yield wrapped
+        except Exception as e:
+            if wrapped is None or wrapped.upstream_error is e:
+                self._record_outcome(e, started)
+            else:
+                self.breaker.release_trial()
+            raise
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+        self._record_outcome(None, started)
+
+    # ============= SYNC =============
+
+    def create_sync(self, deadline_seconds: Optional[float] = None, **kwargs):
+        """Blocking messages.create with deadline, retries and circuit breaking (no hedging)"""
+        self._count("calls")
+        deadline = time.monotonic() + (deadline_seconds or self.deadline_seconds)
+        attempt = 0
+        while True:
+            self._check_breaker()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("LLM deadline exceeded")
+            started = time.perf_counter()
+            try:
+                response = self.sync_client.messages.create(**kwargs, timeout=remaining)
+            except Exception as e:
+                self._record_outcome(e, started)
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt, e)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                self._count("retries")
+                time.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            self._record_outcome(None, started)
+            return response
+
+    def snapshot(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["circuit_state"] = self.breaker.state
+        stats["circuit_opened"] = self.breaker.times_opened
+        stats["p95_ms"] = (self.latency.percentile(95) or 0.0) * 1000
+        return stats
+
+
+llm = ResilientLLMClient()
@@ -1,15 +1,75 @@
 import os
-import anthropic
+import time
+import asyncio
 from dotenv import load_dotenv
 import json
+import threading
+
+from .llm_client import llm
+from .usage import record_llm_usage, record_llm_usage_async
+from .. import schemas
 
 load_dotenv()
 
-ANTH_API_KEY = os.getenv('ANTH_API_KEY')
+# Upper bound on prediagnosis calls awaiting the LLM at the same time
+PREDIAGNOSIS_MAX_CONCURRENCY = int(os.getenv('PREDIAGNOSIS_MAX_CONCURRENCY', '100'))
+
+PREDIAGNOSIS_MODEL = "claude-3-5-haiku-20241022"
+
+REQUIRED_FIELDS = ["potential_diseases", "course_of_action", "support_messages", "recommended_practitioners"]
+
+# Fields a prediagnosis is useless without; the others may be repaired to empty strings
+ESSENTIAL_FIELDS = ["potential_diseases", "course_of_action"]
+
+SYSTEM_PROMPT = """
+    You are a medical expert trying to prediagnose a patient and eventually send that data
+    to a doctor for further investigation. Your job is to locate their potential diseases,
+    recommend a light course of action while waiting for the doctor's response, offer some stress
+    relief messages, and recommend which types of practitioners to see. Your recommended course of actions
+    should not be exhaustive and create unnecessary stress.
+
+    Record your answer by calling the record_prediagnosis tool. Every value is plain text, although
+    the values may be longer or shorter than in this example:
+    {
+        "potential_diseases" : "stroke, heart disease, lung cancer, etc.",
+        "course_of_action" : "I recommend you to reduce the amount of sugar and carbohydrate intake. Additionally, you can move around your right arm for better blood circulation.",
+        "support_messages" : "Your symptoms are highly treatable and your local physicians have great ratings!",
+        "recommended_practitioners" : "general physician, orthopedic, ER"
+    }
+"""
+
+# Static few-shot examples appended to the system prompt. They sit inside the cached prefix,
+# so keep them free of anything request-specific.
+PREDIAGNOSIS_EXAMPLES = []
+
+def build_system_blocks():
+    """System prompt blocks, with a prompt-cache breakpoint after the last static block."""
+    blocks = [{"type": "text", "text": SYSTEM_PROMPT}]
+    blocks += [{"type": "text", "text": example} for example in PREDIAGNOSIS_EXAMPLES]
+    blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+SYSTEM_BLOCKS = build_system_blocks()
 
-client = anthropic.Anthropic(
-    api_key=ANTH_API_KEY
-)
+def build_prediagnosis_schema():
+    """JSON schema for the tool input, derived from the generated fields of PrediagnosisResponse."""
+    response_schema = schemas.PrediagnosisResponse.model_json_schema()
+    return {
+        "type": "object",
+        "properties": {field: dict(response_schema["properties"][field]) for field in REQUIRED_FIELDS},
+        "required": list(REQUIRED_FIELDS),
+        "additionalProperties": False,
+    }
+
+# Forcing this tool makes the model return schema-shaped JSON instead of free text
+PREDIAGNOSIS_TOOL = {
+    "name": "record_prediagnosis",
+    "description": "Record the prediagnosis for the patient.",
+    "input_schema": build_prediagnosis_schema(),
+}
+PREDIAGNOSIS_TOOL_CHOICE = {"type": "tool", "name": PREDIAGNOSIS_TOOL["name"]}
+
+_prediagnosis_slots = asyncio.Semaphore(PREDIAGNOSIS_MAX_CONCURRENCY)
 
 def extract_json_from_text(text):
     """Extract JSON from text that might contain markdown code blocks or extra text."""
@@ -33,50 +93,315 @@ def extract_json_from_text(text):
 
     return json_str
 
-def generate_prediagnosis(patient_data, medical_history: None):
-    system_prompt = """
-        You are a medical expert trying to prediagnose a patient and eventually send that data
-        to a doctor for further investigation. Your job is to locate their potential diseases,
-        recommend a light course of action while waiting for the doctor's response, offer some stress
-        relief messages, and recommend which types of practitioners to see. Your recommended course of actions
-        should not be exhaustive and create unnecessary stress.
-
-        Return your answer in a valid JSON structure strictly following these given keys, although the values may be longer or shorter.
-        Return ONLY the JSON object without any markdown formatting or additional text.
-        {
-            "potential_diseases" : "stroke, heart disease, lung cancer, etc.",
-            "course_of_action" : "I recommend you to reduce the amount of sugar and carbohydrate intake. Additionally, you can move around your right arm for better blood circulation.",
-            "support_messages" : "Your symptoms are highly treatable and your local physicians have great ratings!",
-            "recommended_practitioners" : "general physician, orthopedic, ER"
-        }
-    """
-
+def build_user_content(patient_data, medical_history=None):
+    """Build the user prompt sent to the model."""
     user_content = f'Generate a prediagnosis based on the following data: {patient_data}'
     if medical_history:
         user_content += f'\nand on the given patient medical history: {medical_history}'
+    return user_content
+
+class ParseStats:
+    """Counts how prediagnosis responses parsed: clean, repaired without a new model call, or failed"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clean = 0
+        self.repaired = 0
+        self.failed = 0
+
+    def record(self, outcome):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            total = self.clean + self.repaired + self.failed
+            return {
+                "total": total,
+                "clean": self.clean,
+                "repaired": self.repaired,
+                "failed": self.failed,
+                "failure_rate": self.failed / total if total else 0.0,
+                "repair_rate": self.repaired / total if total else 0.0,
+            }
+
+parse_stats = ParseStats()
+
+def repair_json_text(text):
+    """
+    Best-effort repair of almost-JSON: drops text before the first brace, trailing commas,
+    and closes an unterminated string and any unclosed objects/arrays (e.g. a truncated response).
+    """
+    start = text.find("{")
+    if start == -1:
+        raise ValueError('No JSON object found in response')
+    text = text[start:]
+
+    out = []
+    closers = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            out.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]":
+            # Trailing comma before a closer
+            while out and out[-1] in " \t\r\n,":
+                out.pop()
+            if closers:
+                closers.pop()
+            out.append(char)
+            if not closers:
+                break
+            continue
+        out.append(char)
+
+    if in_string:
+        if escaped:
+            out.pop()
+        out.append('"')
+    while out and out[-1] in " \t\r\n,:":
+        out.pop()
+    out.extend(reversed(closers))
+    return "".join(out)
+
+def coerce_field(value):
+    """Coerce a field value to text. Returns (text, repaired)"""
+    if isinstance(value, str):
+        return value, False
+    if value is None:
+        return "", True
+    if isinstance(value, list):
+        return ", ".join(str(item) for item in value), True
+    if isinstance(value, dict):
+        return ", ".join(f"{key}: {item}" for key, item in value.items()), True
+    return str(value), True
+
+def validate_prediagnosis(data):
+    """Validate a decoded prediagnosis against the schema. Returns (prediagnosis, repaired)"""
+    if not isinstance(data, dict):
+        raise ValueError('Prediagnosis is not a JSON object')
+
+    result = {}
+    repaired = False
+    for field in REQUIRED_FIELDS:
+        value, field_repaired = coerce_field(data.get(field))
+        if not value.strip() and field in ESSENTIAL_FIELDS:
+            raise ValueError(f'Missing required field: {field}')
+        result[field] = value
+        repaired = repaired or field_repaired
+
+    return result, repaired
+
+def decode_prediagnosis_text(text_response):
+    """Decode a text response, repairing it locally if it isn't valid JSON. Returns (data, repaired)"""
+    # Extract JSON from the response (handles markdown code blocks)
+    json_str = extract_json_from_text(text_response)
     try:
-        response = client.messages.create(
-            model = "claude-3-5-haiku-20241022",
-            max_tokens = 2000,
-            temperature = 0.1,
-            system = system_prompt,
-            messages = [
-                {"role": "user", "content": user_content}
-            ]
+        return json.loads(json_str), False
+    except json.JSONDecodeError:
+        return json.loads(repair_json_text(json_str if "{" in json_str else text_response)), True
+
+def parse_prediagnosis_response(response):
+    """
+    Single-pass parse of a messages response into a validated prediagnosis dict.
+    Prefers the forced tool call; falls back to JSON in text blocks. Raises if it can't be repaired.
+    """
+    try:
+        tool_input = next(
+            (block.input for block in response.content
+             if getattr(block, "type", None) == "tool_use" and block.name == PREDIAGNOSIS_TOOL["name"]),
+            None
         )
+        if tool_input is not None:
+            data, repaired = tool_input, False
+        else:
+            text = "".join(block.text for block in response.content if getattr(block, "type", None) == "text")
+            data, repaired = decode_prediagnosis_text(text)
+
+        prediagnosis, coerced = validate_prediagnosis(data)
+    except Exception:
+        parse_stats.record("failed")
+        raise
+
+    parse_stats.record("repaired" if repaired or coerced else "clean")
+    return prediagnosis
 
-        text_response = response.content[0].text
-        # Extract JSON from the response (handles markdown code blocks)
-        json_str = extract_json_from_text(text_response)
-        prediagnosis_data = json.loads(json_str)
+def parse_prediagnosis(text_response):
+    """Parse a plain-text model response into a prediagnosis dict."""
+    data, _ = decode_prediagnosis_text(text_response)
+    prediagnosis, _ = validate_prediagnosis(data)
+    return prediagnosis
 
-        required_fields = ["potential_diseases", "course_of_action", "support_messages", "recommended_practitioners"]
-        for field in required_fields:
-            if field not in prediagnosis_data:
-                raise ValueError(f'Missing required field: {field}')
-            
-        return prediagnosis_data
+def build_request(patient_data, medical_history=None):
+    """Keyword arguments shared by every prediagnosis messages call."""
+    return {
+        "model": PREDIAGNOSIS_MODEL,
+        "max_tokens": 2000,
+        "temperature": 0.1,
+        "system": SYSTEM_BLOCKS,
+        "tools": [PREDIAGNOSIS_TOOL],
+        "tool_choice": PREDIAGNOSIS_TOOL_CHOICE,
+        "messages": [
+            {"role": "user", "content": build_user_content(patient_data, medical_history)}
+        ],
+    }
+
+class PrediagnosisStreamParser:
+    """
+    Incremental parser for the streamed JSON response.
+    Feed it text deltas; it returns each top-level (field, value) pair as soon as the value is complete.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.fields = {}
+        self._decoder = json.JSONDecoder()
+
+    def _skip(self, i, chars=" \t\r\n"):
+        while i < len(self.buffer) and self.buffer[i] in chars:
+            i += 1
+        return i
+
+    def feed(self, text):
+        self.buffer += text
+        completed = []
+
+        if not self.started:
+            # Skip any markdown fence or prose before the object
+            start = self.buffer.find("{", self.pos)
+            if start == -1:
+                self.pos = len(self.buffer)
+                return completed
+            self.pos = start + 1
+            self.started = True
+
+        while not self.finished:
+            i = self._skip(self.pos, " \t\r\n,")
+            if i >= len(self.buffer):
+                break
+            if self.buffer[i] == "}":
+                self.finished = True
+                break
+
+            try:
+                key, i = self._decoder.raw_decode(self.buffer, i)
+            except json.JSONDecodeError:
+                break
+            i = self._skip(i)
+            if i >= len(self.buffer):
+                break
+            if self.buffer[i] != ":":
+                raise ValueError(f'Malformed JSON near position {i}')
+            i = self._skip(i + 1)
+            if i >= len(self.buffer):
+                break
+
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, i)
+            except json.JSONDecodeError:
+                break
+            # A number is only complete once a delimiter follows it ("0" may become "0.75")
+            if not isinstance(value, (str, dict, list)) and (
+                end >= len(self.buffer) or self.buffer[end] not in ",} \t\r\n"
+            ):
+                break
+
+            self.fields[key] = value
+            completed.append((key, value))
+            self.pos = end
+
+        return completed
+
+def generate_prediagnosis_sync(patient_data, medical_history=None):
+    """
+    Blocking LLM prediagnosis. Callers go through engines.generate_prediagnosis, which
+    tries the local engine first.
+    """
+    try:
+        started = time.perf_counter()
+        response = llm.create_sync(**build_request(patient_data, medical_history))
+        record_llm_usage("prediagnosis", PREDIAGNOSIS_MODEL, response.usage, time.perf_counter() - started)
+
+        return parse_prediagnosis_response(response)
 
     except Exception as e:
         print(f"Error generating prediagnosis: {e}")
-        return None
\ No newline at end of file
+        return None
+
+async def generate_prediagnosis_async(patient_data, medical_history=None):
+    """
+    Async counterpart of generate_prediagnosis_sync.
+    At most PREDIAGNOSIS_MAX_CONCURRENCY calls are in flight; the rest wait on the event loop.
+    """
+    try:
+        async with _prediagnosis_slots:
+            started = time.perf_counter()
+            response = await llm.create(**build_request(patient_data, medical_history))
+        await record_llm_usage_async("prediagnosis", PREDIAGNOSIS_MODEL, response.usage, time.perf_counter() - started)
+
+        return parse_prediagnosis_response(response)
+
+    except Exception as e:
+        print(f"Error generating prediagnosis: {e}")
+        return None
+
+async def stream_prediagnosis_async(patient_data, medical_history=None):
+    """
+    Streaming counterpart of generate_prediagnosis_async.
+    Yields (field, value) pairs as each field of the tool input finishes generating.
+    """
+    parser = PrediagnosisStreamParser()
+    repaired = False
+
+    try:
+        async with _prediagnosis_slots:
+            started = time.perf_counter()
+            async with llm.stream(**build_request(patient_data, medical_history)) as stream:
+                async for event in stream:
+                    if event.type != "content_block_delta":
+                        continue
+                    # Tool input arrives as partial JSON; plain text deltas are parsed the same way
+                    if event.delta.type == "input_json_delta":
+                        chunk = event.delta.partial_json
+                    elif event.delta.type == "text_delta":
+                        chunk = event.delta.text
+                    else:
+                        continue
+
+                    for field, value in parser.feed(chunk):
+                        if field in REQUIRED_FIELDS:
+                            value, field_repaired = coerce_field(value)
+                            repaired = repaired or field_repaired
+                            yield field, value
+                final_message = await stream.get_final_message()
+
+        await record_llm_usage_async(
+            "prediagnosis_stream", PREDIAGNOSIS_MODEL, final_message.usage, time.perf_counter() - started
+        )
+
+        # Fill in (or reject) anything the stream never completed
+        _, fields_repaired = validate_prediagnosis(parser.fields)
+        for field in REQUIRED_FIELDS:
+            if field not in parser.fields:
+                yield field, ""
+    except Exception:
+        parse_stats.record("failed")
+        raise
+
+    parse_stats.record("repaired" if repaired or fields_repaired else "clean")
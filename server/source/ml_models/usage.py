@@ -0,0 +1,31 @@
+from starlette.concurrency import run_in_threadpool
+
+from ..database import models, operations
+from ..metrics import llm_call_duration, llm_tokens
+
+
+def record_llm_usage(purpose: str, model: str, usage, latency_seconds: float):
+    """Store the usage block of an Anthropic response. Never raises; accounting must not fail a request"""
+    if usage is None:
+        return
+    llm_call_duration.labels(purpose).observe(latency_seconds)
+    for token_type in ("input", "output", "cache_read_input", "cache_creation_input"):
+        llm_tokens.labels(purpose, model, token_type).inc(getattr(usage, f"{token_type}_tokens", 0) or 0)
+    try:
+        with models.SessionLocal() as db:
+            operations.create_llm_usage(
+                db=db,
+                purpose=purpose,
+                model=model,
+                input_tokens=getattr(usage, "input_tokens", 0) or 0,
+                output_tokens=getattr(usage, "output_tokens", 0) or 0,
+                cache_read_input_tokens=getattr(usage, "cache_read_input_tokens", 0) or 0,
+                cache_creation_input_tokens=getattr(usage, "cache_creation_input_tokens", 0) or 0,
+                latency_ms=latency_seconds * 1000
+            )
+    except Exception as e:
+        print(f"Error recording LLM usage: {e}")
+
+
+async def record_llm_usage_async(purpose: str, model: str, usage, latency_seconds: float):
+    await run_in_threadpool(record_llm_usage, purpose, model, usage, latency_seconds)
@@ -0,0 +1,112 @@
+import os
+import re
+import json
+from typing import Dict, List, Optional
+
+# Configuration
+SYMPTOM_VOCABULARY_PATH = os.getenv(
+    'SYMPTOM_VOCABULARY_PATH',
+    os.path.join(os.path.dirname(__file__), 'data', 'symptoms.json')
+)
+SYMPTOM_SUGGEST_LIMIT = 10  # completions precomputed per trie node
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s']+")
+
+
+def clean_symptom(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(_PUNCTUATION_RE.sub(" ", text.lower()).split())
+
+
+class _TrieNode:
+    __slots__ = ("children", "suggestions")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.suggestions: List[str] = []  # canonical names, best first
+
+
+class SymptomVocabulary:
+    """
+    Canonical symptom names with their synonyms.
+    normalize() maps free text onto a canonical name; suggest() walks a trie whose
+    nodes carry precomputed completions, so a lookup costs O(len(prefix)).
+    Canonical names key the prediagnosis cache and titles; the LLM is given the
+    patient's own wording (see dedupe), so synonyms must mean the same thing.
+    """
+
+    def __init__(self, symptoms: List[dict]):
+        self.canonical: List[str] = []
+        self.synonyms: Dict[str, str] = {}  # cleaned term -> canonical name
+        self._root = _TrieNode()
+
+        for entry in symptoms:
+            name = clean_symptom(entry["name"])
+            self.canonical.append(name)
+            for term in [name] + [clean_symptom(s) for s in entry.get("synonyms", [])]:
+                self.synonyms.setdefault(term, name)
+                # Spacing variants ("head ache" / "headache") share a key
+                self.synonyms.setdefault(term.replace(" ", ""), name)
+
+        # Canonical names rank ahead of synonyms in suggestions
+        for name in sorted(self.canonical):
+            self._insert(name, name)
+        for term, name in sorted(self.synonyms.items()):
+            self._insert(term, name)
+
+    def _insert(self, term: str, name: str):
+        node = self._root
+        for char in term:
+            node = node.children.setdefault(char, _TrieNode())
+            if name not in node.suggestions and len(node.suggestions) < SYMPTOM_SUGGEST_LIMIT:
+                node.suggestions.append(name)
+
+    def normalize(self, symptom: str) -> str:
+        """Map a free-text symptom to its canonical name, or return it cleaned if unknown"""
+        cleaned = clean_symptom(symptom)
+        for candidate in (cleaned, cleaned.replace(" ", "")):
+            if candidate in self.synonyms:
+                return self.synonyms[candidate]
+            # Simple plurals ("headaches", "rashes")
+            for suffix in ("es", "s"):
+                if candidate.endswith(suffix) and candidate[:-len(suffix)] in self.synonyms:
+                    return self.synonyms[candidate[:-len(suffix)]]
+        return cleaned
+
+    def normalize_all(self, symptoms: List[str]) -> List[str]:
+        """Normalize a symptom list, dropping blanks and duplicates (order kept)"""
+        normalized = []
+        for symptom in symptoms:
+            name = self.normalize(symptom)
+            if name and name not in normalized:
+                normalized.append(name)
+        return normalized
+
+    def dedupe(self, symptoms: List[str]) -> List[str]:
+        """The patient's own wording, trimmed, without blanks or repeats of a canonical symptom (order kept)"""
+        kept, seen = [], set()
+        for symptom in symptoms:
+            name = self.normalize(symptom)
+            if name and name not in seen:
+                seen.add(name)
+                kept.append(" ".join(symptom.split()))
+        return kept
+
+    def suggest(self, prefix: str, limit: int = SYMPTOM_SUGGEST_LIMIT) -> List[str]:
+        """Canonical symptoms whose name or a synonym starts with the prefix"""
+        node = self._root
+        for char in clean_symptom(prefix):
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.suggestions[:limit] if node is not self._root else []
+
+
+def load_vocabulary(path: Optional[str] = None) -> SymptomVocabulary:
+    with open(path or SYMPTOM_VOCABULARY_PATH) as f:
+        data = json.load(f)
+    return SymptomVocabulary(data["symptoms"])
+
+
+# Loaded once at startup
+symptom_vocabulary = load_vocabulary()
@@ -0,0 +1,228 @@
+"""
+Real-time conversation channel: a pub/sub hub behind the per-conversation WebSocket.
+
+Every event goes through a Broker. The default LocalBroker hands events straight back
+to this process's hub, which is all a single worker needs. With several workers, set
+REALTIME_BROKER to a Broker subclass ("package.module:ClassName") that relays events
+between processes (e.g. over Redis pub/sub); each hub then delivers what the broker
+gives it to its own sockets.
+
+Events sent to clients (JSON):
+    {"type": "message", "conversation_id", "message": MessageResponse}
+    {"type": "prediagnosis", "conversation_id", "prediagnosis": PrediagnosisResponse}
+    {"type": "presence", "conversation_id", "online": [user ids]}
+    {"type": "typing", "conversation_id", "user_id", "typing": bool}
+"""
+import os
+import asyncio
+import importlib
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from fastapi import WebSocket
+
+from .database import notifications
+from . import schemas
+
+# Configuration
+REALTIME_BROKER = os.getenv('REALTIME_BROKER', '')  # "package.module:ClassName"; empty uses LocalBroker
+REALTIME_SEND_QUEUE_SIZE = int(os.getenv('REALTIME_SEND_QUEUE_SIZE', '100'))  # per socket; a slower client is dropped
+
+Deliver = Callable[[str, dict], Awaitable[None]]
+
+
+class Broker(ABC):
+    """Carries events between hubs. publish() must eventually call every hub's `deliver` once"""
+
+    @abstractmethod
+    async def start(self, deliver: Deliver):
+        ...
+
+    @abstractmethod
+    async def publish(self, channel: str, event: dict):
+        ...
+
+    async def stop(self):
+        pass
+
+
+class LocalBroker(Broker):
+    """Single-process broker: events go straight back to this process's hub"""
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def publish(self, channel: str, event: dict):
+        await self._deliver(channel, event)
+
+
+def load_broker(path: str) -> Broker:
+    if not path:
+        return LocalBroker()
+    module_name, _, class_name = path.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+class Connection:
+    """One open socket, with a bounded send queue so a slow client can't hold up the others"""
+
+    def __init__(self, websocket: WebSocket, user_id: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=REALTIME_SEND_QUEUE_SIZE)
+        self.sender: Optional[asyncio.Task] = None
+
+    async def send_loop(self):
+        while True:
+            event = await self.queue.get()
+            await self.websocket.send_json(event)
+
+
+class ConversationHub:
+    """
+    Fans conversation events out to the sockets open on each conversation.
+    Presence is kept from the presence events that come back through the broker,
+    so every worker sees who is connected anywhere (from the moment it started).
+    """
+
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connections: Dict[str, Set[Connection]] = defaultdict(set)
+        self._presence: Dict[str, Counter] = defaultdict(Counter)  # conversation -> user id -> open sockets
+        self.published = 0
+        self.delivered = 0
+        self.dropped_connections = 0
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        await self.broker.start(self._deliver)
+        notifications.listeners.append(self.publish_committed)
+
+    async def stop(self):
+        if not self.running:
+            return
+        notifications.listeners.remove(self.publish_committed)
+        await self.broker.stop()
+        for connections in list(self._connections.values()):
+            for connection in list(connections):
+                if connection.sender:
+                    connection.sender.cancel()
+        self._connections.clear()
+        self._presence.clear()
+        self._loop = None
+
+    # ============= PUBLISHING =============
+
+    async def publish(self, conversation_id: str, event: dict):
+        self.published += 1
+        await self.broker.publish(conversation_id, {**event, "conversation_id": conversation_id})
+
+    def publish_committed(self, kind: str, row: dict):
+        """Commit listener: may run in a threadpool thread or on the event loop"""
+        if kind == "message":
+            event = {"type": "message", "message": schemas.MessageResponse.model_validate(row).model_dump(mode="json")}
+        else:
+            event = {"type": "prediagnosis", "prediagnosis": _prediagnosis_payload(row)}
+        coroutine = self.publish(row["conversation_id"], event)
+
+        loop = self._loop
+        if loop is None:
+            coroutine.close()
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            loop.create_task(coroutine)
+        else:
+            asyncio.run_coroutine_threadsafe(coroutine, loop)
+
+    # ============= DELIVERY =============
+
+    async def _deliver(self, conversation_id: str, event: dict):
+        """Called by the broker for every event on any conversation"""
+        if event["type"] == "presence_change":
+            presence = self._presence[conversation_id]
+            presence[event["user_id"]] += 1 if event["online"] else -1
+            if presence[event["user_id"]] <= 0:
+                del presence[event["user_id"]]
+            if not presence:
+                del self._presence[conversation_id]
+            event = self._presence_event(conversation_id)
+
+        for connection in list(self._connections.get(conversation_id, ())):
+            try:
+                connection.queue.put_nowait(event)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self.dropped_connections += 1
+                await self._close_slow(conversation_id, connection)
+
+    async def _close_slow(self, conversation_id: str, connection: Connection):
+        self._remove(conversation_id, connection)
+        if connection.sender:
+            connection.sender.cancel()
+        try:
+            await connection.websocket.close(code=1013)  # try again later
+        except Exception:
+            pass
+
+    def _presence_event(self, conversation_id: str) -> dict:
+        online = sorted(self._presence.get(conversation_id, {}))
+        return {"type": "presence", "conversation_id": conversation_id, "online": online}
+
+    # ============= CONNECTIONS =============
+
+    async def join(self, conversation_id: str, websocket: WebSocket, user_id: int) -> Connection:
+        connection = Connection(websocket, user_id)
+        connection.sender = asyncio.create_task(connection.send_loop())
+        self._connections[conversation_id].add(connection)
+        # Everyone on the conversation, this socket included, gets the updated presence list
+        await self.publish(conversation_id, {"type": "presence_change", "user_id": user_id, "online": True})
+        return connection
+
+    async def leave(self, conversation_id: str, connection: Connection):
+        if self._remove(conversation_id, connection):
+            await self.publish(conversation_id, {"type": "presence_change", "user_id": connection.user_id, "online": False})
+        if connection.sender:
+            connection.sender.cancel()
+
+    def _remove(self, conversation_id: str, connection: Connection) -> bool:
+        connections = self._connections.get(conversation_id)
+        if not connections or connection not in connections:
+            return False
+        connections.discard(connection)
+        if not connections:
+            del self._connections[conversation_id]
+        return True
+
+    async def typing(self, conversation_id: str, user_id: int, typing: bool):
+        await self.publish(conversation_id, {"type": "typing", "user_id": user_id, "typing": typing})
+
+    def snapshot(self) -> dict:
+        return {
+            "conversations": len(self._connections),
+            "connections": sum(len(c) for c in self._connections.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped_connections": self.dropped_connections,
+        }
+
+
+def _prediagnosis_payload(row: dict) -> dict:
+    # The response schema requires every text field; nullable ones are sent empty
+    row = dict(row, support_messages=row.get("support_messages") or "",
+               recommended_practitioners=row.get("recommended_practitioners") or "")
+    return schemas.PrediagnosisResponse.model_validate(row).model_dump(mode="json")
+
+
+realtime_hub = ConversationHub(load_broker(REALTIME_BROKER))
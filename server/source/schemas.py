@@ -49,6 +49,10 @@ class MedicalHistoryUpdate(BaseModel):
     current_medications: Optional[List[dict]] = None
 
 
+class RoleUpdate(BaseModel):
+    role: str = Field(..., pattern="^(patient|doctor|admin)$")
+
+
 # ============= PREDIAGNOSIS SCHEMAS =============
 
 class PrediagnosisRequest(BaseModel):
@@ -70,6 +74,61 @@ class PrediagnosisResponse(BaseModel):
         from_attributes = True
 
 
+class PrediagnosisJobResponse(BaseModel):
+    id: str
+    status: str
+    conversation_id: Optional[str] = None
+    attempts: int
+    error: Optional[str] = None
+    prediagnosis: Optional[PrediagnosisResponse] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class PrediagnosisCacheStats(BaseModel):
+    hits: int
+    db_hits: int
+    misses: int
+    hit_ratio: float
+    evictions: int
+    entries: int
+    max_entries: int
+    ttl_seconds: int
+
+
+class PrediagnosisEngineStats(BaseModel):
+    calls: int
+    answered: int
+    fallbacks: int
+    errors: int
+    avg_ms: float
+    max_ms: float
+
+
+class PrediagnosisParseStats(BaseModel):
+    total: int
+    clean: int
+    repaired: int
+    failed: int
+    failure_rate: float
+    repair_rate: float
+
+
+class PrediagnosisCacheInvalidation(BaseModel):
+    removed: int
+
+
+# ============= SYMPTOM SCHEMAS =============
+
+class SymptomSuggestions(BaseModel):
+    query: str
+    suggestions: List[str]
+
+
 # ============= CONVERSATION SCHEMAS =============
 
 class ConversationCreate(BaseModel):
@@ -88,6 +147,16 @@ class ConversationResponse(BaseModel):
         from_attributes = True
 
 
+class ConversationSummary(ConversationResponse):
+    """An inbox row: the conversation with its last message, counts and latest prediagnosis"""
+    last_message_preview: Optional[str] = None
+    last_message_at: Optional[datetime] = None
+    message_count: int = 0
+    patient_unread_count: int = 0
+    doctor_unread_count: int = 0
+    latest_prediagnosis_id: Optional[int] = None
+
+
 class ConversationWithMessages(ConversationResponse):
     messages: List["MessageResponse"] = []
     pre_diagnoses: List[PrediagnosisResponse] = []
@@ -100,6 +169,14 @@ class MessageCreate(BaseModel):
     role: str = Field(default="user", pattern="^(user|assistant|system)$")
 
 
+class ChatMessageCreate(BaseModel):
+    content: str = Field(..., min_length=1)
+
+
+class MessageBatchCreate(BaseModel):
+    messages: List[MessageCreate] = Field(..., min_length=1, max_length=100)  # stored in this order
+
+
 class MessageResponse(BaseModel):
     id: int
     conversation_id: str
@@ -112,7 +189,86 @@ class MessageResponse(BaseModel):
         from_attributes = True
 
 
+class MessagePage(BaseModel):
+    messages: List[MessageResponse]  # oldest first
+    next_cursor: Optional[int] = None  # pass as the same before/after parameter for the next page
+    has_more: bool
+
+
+# ============= SEARCH SCHEMAS =============
+
+class SearchResult(BaseModel):
+    kind: str  # "message" or "prediagnosis"
+    id: int
+    conversation_id: str
+    conversation_title: Optional[str] = None
+    snippet: str  # matched words wrapped in ** (markdown bold)
+    created_at: datetime
+    score: float  # bm25, lower is better
+
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]  # best match first
+    next_page: Optional[int] = None
+
+
 # ============= DOCTOR ASSIGNMENT SCHEMA =============
 
 class DoctorAssignment(BaseModel):
     doctor_id: int
+
+
+# ============= ADMIN SCHEMAS =============
+
+class LLMUsageSummary(BaseModel):
+    purpose: str
+    model: str
+    calls: int
+    input_tokens: int
+    output_tokens: int
+    cache_read_input_tokens: int
+    cache_creation_input_tokens: int
+    avg_latency_ms: Optional[float] = None
+
+
+class LLMClientStats(BaseModel):
+    calls: int
+    errors: int
+    retries: int
+    hedges: int
+    hedge_wins: int
+    short_circuited: int
+    circuit_state: str
+    circuit_opened: int
+    p95_ms: float
+
+
+class UserCacheStats(BaseModel):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    entries: int
+    max_entries: int
+    ttl_seconds: int
+
+
+class RealtimeStats(BaseModel):
+    conversations: int
+    connections: int
+    published: int
+    delivered: int
+    dropped_connections: int
+
+
+class PasswordHashingStats(BaseModel):
+    workers: int
+    bcrypt_rounds: int
+    queue_depth: int
+    max_queue_depth: int
+    queue_limit: int
+    completed: int
+    rejected: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
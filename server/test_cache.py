@@ -0,0 +1,109 @@
+"""
+Prediagnosis result cache: TTL, LRU and table eviction, and invalidation by key or
+by input, in this process and (through prediagnosis_cache_invalidations) in other ones.
+Run with: python -m pytest test_cache.py
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from source.app import app
+from source.database import models, operations
+from source.ml_models.cache import PrediagnosisCache, PrediagnosisCacheSync, make_cache_key, prediagnosis_cache
+
+AI_RESULT = {
+    "potential_diseases": "common cold",
+    "course_of_action": "rest",
+    "support_messages": "ok",
+    "recommended_practitioners": "GP",
+}
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    with models.SessionLocal() as session:
+        session.query(models.PrediagnosisCacheEntry).delete()
+        session.commit()
+        yield session
+
+
+def rows(db):
+    return db.query(models.PrediagnosisCacheEntry).count()
+
+
+def test_expired_entries_are_misses(db):
+    cache = PrediagnosisCache(ttl_seconds=0, max_entries=10, db_max_entries=10)
+    cache.set(db, "expired", AI_RESULT)
+
+    assert cache.lookup("expired") is None
+    assert cache.get(db, "expired") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_memory_lru_and_periodic_table_trim(db):
+    cache = PrediagnosisCache(ttl_seconds=60, max_entries=2, db_max_entries=2, trim_every=2)
+    for key in ("a", "b", "c"):
+        cache.set(db, key, AI_RESULT)
+
+    # "a" left memory but is still in the table until the next trim
+    assert cache.lookup("a") is None and cache.lookup("c") == AI_RESULT
+    assert rows(db) == 3
+
+    cache.set(db, "d", AI_RESULT)
+    assert rows(db) == 2
+    assert cache.get(db, "a") is None and cache.get(db, "b") is None
+    assert cache.stats()["evictions"] == 2 + 2  # "a" and "b" from memory, then from the table
+
+
+def test_invalidate_by_symptoms_and_patient(client, register, db):
+    patient = register(client, "cache-patient@example.com")
+    operations.update_user_medical_history(db, patient.id, {"allergies": ["latex"]})
+    admin = register(client, "cache-admin@example.com", role="doctor")
+    operations.update_user_role(db, admin.id, models.UserRole.ADMIN)
+    login = client.post("/api/auth/login", json={"email": "cache-admin@example.com", "password": "password123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    with_history = make_cache_key(["headache", "fever"], {"allergies": ["latex"]})
+    without_history = make_cache_key(["headache", "fever"])
+    prediagnosis_cache.set(db, with_history, AI_RESULT)
+    prediagnosis_cache.set(db, without_history, AI_RESULT)
+
+    response = client.delete(
+        "/api/prediagnosis/cache",
+        params={"symptoms": ["Fever", "head ache"], "patient_id": patient.id},
+        headers=headers,
+    )
+    assert response.status_code == 200 and response.json() == {"removed": 1}
+    assert prediagnosis_cache.lookup(with_history) is None
+    assert prediagnosis_cache.lookup(without_history) == AI_RESULT
+
+    response = client.delete("/api/prediagnosis/cache", params={"symptoms": ["fever", "headache"]}, headers=headers)
+    assert response.json() == {"removed": 1}
+    assert prediagnosis_cache.lookup(without_history) is None
+
+    assert client.delete("/api/prediagnosis/cache", params={"patient_id": patient.id}, headers=headers).status_code == 400
+    assert client.delete("/api/prediagnosis/cache", headers=patient.headers).status_code == 403
+
+
+def test_invalidations_reach_other_processes(db):
+    # Another worker's cache and poller: this process's invalidate never touches its memory
+    remote = PrediagnosisCache(ttl_seconds=60, max_entries=10, db_max_entries=10)
+    sync = PrediagnosisCacheSync(remote, interval_seconds=1)
+    sync._last_id = sync._latest_id()
+    remote.set(db, "shared", AI_RESULT)
+    remote.set(db, "other", AI_RESULT)
+
+    prediagnosis_cache.invalidate(db, "shared")
+    assert remote.lookup("shared") == AI_RESULT
+
+    assert sync.poll() == 1
+    assert remote.lookup("shared") is None and remote.lookup("other") == AI_RESULT
+
+    prediagnosis_cache.invalidate(db)
+    assert sync.poll() == 1
+    assert remote.lookup("other") is None
+    assert sync.poll() == 0
@@ -0,0 +1,69 @@
+"""
+Prediagnosis engines: the engine interface, history terms and the sync fallback chain.
+Run with: python -m pytest test_engines.py
+"""
+import pytest
+
+from source.ml_models import engines
+from source.ml_models.engines import EngineChain, LocalEngine, LocalModel, PrediagnosisEngine, history_terms
+
+LLM_RESULT = {"potential_diseases": "common cold", "course_of_action": "rest", "support_messages": "ok"}
+
+
+class RecordingEngine(PrediagnosisEngine):
+    name = "recording"
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    async def predict(self, patient_data, medical_history=None):
+        return self.predict_sync(patient_data, medical_history)
+
+    def predict_sync(self, patient_data, medical_history=None):
+        self.calls += 1
+        return self.result
+
+
+def make_local_engine():
+    model = LocalModel(
+        vocabulary=["headache", "penicillin"],
+        labels=[{"disease": "migraine", "recommended_practitioners": "Neurologist"}],
+        weights=[[1.0, 0.0]],
+    )
+    return LocalEngine(model, threshold=0.9)
+
+
+def test_engines_must_implement_both_paths():
+    class AsyncOnly(PrediagnosisEngine):
+        async def predict(self, patient_data, medical_history=None):
+            return None
+
+    with pytest.raises(TypeError):
+        AsyncOnly()
+
+
+def test_history_strings_are_whole_terms():
+    history = {"allergies": "Penicillin", "chronic_conditions": {"condition": "asthma"}, "current_medications": None}
+    assert history_terms(history) == ["asthma", "Penicillin"]
+    assert history_terms({"allergies": ["latex", "pollen"]}) == ["latex", "pollen"]
+
+
+def test_sync_chain_answers_locally_then_falls_back():
+    remote = RecordingEngine(LLM_RESULT)
+    chain = EngineChain([make_local_engine(), remote])
+
+    local = chain.predict_sync({"symptoms": ["Headaches"]})
+    assert local["potential_diseases"] == "migraine" and remote.calls == 0
+
+    assert chain.predict_sync({"symptoms": ["cough"]}) == LLM_RESULT and remote.calls == 1
+    assert chain.snapshot()["local"]["calls"] == 2
+
+
+def test_generate_prediagnosis_goes_through_the_chain(monkeypatch):
+    remote = RecordingEngine(LLM_RESULT)
+    monkeypatch.setattr(engines, "prediagnosis_engine", EngineChain([make_local_engine(), remote]))
+
+    assert engines.generate_prediagnosis({"symptoms": ["headache"]})["potential_diseases"] == "migraine"
+    assert engines.generate_prediagnosis({"symptoms": ["cough"]}, {"allergies": "penicillin"}) == LLM_RESULT
+    assert remote.calls == 1
@@ -0,0 +1,57 @@
+"""
+Password hashing pool: bcrypt in worker processes behind a bounded queue, and the
+503 the auth routes answer when it is full.
+Run with: python -m pytest test_hashing.py
+"""
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from source.app import app
+from source.database.hashing import PasswordHasher, PasswordHasherBusy, password_hasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, queue_size=1)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_hashes_in_worker_processes(hasher):
+    hashed = hasher.hash_sync("password123")
+    assert hasher.verify_sync("password123", hashed)
+    assert not hasher.verify_sync("wrong", hashed)
+    assert hasher.snapshot()["completed"] == 3
+
+
+def test_full_queue_fails_fast(hasher):
+    hasher.start()
+    # One hash running and one waiting fill workers + queue_size
+    running = [hasher._submit(time.sleep, 0.5), hasher._submit(time.sleep, 0.5)]
+
+    started = time.monotonic()
+    with pytest.raises(PasswordHasherBusy):
+        hasher.hash_sync("password123")
+    assert time.monotonic() - started < 0.1
+
+    for future in running:
+        future.result()
+    stats = hasher.snapshot()
+    assert (stats["queue_depth"], stats["max_queue_depth"], stats["rejected"]) == (0, 2, 1)
+    hasher.hash_sync("password123")
+
+
+def test_auth_routes_answer_503_when_busy(monkeypatch):
+    client = TestClient(app)
+    user = {"name": "busy", "email": "hashing-busy@example.com", "password": "password123", "role": "patient"}
+    assert client.post("/api/auth/register", json=user).status_code == 200
+
+    monkeypatch.setattr(password_hasher, "max_pending", 0)
+    for path, email in (("/api/auth/login", user["email"]), ("/api/auth/register", "hashing-busy-2@example.com")):
+        response = client.post(path, json=dict(user, email=email))
+        assert response.status_code == 503 and response.headers["retry-after"] == "1"
+
+    monkeypatch.undo()
+    assert client.post("/api/auth/login", json=user).status_code == 200
@@ -0,0 +1,132 @@
+"""
+Background prediagnosis jobs: atomic claims, leases and the bounded queue, on a scratch SQLite database.
+Run with: python -m pytest test_jobs.py
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from source import jobs
+from source.app import app
+from source.database import models, operations
+
+AI_RESULT = {"potential_diseases": "common cold", "course_of_action": "rest", "support_messages": "ok"}
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def patient(client, register):
+    return register(client, "jobs-patient@example.com")
+
+
+@pytest.fixture
+def db():
+    with models.SessionLocal() as session:
+        yield session
+
+
+def new_job(db, patient):
+    return operations.create_prediagnosis_job(db, patient.id, ["cough"])
+
+
+def expire_lease(db, job_id):
+    job = operations.get_prediagnosis_job(db, job_id)
+    job.lease_expires_at = datetime.now() - timedelta(seconds=1)
+    db.commit()
+
+
+def test_a_job_is_claimed_once(db, patient):
+    job = new_job(db, patient)
+
+    claimed = operations.claim_prediagnosis_job(db, job.id, lease_seconds=60)
+    assert claimed.status == models.JobStatus.RUNNING and claimed.attempts == 1
+    assert operations.claim_prediagnosis_job(db, job.id, lease_seconds=60) is None
+
+    # A live lease keeps it out of recovery
+    pending = [pending.id for pending in operations.get_pending_prediagnosis_jobs(db)]
+    assert job.id not in pending
+
+
+def test_expired_lease_is_recovered_and_the_old_worker_loses_it(db, patient):
+    job = new_job(db, patient)
+    operations.claim_prediagnosis_job(db, job.id, lease_seconds=60)
+    expire_lease(db, job.id)
+
+    assert job.id in [pending.id for pending in operations.get_pending_prediagnosis_jobs(db)]
+    reclaimed = operations.claim_prediagnosis_job(db, job.id, lease_seconds=60)
+    assert reclaimed.attempts == 2
+
+    assert not operations.renew_prediagnosis_job_lease(db, job.id, 1, 60)
+    assert operations.renew_prediagnosis_job_lease(db, job.id, 2, 60)
+
+
+def test_concurrent_runs_store_one_prediagnosis(db, patient, monkeypatch):
+    async def generate(db, symptoms, medical_history):
+        await asyncio.sleep(0.05)
+        return AI_RESULT
+
+    monkeypatch.setattr(jobs, "generate_prediagnosis_cached", generate)
+    job = new_job(db, patient)
+    before = len(operations.get_patient_prediagnoses(db, patient.id))
+
+    async def run_twice():
+        await asyncio.gather(jobs.run_prediagnosis_job(job.id), jobs.run_prediagnosis_job(job.id))
+
+    asyncio.run(run_twice())
+
+    db.expire_all()
+    assert operations.get_prediagnosis_job(db, job.id).status == models.JobStatus.DONE
+    assert len(operations.get_patient_prediagnoses(db, patient.id)) == before + 1
+
+
+def test_a_reclaimed_attempt_cannot_finish_the_job(db, patient, monkeypatch):
+    job = new_job(db, patient)
+    before = len(operations.get_patient_prediagnoses(db, patient.id))
+
+    async def generate(db, symptoms, medical_history):
+        # Another worker takes the job over while this attempt waits on the LLM
+        with models.SessionLocal() as other:
+            expire_lease(other, job.id)
+            assert operations.claim_prediagnosis_job(other, job.id, lease_seconds=60).attempts == 2
+        return AI_RESULT
+
+    monkeypatch.setattr(jobs, "generate_prediagnosis_cached", generate)
+    asyncio.run(jobs.run_prediagnosis_job(job.id))
+
+    db.expire_all()
+    reclaimed = operations.get_prediagnosis_job(db, job.id)
+    assert reclaimed.status == models.JobStatus.RUNNING and reclaimed.attempts == 2
+    assert len(operations.get_patient_prediagnoses(db, patient.id)) == before
+
+    # Stale terminal writes are refused; the owner's go through
+    assert operations.mark_prediagnosis_job_failed(db, job.id, 1, "stale") is None
+    assert operations.mark_prediagnosis_job_failed(db, job.id, 2, "boom").status == models.JobStatus.FAILED
+
+
+def test_queue_refuses_jobs_when_stopped_or_full(client, patient):
+    queue = jobs.PrediagnosisJobQueue(num_workers=0, queue_size=1, lease_seconds=60)
+    with pytest.raises(jobs.JobQueueUnavailable):
+        queue.enqueue("job")
+
+    async def fill():
+        await queue.start()
+        try:
+            # The recovery sweep may have taken the only place already
+            while queue.accepting():
+                queue.enqueue("job")
+            queue.enqueue("another")
+            return queue.depth(), queue.overflowed
+        finally:
+            await queue.stop()
+
+    assert asyncio.run(fill()) == (1, 1)
+
+    # The app's own queue isn't started without the lifespan: no job is created
+    response = client.post("/api/prediagnosis/jobs", json={"symptoms": ["cough"]}, headers=patient.headers)
+    assert response.status_code == 503 and response.headers["retry-after"] == "1"
@@ -0,0 +1,175 @@
+"""
+Tests for the resilient LLM client layer against the benchmarks fake Anthropic server.
+Run with: python -m pytest test_llm_client.py
+"""
+import time
+import asyncio
+
+import anthropic
+import pytest
+
+from benchmarks.fake_anthropic import REPLY
+from source.ml_models.llm_client import ResilientLLMClient, CircuitBreaker, CircuitOpenError
+
+REQUEST = {"model": "test-model", "max_tokens": 10, "messages": [{"role": "user", "content": "hi"}]}
+
+
+def make_client(url, **overrides):
+    options = dict(
+        api_key="test",
+        base_url=url,
+        deadline_seconds=5,
+        max_retries=2,
+        retry_base_delay=0.01,
+        retry_max_delay=0.05,
+        hedge_enabled=False,
+        breaker=CircuitBreaker(failure_threshold=3, reset_seconds=0.2),
+    )
+    options.update(overrides)
+    return ResilientLLMClient(**options)
+
+
+def test_retries_retryable_errors(fake_anthropic):
+    server = fake_anthropic([(529, 0), (500, 0), (200, 0)])
+    llm = make_client(server.url)
+
+    response = asyncio.run(llm.create(**REQUEST))
+
+    assert response.content[0].text == REPLY
+    assert server.requests == 3
+    assert llm.stats["retries"] == 2
+
+
+def test_does_not_retry_client_errors(fake_anthropic):
+    server = fake_anthropic([(400, 0), (200, 0)])
+    llm = make_client(server.url)
+
+    with pytest.raises(anthropic.BadRequestError):
+        asyncio.run(llm.create(**REQUEST))
+
+    assert server.requests == 1
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_deadline_budget_covers_retries(fake_anthropic):
+    server = fake_anthropic([(200, 1.0)])
+    llm = make_client(server.url, max_retries=5)
+
+    started = time.monotonic()
+    with pytest.raises((asyncio.TimeoutError, anthropic.APITimeoutError)):
+        asyncio.run(llm.create(deadline_seconds=0.3, **REQUEST))
+
+    assert time.monotonic() - started < 0.9
+
+
+def test_circuit_breaker_fails_fast_then_recovers(fake_anthropic):
+    server = fake_anthropic([(503, 0), (503, 0), (503, 0), (200, 0)])
+    llm = make_client(server.url, max_retries=0)
+
+    # One event loop for the whole scenario: the client's pooled connections belong to it
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(anthropic.InternalServerError):
+                await llm.create(**REQUEST)
+        assert llm.breaker.state == CircuitBreaker.OPEN
+
+        with pytest.raises(CircuitOpenError):
+            await llm.create(**REQUEST)
+        assert server.requests == 3
+
+        await asyncio.sleep(0.25)
+        assert (await llm.create(**REQUEST)).content[0].text == REPLY
+        assert llm.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_hedges_slow_requests_past_p95(fake_anthropic):
+    server = fake_anthropic([(200, 1.0), (200, 0)])
+    llm = make_client(server.url, hedge_enabled=True, hedge_min_samples=5)
+    for _ in range(5):
+        llm.latency.record(0.05)
+
+    started = time.monotonic()
+    response = asyncio.run(llm.create(**REQUEST))
+
+    assert response.content[0].text == REPLY
+    assert time.monotonic() - started < 0.8
+    assert llm.stats["hedges"] == 1
+    assert llm.stats["hedge_wins"] == 1
+
+
+def test_sync_client_retries(fake_anthropic):
+    server = fake_anthropic([(429, 0), (200, 0)])
+    llm = make_client(server.url)
+
+    response = llm.create_sync(**REQUEST)
+
+    assert response.content[0].text == REPLY
+    assert llm.stats["retries"] == 1
+
+
+def test_cancelled_half_open_trial_releases_the_breaker(fake_anthropic):
+    server = fake_anthropic([(503, 0), (503, 0), (503, 0), (200, 1.0), (200, 0)])
+    llm = make_client(server.url, max_retries=0)
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(anthropic.InternalServerError):
+                await llm.create(**REQUEST)
+        await asyncio.sleep(0.25)
+
+        # The client disconnects while the half-open trial is in flight
+        trial = asyncio.ensure_future(llm.create(**REQUEST))
+        await asyncio.sleep(0.1)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        assert (await llm.create(**REQUEST)).content[0].text == REPLY
+        assert llm.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_stream_deadline_covers_the_whole_stream(fake_anthropic):
+    # Every chunk arrives well within a per-read timeout, but the stream as a whole takes 2s
+    server = fake_anthropic(token_ms=100, chunks=20)
+    llm = make_client(server.url)
+
+    async def read_stream():
+        async with llm.stream(deadline_seconds=0.5, **REQUEST) as stream:
+            async for _ in stream.text_stream:
+                pass
+
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        asyncio.run(read_stream())
+
+    assert time.monotonic() - started < 1.0
+    assert llm.breaker._failures == 1
+
+
+def test_caller_errors_inside_a_stream_are_not_upstream_outcomes(fake_anthropic):
+    server = fake_anthropic([(503, 0), (503, 0), (503, 0), (200, 0)])
+    llm = make_client(server.url, max_retries=0)
+
+    async def scenario():
+        for _ in range(3):
+            with pytest.raises(anthropic.InternalServerError):
+                await llm.create(**REQUEST)
+        await asyncio.sleep(0.25)
+        errors = llm.stats["errors"]
+
+        # The half-open trial is a stream whose consumer fails, e.g. the client went away
+        with pytest.raises(ValueError):
+            async with llm.stream(**REQUEST) as stream:
+                async for _ in stream.text_stream:
+                    raise ValueError("consumer failed")
+
+        assert llm.stats["errors"] == errors
+        assert llm.breaker.state == CircuitBreaker.HALF_OPEN
+        assert (await llm.create(**REQUEST)).content[0].text == REPLY
+        assert llm.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
@@ -0,0 +1,118 @@
+"""
+GET /metrics: request, database, LLM and cache metrics, and multiprocess aggregation.
+Run with: python -m pytest test_metrics.py
+"""
+import os
+import sys
+import socket
+import asyncio
+import tempfile
+import subprocess
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
+
+from source import app as app_module
+from source.app import app
+from source.ml_models.llm_client import ResilientLLMClient
+from source.ml_models.usage import record_llm_usage
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def patient(client, register):
+    headers = register(client, "metrics-patient@example.com").headers
+    conversation_id = client.post("/api/conversations", json={"title": "Metrics"}, headers=headers).json()["id"]
+    return headers, conversation_id
+
+
+def test_requests_are_labelled_by_route_template(client, patient):
+    headers, conversation_id = patient
+    route = "/api/conversations/{conversation_id}/messages"
+    before = sample("http_request_duration_seconds_count", method="GET", route=route, status="200")
+    unmatched = sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404")
+
+    client.get(f"/api/conversations/{conversation_id}/messages", headers=headers)
+    client.get("/no/such/path")
+
+    assert sample("http_request_duration_seconds_count", method="GET", route=route, status="200") == before + 1
+    assert sample("http_request_duration_seconds_count", method="GET", route="unmatched", status="404") == unmatched + 1
+
+    body = client.get("/metrics").text
+    assert f'route="{route}"' in body and conversation_id not in body
+
+
+def test_database_sessions_and_queries(client, patient):
+    headers, conversation_id = patient
+    sessions = sample("db_sessions_total", kind="sync")
+    selects = sample("db_queries_total", engine="sync", statement="select")
+
+    client.get(f"/api/conversations/{conversation_id}", headers=headers)
+
+    assert sample("db_sessions_total", kind="sync") == sessions + 1
+    assert sample("db_queries_total", engine="sync", statement="select") > selects
+    assert sample("db_connections_checked_out", engine="sync") == 0
+
+
+def test_cache_lookups_and_llm_tokens(client, patient):
+    headers, _ = patient
+    hits = sample("cache_lookups_total", cache="user", result="hit")
+    client.get("/api/conversations", headers=headers)
+    assert sample("cache_lookups_total", cache="user", result="hit") == hits + 1
+
+    usage = SimpleNamespace(input_tokens=120, output_tokens=30, cache_read_input_tokens=100)
+    record_llm_usage("chat", "test-model", usage, 0.5)
+    assert sample("llm_tokens_total", purpose="chat", model="test-model", type="input") == 120
+    assert sample("llm_tokens_total", purpose="chat", model="test-model", type="cache_read_input") == 100
+    assert sample("llm_call_duration_seconds_count", purpose="chat") >= 1
+
+
+def test_llm_errors_are_counted():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    client = ResilientLLMClient(api_key="test", base_url=f"http://127.0.0.1:{port}", max_retries=0)
+    errors = sample("llm_errors_total", error="APIConnectionError")
+    calls = sample("llm_client_events_total", event="calls")
+
+    with pytest.raises(Exception):
+        asyncio.run(client.create(model="test", max_tokens=10, messages=[{"role": "user", "content": "hi"}]))
+
+    assert sample("llm_errors_total", error="APIConnectionError") == errors + 1
+    assert sample("llm_client_events_total", event="calls") == calls + 1
+    assert sample("llm_upstream_duration_seconds_count", outcome="error") >= 1
+
+
+def test_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(app_module, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+
+
+def test_multiprocess_mode_adds_up_workers():
+    directory = tempfile.mkdtemp()
+    record = (
+        "from source.metrics import http_request_duration, http_requests_in_progress;"
+        "http_request_duration.labels('GET', '/api/', '200').observe(0.01);"
+        "http_requests_in_progress.inc()"
+    )
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory)
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", record], env=env, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=directory)
+    labels = {"method": "GET", "route": "/api/", "status": "200"}
+    assert registry.get_sample_value("http_request_duration_seconds_count", labels) == 2
+    # Live gauges only count processes that are still running; these have exited but were not marked dead
+    assert registry.get_sample_value("http_requests_in_progress", {}) == 2
@@ -0,0 +1,78 @@
+"""
+Schema migration runner: fresh and pre-runner databases, re-runs, failures, and that
+importing the models leaves the database alone.
+Run with: python -m pytest test_migrations.py
+"""
+import logging
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from source.database import migrations, models
+
+VERSIONS = [version for version, _ in migrations.discover()]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield engine
+    engine.dispose()
+
+
+def columns(engine):
+    inspector = inspect(engine)
+    return {table: {column["name"] for column in inspector.get_columns(table)} for table in inspector.get_table_names()}
+
+
+def test_fresh_database_matches_the_models(engine, caplog):
+    with caplog.at_level(logging.INFO, logger=migrations.__name__):
+        assert migrations.upgrade(engine) == VERSIONS
+    assert f"Applied migration {VERSIONS[0]}" in caplog.messages
+
+    schema = columns(engine)
+    for table in models.Base.metadata.sorted_tables:
+        assert {column.name for column in table.columns} <= schema[table.name], table.name
+
+    assert migrations.upgrade(engine) == []
+    assert migrations.status(engine) == [(version, True) for version in VERSIONS]
+
+
+def test_database_created_before_the_runner(engine):
+    # Tables and indexes from create_all, but no schema_migrations yet
+    models.Base.metadata.create_all(engine)
+    assert migrations.upgrade(engine) == VERSIONS
+    assert migrations.upgrade(engine) == []
+
+
+def test_failed_migration_is_rolled_back_and_retried(engine, monkeypatch):
+    last = dict(migrations.discover())[VERSIONS[-1]]
+    upgrade = last.upgrade
+
+    def fail(connection):
+        upgrade(connection)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(last, "upgrade", fail)
+    with pytest.raises(RuntimeError):
+        migrations.upgrade(engine)
+    assert migrations.status(engine)[-1] == (VERSIONS[-1], False)
+
+    monkeypatch.undo()
+    assert migrations.upgrade(engine) == VERSIONS[-1:]
+
+
+def test_importing_the_models_does_not_migrate(tmp_path):
+    path = tmp_path / "untouched.db"
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}")
+    subprocess.run([sys.executable, "-c", "import source.database.models"], env=env, check=True,
+                   cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        assert inspect(engine).get_table_names() == []
+    finally:
+        engine.dispose()
@@ -0,0 +1,81 @@
+"""
+Keyset (cursor) pagination of conversation messages: ties on created_at, both
+directions, and invalid cursors, through the sync and the async routes.
+Run with: python -m pytest test_pagination.py
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from source import async_routes
+from source.app import app
+
+
+def async_app():
+    application = FastAPI()
+    application.include_router(async_routes.router, prefix="/api")
+    return application
+
+
+@pytest.fixture(scope="module", params=["sync", "async"])
+def client(request):
+    return TestClient(app if request.param == "sync" else async_app())
+
+
+@pytest.fixture(scope="module")
+def patient(register):
+    return register(TestClient(app), "pagination-patient@example.com")
+
+
+@pytest.fixture(scope="module")
+def conversation(client, patient):
+    """Two single messages around a batch of five sharing one created_at"""
+    conversation = client.post("/api/conversations", json={"title": "pages"}, headers=patient.headers).json()
+    url = f"/api/conversations/{conversation['id']}/messages"
+    ids = [client.post(url, json={"content": "first"}, headers=patient.headers).json()["id"]]
+    batch = {"messages": [{"role": "user", "content": f"batch {i}"} for i in range(5)]}
+    ids += [message["id"] for message in client.post(f"{url}:batch", json=batch, headers=patient.headers).json()]
+    ids.append(client.post(url, json={"content": "last"}, headers=patient.headers).json()["id"])
+    return url, ids
+
+
+def walk(client, patient, url, direction, start=None):
+    """Follow next_cursor in one direction; returns the pages of message ids"""
+    pages, cursor = [], start
+    while True:
+        params = {"page_size": 2}
+        if cursor is not None:
+            params[direction] = cursor
+        body = client.get(url, params=params, headers=patient.headers).json()
+        pages.append([message["id"] for message in body["messages"]])
+        cursor = body["next_cursor"]
+        assert body["has_more"] == (cursor is not None)
+        if cursor is None:
+            return pages
+
+
+def test_backwards_through_ties(client, patient, conversation):
+    url, ids = conversation
+    pages = walk(client, patient, url, "before")
+    assert pages == [ids[5:], ids[3:5], ids[1:3], ids[:1]]
+
+
+def test_forwards_through_ties(client, patient, conversation):
+    url, ids = conversation
+    pages = walk(client, patient, url, "after", start=ids[0])
+    assert pages == [ids[1:3], ids[3:5], ids[5:]]
+    assert walk(client, patient, url, "after", start=ids[-1]) == [[]]
+
+
+def test_invalid_cursors(client, patient, conversation):
+    url, ids = conversation
+    other = client.post("/api/conversations", json={"title": "other"}, headers=patient.headers).json()
+    other_id = client.post(
+        f"/api/conversations/{other['id']}/messages", json={"content": "elsewhere"}, headers=patient.headers
+    ).json()["id"]
+
+    for params in ({"before": other_id}, {"after": 10 ** 9}, {"before": ids[0], "after": ids[-1]}):
+        response = client.get(url, params=params, headers=patient.headers)
+        assert response.status_code == 400, params
+    assert client.get(url, params={"before": "abc"}, headers=patient.headers).status_code == 422
+    assert client.get(url, params={"page_size": 0}, headers=patient.headers).status_code == 422
@@ -0,0 +1,91 @@
+"""
+Prediagnosis response parsing: the tool-use path, local JSON repair for text responses,
+and the incremental parser behind the streaming endpoint.
+Run with: python -m pytest test_parsing.py
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from source.ml_models.suggestions import (
+    PREDIAGNOSIS_TOOL, PrediagnosisStreamParser, parse_prediagnosis, parse_prediagnosis_response, parse_stats,
+    repair_json_text,
+)
+
+PREDIAGNOSIS = {
+    "potential_diseases": "common cold",
+    "course_of_action": "rest, fluids",
+    "support_messages": "You'll be fine",
+    "recommended_practitioners": "GP",
+}
+
+
+@pytest.mark.parametrize("text, repaired", [
+    ('Sure! {"a": "x", "b": [1, 2,], }', {"a": "x", "b": [1, 2]}),
+    ('{"a": "trunc\\', {"a": "trunc"}),
+    ('{"a": {"b": "c"', {"a": {"b": "c"}}),
+    ('{"a": "x",', {"a": "x"}),
+    ('{"a": "x"} and then {"b": 1}', {"a": "x"}),
+    ('{"a": "brace } and \\" inside"', {"a": 'brace } and " inside'}),
+])
+def test_repair_json_text(text, repaired):
+    assert json.loads(repair_json_text(text)) == repaired
+
+
+def test_repair_needs_an_object():
+    with pytest.raises(ValueError):
+        repair_json_text("no json here")
+
+
+def test_text_responses_are_repaired_or_rejected():
+    fenced = "```json\n" + json.dumps(PREDIAGNOSIS)[:-1] + ",\n```"
+    assert parse_prediagnosis(fenced) == PREDIAGNOSIS
+    with pytest.raises(ValueError):
+        parse_prediagnosis('{"support_messages": "ok"}')
+
+
+def test_tool_call_is_preferred_and_fields_coerced():
+    before = parse_stats.snapshot()
+    tool_input = dict(PREDIAGNOSIS, recommended_practitioners=["GP", "ENT"])
+    response = SimpleNamespace(content=[
+        SimpleNamespace(type="text", text='{"potential_diseases": "ignored"}'),
+        SimpleNamespace(type="tool_use", name=PREDIAGNOSIS_TOOL["name"], input=tool_input),
+    ])
+
+    assert parse_prediagnosis_response(response) == dict(PREDIAGNOSIS, recommended_practitioners="GP, ENT")
+
+    text_only = SimpleNamespace(content=[SimpleNamespace(type="text", text=json.dumps(PREDIAGNOSIS))])
+    assert parse_prediagnosis_response(text_only) == PREDIAGNOSIS
+    with pytest.raises(ValueError):
+        parse_prediagnosis_response(SimpleNamespace(content=[SimpleNamespace(type="text", text="sorry")]))
+
+    after = parse_stats.snapshot()
+    assert (after["repaired"], after["clean"], after["failed"]) == (
+        before["repaired"] + 1, before["clean"] + 1, before["failed"] + 1
+    )
+
+
+def test_stream_parser_yields_each_field_once_complete():
+    text = "```json\n" + json.dumps(dict(PREDIAGNOSIS, confidence=0.75)) + "\n```"
+    parser = PrediagnosisStreamParser()
+    completed = []
+    for char in text:
+        completed.extend(parser.feed(char))
+
+    assert completed == list(dict(PREDIAGNOSIS, confidence=0.75).items())
+    assert parser.finished and parser.fields["course_of_action"] == "rest, fluids"
+
+
+def test_stream_parser_waits_for_numbers_and_strings_to_end():
+    parser = PrediagnosisStreamParser()
+    assert parser.feed('{"potential_diseases": "common') == []
+    assert parser.feed(' cold", "confidence": 0.7') == [("potential_diseases", "common cold")]
+    assert parser.feed('5}') == [("confidence", 0.75)]
+    assert parser.finished
+
+
+def test_stream_parser_rejects_malformed_objects():
+    parser = PrediagnosisStreamParser()
+    with pytest.raises(ValueError):
+        parser.feed('{"potential_diseases" "common cold"}')
@@ -0,0 +1,86 @@
+"""
+The authenticated-user cache: invalidation, the generation race, token revocation and
+role changes, in this process and (through user_invalidations) in other ones.
+Run with: python -m pytest test_principals.py
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from source.app import app
+from source.database import models, operations
+from source.database.principals import Principal, PrincipalCache, PrincipalCacheSync, principal_cache
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    with models.SessionLocal() as session:
+        yield session
+
+
+def test_set_is_skipped_after_an_invalidation_since_the_read():
+    cache = PrincipalCache(ttl_seconds=60, max_entries=2)
+    principal = Principal(1, models.UserRole.PATIENT, "a@example.com")
+
+    generation = cache.generation
+    cache.invalidate(1)  # the row changed while the request was reading it
+    cache.set(principal, generation)
+    assert cache.get(1) is None
+
+    cache.set(principal, cache.generation)
+    assert cache.get(1) is principal
+
+
+def test_lru_eviction_and_disabled_cache():
+    cache = PrincipalCache(ttl_seconds=60, max_entries=2)
+    for user_id in (1, 2, 3):
+        cache.set(Principal(user_id, models.UserRole.PATIENT, ""), cache.generation)
+    assert cache.get(1) is None and cache.get(3) is not None
+    assert cache.stats()["evictions"] == 1
+
+    disabled = PrincipalCache(ttl_seconds=0, max_entries=2)
+    disabled.set(Principal(1, models.UserRole.PATIENT, ""), disabled.generation)
+    assert disabled.get(1) is None
+
+
+def test_user_changes_drop_the_cached_principal(client, register, db):
+    user = register(client, "principal-cached@example.com")
+    assert client.get("/api/conversations", headers=user.headers).status_code == 200
+    assert principal_cache.get(user.id) is not None
+
+    operations.update_user_medical_history(db, user.id, {"allergies": ["latex"]})
+    assert principal_cache.get(user.id) is None
+
+
+def test_role_change_and_revocation_reject_old_tokens(client, register, db):
+    user = register(client, "principal-role@example.com", role="doctor")
+    assert client.get("/api/conversations", headers=user.headers).status_code == 200
+
+    operations.update_user_role(db, user.id, models.UserRole.PATIENT)
+    assert client.get("/api/conversations", headers=user.headers).status_code == 401
+
+    login = client.post("/api/auth/login", json={"email": "principal-role@example.com", "password": "password123"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    assert client.get("/api/conversations", headers=headers).status_code == 200
+    assert client.post(f"/api/users/{user.id}/revoke-tokens", headers=headers).status_code == 204
+    assert client.get("/api/conversations", headers=headers).status_code == 401
+
+
+def test_changes_reach_other_processes(client, register, db):
+    user = register(client, "principal-remote@example.com")
+    # Another worker's cache and poller: the in-process hooks never touch them
+    remote = PrincipalCache(ttl_seconds=60, max_entries=10)
+    sync = PrincipalCacheSync(remote, interval_seconds=1)
+    sync._last_id = sync._latest_id()
+    remote.set(Principal(user.id, models.UserRole.PATIENT, "", token_version=0), remote.generation)
+
+    operations.revoke_user_tokens(db, user.id)
+    assert remote.get(user.id) is not None
+
+    assert sync.poll() == 1
+    assert remote.get(user.id) is None
+    assert sync.poll() == 0
@@ -0,0 +1,312 @@
+"""
+Per-request SQL statement counts for the conversation endpoints, on a scratch SQLite database.
+Run with: python -m pytest test_query_counts.py
+"""
+from contextlib import contextmanager
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from source import async_routes
+from source.app import app
+from source.database import models, operations
+from source.database.async_session import async_engine
+
+
+@contextmanager
+def count_queries(engine):
+    """Collect the SQL statements run on `engine` inside the block"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(" ".join(statement.split()))
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+def summarize(statements):
+    """Each statement as its verb and table, e.g. 'SELECT conversations'"""
+    summary = []
+    for statement in statements:
+        words = statement.split()
+        if words[0] == "SELECT":
+            table = words[words.index("FROM") + 1]
+        elif words[0] in ("INSERT", "DELETE"):
+            table = words[2]  # INSERT INTO t / DELETE FROM t
+        else:
+            table = words[1]  # UPDATE t
+        summary.append(f"{words[0]} {table}")
+    return summary
+
+
+def add_prediagnosis(conversation_id, patient_id):
+    db = models.SessionLocal()
+    try:
+        operations.create_prediagnosis(db, conversation_id, patient_id, patient_id, "flu", "rest", "ok", "GP")
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="module")
+def sync_client():
+    return TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def async_client():
+    async_app = FastAPI()
+    async_app.include_router(async_routes.router, prefix="/api")
+    return TestClient(async_app)
+
+
+@pytest.fixture(scope="module")
+def patient(sync_client, register):
+    user = register(sync_client, "counts-patient@example.com")
+    headers, patient_id = user.headers, user.id
+    conversation = sync_client.post("/api/conversations", json={"title": "Counts"}, headers=headers).json()
+    return headers, patient_id, conversation["id"]
+
+
+def test_conversation_detail_query_count_is_constant(sync_client, patient):
+    headers, patient_id, conversation_id = patient
+    url = f"/api/conversations/{conversation_id}"
+    sync_client.get(url, headers=headers)  # warm the user cache
+
+    counts = []
+    for _ in range(2):
+        for i in range(3):
+            sync_client.post(f"{url}/messages", json={"content": f"message {i}"}, headers=headers)
+        add_prediagnosis(conversation_id, patient_id)
+
+        with count_queries(models.engine) as statements:
+            response = sync_client.get(url, headers=headers)
+        assert response.status_code == 200
+        counts.append(len(statements))
+
+    body = response.json()
+    assert len(body["messages"]) == 6 and len(body["pre_diagnoses"]) == 2
+    # conversation, messages, prediagnoses; no lazy loads while serializing
+    assert counts == [3, 3]
+
+
+def test_conversation_detail_denied_looks_up_conversation_once(sync_client, patient, register):
+    _, _, conversation_id = patient
+    other_headers = register(sync_client, "counts-other@example.com").headers
+    sync_client.get("/api/conversations", headers=other_headers)  # warm the user cache
+
+    with count_queries(models.engine) as statements:
+        response = sync_client.get(f"/api/conversations/{conversation_id}", headers=other_headers)
+    assert response.status_code == 403
+    assert summarize(statements).count("SELECT conversations") == 1
+
+
+def test_post_message_looks_up_conversation_once(sync_client, patient):
+    headers, _, conversation_id = patient
+    with count_queries(models.engine) as statements:
+        response = sync_client.post(
+            f"/api/conversations/{conversation_id}/messages", json={"content": "hello"}, headers=headers
+        )
+    assert response.status_code == 200
+    # access check (the operation reuses it to bump updated_at), insert, reload of the new row
+    assert summarize(statements) == ["SELECT conversations", "UPDATE conversations", "INSERT messages", "SELECT messages"]
+
+
+def test_assign_doctor_looks_up_conversation_once(sync_client, patient, register):
+    headers, _, conversation_id = patient
+    doctor_id = register(sync_client, "counts-doctor@example.com", role="doctor").id
+    with count_queries(models.engine) as statements:
+        response = sync_client.put(
+            f"/api/conversations/{conversation_id}/assign-doctor", json={"doctor_id": doctor_id}, headers=headers
+        )
+    assert response.status_code == 200
+    # lookup, doctor check, update, reload of the committed row for the response
+    assert summarize(statements) == ["SELECT conversations", "SELECT users", "UPDATE conversations", "SELECT conversations"]
+
+
+def test_async_conversation_detail_query_count(async_client, patient):
+    headers, _, conversation_id = patient
+    url = f"/api/conversations/{conversation_id}"
+    async_client.get(url, headers=headers)  # warm the user cache
+
+    with count_queries(async_engine.sync_engine) as statements:
+        response = async_client.get(url, headers=headers)
+    assert response.status_code == 200
+    assert len(statements) == 3
+
+
+def test_async_post_message_looks_up_conversation_once(async_client, patient):
+    headers, _, conversation_id = patient
+    with count_queries(async_engine.sync_engine) as statements:
+        response = async_client.post(
+            f"/api/conversations/{conversation_id}/messages", json={"content": "hello"}, headers=headers
+        )
+    assert response.status_code == 200
+    assert summarize(statements) == ["SELECT conversations", "UPDATE conversations", "INSERT messages", "SELECT messages"]
+
+
+def test_message_batch_is_one_insert(sync_client, patient):
+    headers, _, conversation_id = patient
+    batch = {"messages": [{"role": "user", "content": "question"}, {"role": "assistant", "content": "answer"}]}
+    with count_queries(models.engine) as statements:
+        response = sync_client.post(f"/api/conversations/{conversation_id}/messages:batch", json=batch, headers=headers)
+    assert response.status_code == 200
+    assert [(m["role"], m["content"]) for m in response.json()] == [("user", "question"), ("assistant", "answer")]
+    # access check, one INSERT ... RETURNING for the whole batch, one timestamp update
+    assert summarize(statements) == ["SELECT conversations", "INSERT messages", "UPDATE conversations"]
+
+    latest = sync_client.get(f"/api/conversations/{conversation_id}/messages", params={"page_size": 2}, headers=headers)
+    assert [m["id"] for m in latest.json()["messages"]] == [m["id"] for m in response.json()]
+
+
+def test_async_message_batch_is_one_insert(async_client, patient):
+    headers, _, conversation_id = patient
+    batch = {"messages": [{"role": "user", "content": "question"}, {"role": "assistant", "content": "answer"}]}
+    with count_queries(async_engine.sync_engine) as statements:
+        response = async_client.post(f"/api/conversations/{conversation_id}/messages:batch", json=batch, headers=headers)
+    assert response.status_code == 200
+    assert [m["content"] for m in response.json()] == ["question", "answer"]
+    assert summarize(statements) == ["SELECT conversations", "INSERT messages", "UPDATE conversations"]
+
+
+def test_empty_message_batch_is_rejected(sync_client, patient):
+    headers, _, conversation_id = patient
+    response = sync_client.post(f"/api/conversations/{conversation_id}/messages:batch", json={"messages": []}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_chat_turn_stores_both_messages(sync_client, patient, monkeypatch):
+    headers, _, conversation_id = patient
+    contexts = []
+
+    async def fake_reply(history):
+        contexts.append(history)
+        for text in ("Rest ", "and drink water."):
+            yield text
+
+    monkeypatch.setattr("source.app.stream_chat_reply", fake_reply)
+    with count_queries(models.engine) as statements:
+        response = sync_client.post(f"/api/conversations/{conversation_id}/chat", json={"content": "I have a cold"}, headers=headers)
+    assert response.status_code == 200
+
+    events = [block.split("\n", 1)[0].removeprefix("event: ") for block in response.text.strip().split("\n\n")]
+    assert events == ["message", "delta", "delta", "done"]
+    assert contexts[0][-1] == {"role": "user", "content": "I have a cold"}
+    # user message: access check, insert, reload, context page; reply: one insert and reload at the end
+    assert summarize(statements) == [
+        "SELECT conversations", "UPDATE conversations", "INSERT messages", "SELECT messages", "SELECT messages",
+        "SELECT conversations", "UPDATE conversations", "INSERT messages", "SELECT messages",
+    ]
+
+    latest = sync_client.get(f"/api/conversations/{conversation_id}/messages", params={"page_size": 2}, headers=headers)
+    assert [(m["role"], m["content"]) for m in latest.json()["messages"]] == [
+        ("user", "I have a cold"), ("assistant", "Rest and drink water.")
+    ]
+
+
+def test_inbox_is_one_query_for_both_roles(sync_client, register):
+    patient = register(sync_client, "inbox-patient@example.com")
+    doctor = register(sync_client, "inbox-doctor@example.com", role="doctor")
+    patient_headers, patient_id, doctor_headers, doctor_id = patient.headers, patient.id, doctor.headers, doctor.id
+    conversation_ids = []
+    for title in ("First", "Second"):
+        conversation = sync_client.post("/api/conversations", json={"title": title}, headers=patient_headers).json()
+        sync_client.put(f"/api/conversations/{conversation['id']}/assign-doctor", json={"doctor_id": doctor_id}, headers=patient_headers)
+        conversation_ids.append(conversation["id"])
+
+    url = f"/api/conversations/{conversation_ids[0]}"
+    sync_client.post(f"{url}/messages", json={"content": "from the patient"}, headers=patient_headers)
+    sync_client.post(f"{url}/messages", json={"content": "x" * 300}, headers=patient_headers)
+    sync_client.post(f"{url}/messages", json={"content": "from the doctor"}, headers=doctor_headers)
+    add_prediagnosis(conversation_ids[0], patient_id)
+
+    for headers in (patient_headers, doctor_headers):
+        with count_queries(models.engine) as statements:
+            response = sync_client.get("/api/conversations", headers=headers)
+        assert response.status_code == 200
+        assert summarize(statements) == ["SELECT conversations"]
+
+    inbox = response.json()  # the doctor's, most recently active first
+    assert [row["id"] for row in inbox] == conversation_ids
+    first = inbox[0]
+    assert first["message_count"] == 3 and first["last_message_preview"] == "from the doctor"
+    assert (first["patient_unread_count"], first["doctor_unread_count"]) == (1, 2)
+    assert first["latest_prediagnosis_id"] is not None
+
+    response = sync_client.post(f"{url}/read", headers=doctor_headers)
+    assert (response.json()["patient_unread_count"], response.json()["doctor_unread_count"]) == (1, 0)
+
+
+def test_marking_read_keeps_inbox_order(sync_client, async_client, register):
+    patient = register(sync_client, "order-patient@example.com")
+    doctor = register(sync_client, "order-doctor@example.com", role="doctor")
+    for client in (sync_client, async_client):
+        conversation_ids = []
+        for title in ("Older", "Newer"):
+            conversation = client.post("/api/conversations", json={"title": title}, headers=patient.headers).json()
+            sync_client.put(f"/api/conversations/{conversation['id']}/assign-doctor", json={"doctor_id": doctor.id}, headers=patient.headers)
+            client.post(f"/api/conversations/{conversation['id']}/messages", json={"content": title}, headers=patient.headers)
+            conversation_ids.append(conversation["id"])
+        before = [row["id"] for row in client.get("/api/conversations", headers=doctor.headers).json()]
+        assert before.index(conversation_ids[1]) < before.index(conversation_ids[0])
+
+        response = client.post(f"/api/conversations/{conversation_ids[0]}/read", headers=doctor.headers)
+        assert response.json()["doctor_unread_count"] == 0
+
+        after = [row["id"] for row in client.get("/api/conversations", headers=doctor.headers).json()]
+        assert after == before
+
+
+def test_conditional_get_skips_message_reads(sync_client, patient):
+    headers, _, conversation_id = patient
+    url = f"/api/conversations/{conversation_id}"
+    for path in (url, f"{url}/messages"):
+        first = sync_client.get(path, headers=headers)
+        etag = first.headers["etag"]
+        assert etag.startswith('W/"')
+
+        with count_queries(models.engine) as statements:
+            response = sync_client.get(path, headers={**headers, "If-None-Match": etag})
+        assert response.status_code == 304 and response.content == b""
+        assert summarize(statements) == ["SELECT conversations"]
+
+    # Another page of the same conversation has its own validator
+    page = sync_client.get(f"{url}/messages", params={"page_size": 1}, headers={**headers, "If-None-Match": etag})
+    assert page.status_code == 200
+
+    sync_client.post(f"{url}/messages", json={"content": "changed"}, headers=headers)
+    response = sync_client.get(f"{url}/messages", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+
+
+def test_conditional_inbox_tracks_unread_counts(sync_client, register):
+    patient_headers = register(sync_client, "etag-patient@example.com").headers
+    doctor = register(sync_client, "etag-doctor@example.com", role="doctor")
+    doctor_headers, doctor_id = doctor.headers, doctor.id
+    conversation = sync_client.post("/api/conversations", json={"title": "ETag"}, headers=patient_headers).json()
+    sync_client.put(f"/api/conversations/{conversation['id']}/assign-doctor", json={"doctor_id": doctor_id}, headers=patient_headers)
+    sync_client.post(f"/api/conversations/{conversation['id']}/messages", json={"content": "hi"}, headers=patient_headers)
+
+    etag = sync_client.get("/api/conversations", headers=doctor_headers).headers["etag"]
+    assert sync_client.get("/api/conversations", headers={**doctor_headers, "If-None-Match": etag}).status_code == 304
+    # Same data, different caller
+    assert sync_client.get("/api/conversations", headers={**patient_headers, "If-None-Match": etag}).status_code == 200
+
+    sync_client.post(f"/api/conversations/{conversation['id']}/read", headers=doctor_headers)
+    response = sync_client.get("/api/conversations", headers={**doctor_headers, "If-None-Match": etag})
+    assert response.status_code == 200 and response.json()[0]["doctor_unread_count"] == 0
+
+
+def test_async_conditional_get(async_client, patient):
+    headers, _, conversation_id = patient
+    url = f"/api/conversations/{conversation_id}"
+    etag = async_client.get(url, headers=headers).headers["etag"]
+    with count_queries(async_engine.sync_engine) as statements:
+        response = async_client.get(url, headers={**headers, "If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304
+    assert summarize(statements) == ["SELECT conversations"]
@@ -0,0 +1,126 @@
+"""
+Conversation WebSocket: access rules, presence, typing and fan-out of committed rows.
+Run with: python -m pytest test_realtime.py
+"""
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from source.app import app
+from source.database import models, operations
+from source.realtime import Broker, LocalBroker, load_broker, realtime_hub
+
+
+def receive(socket, event_type):
+    """Next event of the given type, skipping others (e.g. presence updates)"""
+    while True:
+        event = socket.receive_json()
+        if event["type"] == event_type:
+            return event
+
+
+@pytest.fixture(scope="module")
+def client():
+    # Entering the client runs the lifespan, which starts the hub
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope="module")
+def conversation(client, register):
+    patient = register(client, "realtime-patient@example.com")
+    doctor = register(client, "realtime-doctor@example.com", role="doctor")
+    headers = patient.headers
+    conversation_id = client.post("/api/conversations", json={"title": "Live"}, headers=headers).json()["id"]
+    client.put(f"/api/conversations/{conversation_id}/assign-doctor", json={"doctor_id": doctor.id}, headers=headers)
+    return {
+        "id": conversation_id, "headers": headers,
+        "patient": (patient.token, patient.id), "doctor": (doctor.token, doctor.id),
+    }
+
+
+def test_rejects_bad_token_and_other_users(client, conversation, register):
+    url = f"/api/conversations/{conversation['id']}/ws"
+    with client.websocket_connect(f"{url}?token=not-a-token") as socket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            socket.receive_json()
+    assert closed.value.code == 4401
+
+    other_token = register(client, "realtime-other@example.com").token
+    with client.websocket_connect(f"{url}?token={other_token}") as socket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            socket.receive_json()
+    assert closed.value.code == 4403
+
+    patient_token, _ = conversation["patient"]
+    with client.websocket_connect(f"/api/conversations/missing/ws?token={patient_token}") as socket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            socket.receive_json()
+    assert closed.value.code == 4404
+
+
+def test_presence_typing_and_new_rows(client, conversation):
+    url = f"/api/conversations/{conversation['id']}/ws"
+    patient_token, patient_id = conversation["patient"]
+    doctor_token, doctor_id = conversation["doctor"]
+
+    with client.websocket_connect(f"{url}?token={patient_token}") as patient_socket:
+        assert receive(patient_socket, "presence")["online"] == [patient_id]
+
+        with client.websocket_connect(f"{url}?token={doctor_token}") as doctor_socket:
+            assert receive(doctor_socket, "presence")["online"] == sorted([patient_id, doctor_id])
+            assert receive(patient_socket, "presence")["online"] == sorted([patient_id, doctor_id])
+
+            doctor_socket.send_json({"type": "typing", "typing": True})
+            typing = receive(patient_socket, "typing")
+            assert (typing["user_id"], typing["typing"]) == (doctor_id, True)
+
+            response = client.post(
+                f"/api/conversations/{conversation['id']}/messages", json={"content": "hello"}, headers=conversation["headers"]
+            )
+            for socket in (patient_socket, doctor_socket):
+                assert receive(socket, "message")["message"] == response.json()
+
+            db = models.SessionLocal()
+            try:
+                prediagnosis = operations.create_prediagnosis(
+                    db, conversation["id"], patient_id, doctor_id, "cold", "rest"
+                )
+            finally:
+                db.close()
+            event = receive(doctor_socket, "prediagnosis")
+            assert event["prediagnosis"]["id"] == prediagnosis.id
+            assert event["prediagnosis"]["support_messages"] == ""
+
+        assert receive(patient_socket, "presence")["online"] == [patient_id]
+
+    assert realtime_hub.snapshot()["connections"] == 0
+
+
+def test_rolled_back_rows_are_not_sent(client, conversation):
+    url = f"/api/conversations/{conversation['id']}/ws"
+    patient_token, patient_id = conversation["patient"]
+    with client.websocket_connect(f"{url}?token={patient_token}") as socket:
+        receive(socket, "presence")
+        db = models.SessionLocal()
+        try:
+            db.add(models.Message(conversation_id=conversation["id"], sender_id=patient_id,
+                                  role=models.MessageRole.USER, content="discarded"))
+            db.flush()
+            db.rollback()
+        finally:
+            db.close()
+
+        batch = {"messages": [{"role": "user", "content": "kept"}]}
+        client.post(f"/api/conversations/{conversation['id']}/messages:batch", json=batch, headers=conversation["headers"])
+        assert receive(socket, "message")["message"]["content"] == "kept"
+
+
+def test_brokers_must_implement_start_and_publish():
+    class PublishOnly(Broker):
+        async def publish(self, channel, event):
+            pass
+
+    with pytest.raises(TypeError):
+        PublishOnly()
+    assert isinstance(load_broker(""), LocalBroker)
@@ -0,0 +1,95 @@
+"""
+GET /api/search on a scratch SQLite database: matching, access rules and index sync.
+Run with: python -m pytest test_search.py
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from source.app import app
+from source.database import models, operations
+
+
+def search(client, headers, q, **params):
+    response = client.get("/api/search", params={"q": q, **params}, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture(scope="module")
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def conversation(client, register):
+    patient = register(client, "search-patient@example.com")
+    doctor = register(client, "search-doctor@example.com", role="doctor")
+    patient_headers, patient_id, doctor_headers, doctor_id = patient.headers, patient.id, doctor.headers, doctor.id
+    conversation_id = client.post("/api/conversations", json={"title": "Headaches"}, headers=patient_headers).json()["id"]
+    client.put(f"/api/conversations/{conversation_id}/assign-doctor", json={"doctor_id": doctor_id}, headers=patient_headers)
+
+    url = f"/api/conversations/{conversation_id}/messages"
+    client.post(f"{url}:batch", headers=patient_headers, json={"messages": [
+        {"content": "I have had headaches for two weeks"},
+        {"content": "Ibuprofen doesn't help much"},
+    ]})
+    client.post(url, json={"content": "Take ibuprofen with food"}, headers=doctor_headers)
+    db = models.SessionLocal()
+    try:
+        prediagnosis = operations.create_prediagnosis(
+            db, conversation_id, patient_id, doctor_id, "Tension headache", "Rest", "Ibuprofen as needed"
+        )
+    finally:
+        db.close()
+    return {
+        "id": conversation_id, "prediagnosis_id": prediagnosis.id,
+        "patient": patient_headers, "doctor": doctor_headers, "doctor_id": doctor_id,
+    }
+
+
+def test_finds_messages_and_prediagnoses_with_highlights(client, conversation):
+    results = search(client, conversation["patient"], "ibuprofen")["results"]
+    assert sorted(result["kind"] for result in results) == ["message", "message", "prediagnosis"]
+    assert all("**" in result["snippet"] and result["conversation_title"] == "Headaches" for result in results)
+
+    # Stemming, and every word must match
+    assert len(search(client, conversation["doctor"], "headache")["results"]) == 2
+    assert len(search(client, conversation["doctor"], "headache ibuprofen")["results"]) == 1
+
+
+def test_query_syntax_is_literal(client, conversation):
+    assert search(client, conversation["patient"], 'ibuprofen" OR (')["results"] == []
+    assert search(client, conversation["patient"], "***") == {"results": [], "next_page": None}
+
+
+def test_pagination(client, conversation):
+    first = search(client, conversation["patient"], "ibuprofen", page_size=2)
+    second = search(client, conversation["patient"], "ibuprofen", page=first["next_page"], page_size=2)
+    assert (len(first["results"]), first["next_page"]) == (2, 2)
+    assert (len(second["results"]), second["next_page"]) == (1, None)
+
+
+def test_access_rules_follow_the_conversation(client, conversation, register):
+    other_headers = register(client, "search-other@example.com").headers
+    other_doctor = register(client, "search-other-doctor@example.com", role="doctor")
+    other_doctor_headers, other_doctor_id = other_doctor.headers, other_doctor.id
+    assert search(client, other_headers, "ibuprofen")["results"] == []
+    assert search(client, other_doctor_headers, "ibuprofen")["results"] == []
+
+    # Reassigning the conversation moves its rows to the new doctor's results
+    client.put(f"/api/conversations/{conversation['id']}/assign-doctor",
+               json={"doctor_id": other_doctor_id}, headers=conversation["patient"])
+    assert len(search(client, other_doctor_headers, "ibuprofen")["results"]) == 3
+    assert search(client, conversation["doctor"], "ibuprofen")["results"] == []
+    client.put(f"/api/conversations/{conversation['id']}/assign-doctor",
+               json={"doctor_id": conversation["doctor_id"]}, headers=conversation["patient"])
+
+
+def test_updates_are_reindexed(client, conversation):
+    db = models.SessionLocal()
+    try:
+        operations.update_prediagnosis(db, conversation["prediagnosis_id"], course_of_action="See a neurologist")
+    finally:
+        db.close()
+    assert [r["kind"] for r in search(client, conversation["doctor"], "neurologist")["results"]] == ["prediagnosis"]
+    assert search(client, conversation["doctor"], "rest")["results"] == []
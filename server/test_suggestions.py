@@ -1,4 +1,4 @@
-from source.ml_models.suggestions import generate_prediagnosis
+from source.ml_models.engines import generate_prediagnosis
 import json
 
 # Sample patient data for testing
@@ -0,0 +1,88 @@
+"""
+Symptom vocabulary: normalization, the autocomplete trie, and what reaches the prompt and the cache key.
+Run with: python -m pytest test_vocabulary.py
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from source.app import app
+from source.ml_models import cache
+from source.ml_models.cache import make_cache_key
+from source.ml_models.vocabulary import SymptomVocabulary, clean_symptom, symptom_vocabulary
+
+AI_RESULT = {
+    "potential_diseases": "common cold",
+    "course_of_action": "rest",
+    "support_messages": "ok",
+    "recommended_practitioners": "GP",
+}
+
+
+def test_normalize_spelling_spacing_and_plurals():
+    assert clean_symptom("  Head-ACHE!! ") == "head ache"
+    for text in ("Headache", "head ache", "headaches", "HEAD  ACHE", "head pain"):
+        assert symptom_vocabulary.normalize(text) == "headache"
+    assert symptom_vocabulary.normalize("Stomach ache") == "abdominal pain"
+    # Unknown symptoms pass through cleaned
+    assert symptom_vocabulary.normalize("Purple Toes") == "purple toes"
+
+
+@pytest.mark.parametrize("detail, general", [
+    ("night sweats", "sweating"),
+    ("unexplained weight loss", "weight loss"),
+    ("vertigo", "dizziness"),
+    ("syncope", "fainting"),
+    ("chest tightness", "chest pain"),
+    ("hives", "rash"),
+    ("temperature", "fever"),
+])
+def test_clinically_distinct_symptoms_are_not_merged(detail, general):
+    assert symptom_vocabulary.normalize(detail) != general
+
+
+def test_dedupe_keeps_the_patients_wording():
+    assert symptom_vocabulary.dedupe(["Head  ache", "headaches", " ", "Night sweats"]) == ["Head ache", "Night sweats"]
+    assert symptom_vocabulary.normalize_all(["Head  ache", "headaches", " ", "Night sweats"]) == ["headache", "night sweats"]
+
+
+def test_suggest_walks_the_trie():
+    vocabulary = SymptomVocabulary([
+        {"name": "headache", "synonyms": ["head pain"]},
+        {"name": "heartburn"},
+        {"name": "fever", "synonyms": ["high temperature"]},
+    ])
+    assert vocabulary.suggest("hea") == ["headache", "heartburn"]
+    assert vocabulary.suggest("head p") == ["headache"]
+    assert vocabulary.suggest("HIGH") == ["fever"]
+    assert vocabulary.suggest("hea", limit=1) == ["headache"]
+    assert vocabulary.suggest("x") == [] and vocabulary.suggest("") == []
+
+
+def test_cache_key_uses_canonical_names():
+    history = {"allergies": ["penicillin"]}
+    assert make_cache_key(["Headache", "fever"], history) == make_cache_key(["feverish", "head ache"], history)
+    assert make_cache_key(["vertigo"]) != make_cache_key(["dizziness"])
+    assert make_cache_key(["headache"], history) != make_cache_key(["headache"])
+
+
+def test_prompt_gets_original_wording_and_title_canonical_names(register, monkeypatch):
+    client = TestClient(app)
+    patient = register(client, "vocabulary-patient@example.com")
+    prompts = []
+
+    async def predict_remote(patient_data, medical_history=None):
+        prompts.append(patient_data["symptoms"])
+        return AI_RESULT
+
+    monkeypatch.setattr(cache.prediagnosis_engine, "predict_remote", predict_remote)
+    response = client.post(
+        "/api/prediagnosis", json={"symptoms": ["Night sweats", "head ache", "Headaches"]}, headers=patient.headers
+    )
+
+    assert response.status_code == 200
+    assert prompts == [["Night sweats", "head ache"]]
+    conversation = client.get(f"/api/conversations/{response.json()['conversation_id']}", headers=patient.headers)
+    assert conversation.json()["title"] == "Symptoms: night sweats, headache"
+
+    response = client.post("/api/prediagnosis", json={"symptoms": [" ", ""]}, headers=patient.headers)
+    assert response.status_code == 422